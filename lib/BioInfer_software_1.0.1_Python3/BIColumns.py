@@ -0,0 +1,339 @@
+# BioInfer supporting software tools
+# Copyright (C) 2006 University of Turku
+#
+# This is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this software in the file COPYING. If not, see
+# http://www.gnu.org/licenses/lgpl.html
+
+"""
+Columnar export of the BioInfer corpus.
+
+L{exportColumns} flattens a parsed L{BioInfer<BasicClasses.BioInfer>} into tables.
+A table is a dictionary from column names to columns of equal length, where
+a column is either a NumPy array or a L{StringColumn}. All objects are referred
+to by their integer row index in their table, counted over the whole corpus,
+and C{-1} stands for a missing reference. The tables are:
+
+  - C{sentences}: C{id}, C{origText}, and the C{[start, stop)} row ranges of the
+    tokens, subtokens, entities, formulas and links of each sentence.
+  - C{tokens}: C{sentence}, C{id}, C{charOffset} and the row range of the subtokens.
+  - C{subtokens}: C{sentence}, C{token}, C{id}, C{text}, C{charOffset}.
+  - C{entities}: C{sentence}, C{id}, C{type} (row of C{entityTypes}) and the row range
+    of the entity in C{entitySubtokens}.
+  - C{entitySubtokens}: C{entity}, C{subtoken}; the subtokens of each entity in order.
+  - C{formulas}: C{sentence}, C{rootNode}.
+  - C{formulaNodes}: the nodes of each formula in preorder, with C{formula}, C{parent},
+    C{position} (argument position in the parent), C{depth}, C{predicate} (row of
+    C{predicates}, -1 for entity nodes) and C{entity}.
+  - C{links}: C{sentence}, C{linkage} (row of C{linkageTypes}), C{token1}, C{token2},
+    C{type} (row of C{linkTypes}) and C{macro}.
+  - C{entityTypes}, C{predicates}, C{linkageTypes}, C{linkTypes}: C{name}. The rows of the
+    entity types and predicates are their ids in the ontologies.
+
+L{saveColumns} writes the tables as C{.npy} files, which L{loadColumns} memory-maps,
+and L{saveArrow} as Arrow IPC files if pyarrow is installed. L{loadColumnsCached}
+exports the tables of a corpus once and memory-maps them afterwards: the arrays are
+used directly from the mapping, so all the processes loading them share the same pages.
+"""
+
+import os
+import sys
+from optparse import OptionParser,OptionGroup
+
+import numpy
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow=None
+
+from BIParser import FastBIParser
+
+INDEX=numpy.int32
+OFFSET=numpy.int64
+"""The dtypes of the integer columns and of the offsets of the string columns."""
+
+class StringColumn (object):
+    """
+    A column of strings stored as one utf-8 buffer and an offset array: the string in
+    row C{i} is C{data[offsets[i]:offsets[i+1]]}.
+
+    @ivar data: The utf-8 bytes of all strings.
+    @type data: numpy array of uint8
+    @ivar offsets: The start offsets of the strings in C{data}, followed by the length of C{data}.
+    @type offsets: numpy array of int64
+    """
+
+    def __init__(self,data,offsets):
+        self.data=data
+        self.offsets=offsets
+
+    @classmethod
+    def fromStrings(cls,strings):
+        """
+        Builds a column of the strings in the sequence C{strings}.
+        """
+        encoded=[s.encode("utf-8") for s in strings]
+        offsets=numpy.zeros(len(encoded)+1,dtype=OFFSET)
+        numpy.cumsum([len(b) for b in encoded],out=offsets[1:])
+        return cls(numpy.frombuffer(b"".join(encoded),dtype=numpy.uint8),offsets)
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self,i):
+        return self.data[self.offsets[i]:self.offsets[i+1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class ColumnBuilder (object):
+    """
+    Collects the rows of one table column by column.
+    """
+
+    def __init__(self,**dtypes):
+        """
+        @param dtypes: The type of each column, either C{str} for a L{StringColumn} or a NumPy dtype.
+        """
+        self.dtypes=dtypes
+        self.columns=dict((c,[]) for c in dtypes)
+
+    def append(self,**row):
+        for k,v in row.items():
+            self.columns[k].append(v)
+
+    def __len__(self):
+        for c in self.columns.values():
+            return len(c)
+        return 0
+
+    def build(self):
+        """
+        Returns the table.
+        """
+        table={}
+        for k,v in self.columns.items():
+            if self.dtypes[k] is str:
+                table[k]=StringColumn.fromStrings(v)
+            else:
+                table[k]=numpy.array(v,dtype=self.dtypes[k])
+        return table
+
+def exportColumns(bioinfer):
+    """
+    Flattens the corpus into the tables described in the module documentation.
+
+    @param bioinfer: A parsed corpus.
+    @type bioinfer: L{BioInfer<BasicClasses.BioInfer>}
+    @return: A dictionary from table names to tables.
+    """
+    entityTypeNames=bioinfer.ontologies["Entity"].getPredicateNames()
+    predicateNames=bioinfer.ontologies["Relationship"].getPredicateNames()
+    linkageTypeIds={}
+    linkTypeIds={}
+
+    sentences=ColumnBuilder(id=str,origText=str,tokenStart=INDEX,tokenStop=INDEX,subtokenStart=INDEX,subtokenStop=INDEX,
+                            entityStart=INDEX,entityStop=INDEX,formulaStart=INDEX,formulaStop=INDEX,linkStart=INDEX,linkStop=INDEX)
+    tokens=ColumnBuilder(sentence=INDEX,id=str,charOffset=INDEX,subtokenStart=INDEX,subtokenStop=INDEX)
+    subtokens=ColumnBuilder(sentence=INDEX,token=INDEX,id=str,text=str,charOffset=INDEX)
+    entities=ColumnBuilder(sentence=INDEX,id=str,type=INDEX,subtokenStart=INDEX,subtokenStop=INDEX)
+    entitySubtokens=ColumnBuilder(entity=INDEX,subtoken=INDEX)
+    formulas=ColumnBuilder(sentence=INDEX,rootNode=INDEX)
+    formulaNodes=ColumnBuilder(formula=INDEX,parent=INDEX,position=INDEX,depth=INDEX,predicate=INDEX,entity=INDEX)
+    links=ColumnBuilder(sentence=INDEX,linkage=INDEX,token1=INDEX,token2=INDEX,type=INDEX,macro=numpy.bool_)
+
+    for sIdx,sentence in enumerate(bioinfer.sentences.sentences):
+        # rows of the objects of this sentence, by object identity
+        subtokenRows={}
+        tokenStart,subtokenStart=len(tokens),len(subtokens)
+        subTokenOffsets=sentence.getOffsetTables()[1]
+        for t in sentence.tokens:
+            tIdx=len(tokens)
+            tokens.append(sentence=sIdx,id=t.id,charOffset=int(t.charOffset),
+                          subtokenStart=len(subtokens),subtokenStop=len(subtokens)+len(t.subTokens))
+            for st in t.subTokens:
+                subtokenRows[id(st)]=len(subtokens)
+                subtokens.append(sentence=sIdx,token=tIdx,id=st.id,text=st.text,charOffset=subTokenOffsets[st.sequence])
+        entityStart=len(entities)
+        for e in sentence.entities:
+            eIdx=len(entities)
+            entities.append(sentence=sIdx,id=e.id,type=e.typeId,
+                            subtokenStart=len(entitySubtokens),subtokenStop=len(entitySubtokens)+len(e.subTokens))
+            for st in e.subTokens:
+                entitySubtokens.append(entity=eIdx,subtoken=subtokenRows[id(st)])
+        formulaStart=len(formulas)
+        for f in sentence.formulas:
+            fIdx=len(formulas)
+            formulas.append(sentence=sIdx,rootNode=len(formulaNodes))
+            rootRow=len(formulaNodes)
+            for node,parent,depth,predicate,entity in zip(f.nodes,f.parents,f.depths,f.predicateIds,f.entityIndices):
+                formulaNodes.append(formula=fIdx,parent=rootRow+parent if parent>=0 else -1,
+                                    position=node.myArgumentPosition if parent>=0 else -1,depth=depth,
+                                    predicate=predicate,entity=entityStart+entity if entity>=0 else -1)
+        linkStart=len(links)
+        for linkageType,linkage in sentence.linkages.items():
+            lType=linkageTypeIds.setdefault(linkageType,len(linkageTypeIds))
+            typeRows=[linkTypeIds.setdefault(t,len(linkTypeIds)) for t in linkage.getLinkTypes()]
+            for t1,t2,typeId,macro in zip(linkage.token1s,linkage.token2s,linkage.typeIds,linkage.macros):
+                links.append(sentence=sIdx,linkage=lType,token1=tokenStart+t1,token2=tokenStart+t2,
+                             type=typeRows[typeId],macro=macro)
+        sentences.append(id=sentence.id,origText=sentence.origText,
+                         tokenStart=tokenStart,tokenStop=len(tokens),
+                         subtokenStart=subtokenStart,subtokenStop=len(subtokens),
+                         entityStart=entityStart,entityStop=len(entities),
+                         formulaStart=formulaStart,formulaStop=len(formulas),
+                         linkStart=linkStart,linkStop=len(links))
+
+    return {"sentences":sentences.build(),
+            "tokens":tokens.build(),
+            "subtokens":subtokens.build(),
+            "entities":entities.build(),
+            "entitySubtokens":entitySubtokens.build(),
+            "formulas":formulas.build(),
+            "formulaNodes":formulaNodes.build(),
+            "links":links.build(),
+            "entityTypes":{"name":StringColumn.fromStrings(entityTypeNames)},
+            "predicates":{"name":StringColumn.fromStrings(predicateNames)},
+            "linkageTypes":{"name":StringColumn.fromStrings(list(linkageTypeIds))},
+            "linkTypes":{"name":StringColumn.fromStrings(list(linkTypeIds))},
+            }
+
+def saveColumns(tables,directory):
+    """
+    Saves the tables into C{directory}, one C{TABLE.COLUMN.npy} file per array column and the
+    two files C{TABLE.COLUMN.data.npy} and C{TABLE.COLUMN.offsets.npy} per string column.
+    """
+    os.makedirs(directory,exist_ok=True)
+    for tableName,table in tables.items():
+        for columnName,column in table.items():
+            base=os.path.join(directory,"%s.%s"%(tableName,columnName))
+            if isinstance(column,StringColumn):
+                numpy.save(base+".data.npy",column.data)
+                numpy.save(base+".offsets.npy",column.offsets)
+            else:
+                numpy.save(base+".npy",column)
+
+def loadColumns(directory,mmap=True):
+    """
+    Loads the tables saved by L{saveColumns}.
+
+    @param mmap: If true, the arrays are memory-mapped read-only instead of read into memory.
+    @type mmap: bool
+    @return: A dictionary from table names to tables.
+    """
+    mode="r" if mmap else None
+    tables={}
+    for fileName in sorted(os.listdir(directory)):
+        if not fileName.endswith(".npy"):
+            continue
+        parts=fileName[:-len(".npy")].split(".")
+        if parts[-1]=="offsets":
+            continue
+        table=tables.setdefault(parts[0],{})
+        path=os.path.join(directory,fileName)
+        if parts[-1]=="data":
+            offsets=numpy.load(path[:-len("data.npy")]+"offsets.npy",mmap_mode=mode)
+            table[parts[1]]=StringColumn(numpy.load(path,mmap_mode=mode),offsets)
+        else:
+            table[parts[1]]=numpy.load(path,mmap_mode=mode)
+    return tables
+
+COMPLETE_STAMP="COMPLETE"
+"""The file written into a column directory once all the tables are saved."""
+
+def loadColumnsCached(xmlFileName,directory=None):
+    """
+    Returns the tables of C{xmlFileName}, memory-mapped from C{directory}. The tables are
+    exported first if they are missing or older than the XML file.
+
+    Loading takes milliseconds and nothing is copied, so unlike loading a
+    L{snapshot<BISnapshot>}, which builds the object graph of the corpus in every process,
+    the training and inference processes on one host share the pages of the tables.
+
+    @param directory: The directory of the tables. Defaults to C{xmlFileName+".columns"}.
+    @return: A dictionary from table names to tables, see L{loadColumns}.
+    """
+    if directory is None:
+        directory=xmlFileName+".columns"
+    stamp=os.path.join(directory,COMPLETE_STAMP)
+    if not os.path.exists(stamp) or os.path.getmtime(stamp)<os.path.getmtime(xmlFileName):
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        parser=FastBIParser()
+        parser.parse(xmlFileName)
+        saveColumns(exportColumns(parser.bioinfer),directory)
+        open(stamp,"w").close()
+    return loadColumns(directory)
+
+def toArrow(table):
+    """
+    Returns the table as a C{pyarrow.Table}. The string columns share their buffers with the L{StringColumn}s.
+    """
+    if pyarrow is None:
+        raise ValueError("The Arrow export requires the pyarrow package")
+    arrays=[]
+    for column in table.values():
+        if isinstance(column,StringColumn):
+            arrays.append(pyarrow.LargeStringArray.from_buffers(len(column),pyarrow.py_buffer(column.offsets),pyarrow.py_buffer(column.data)))
+        else:
+            arrays.append(pyarrow.array(column))
+    return pyarrow.Table.from_arrays(arrays,names=list(table))
+
+def saveArrow(tables,directory):
+    """
+    Saves each table into the Arrow IPC file C{TABLE.arrow} in C{directory}.
+    """
+    os.makedirs(directory,exist_ok=True)
+    for tableName,table in tables.items():
+        arrowTable=toArrow(table)
+        with pyarrow.OSFile(os.path.join(directory,tableName+".arrow"),"wb") as sink:
+            with pyarrow.ipc.new_file(sink,arrowTable.schema) as writer:
+                writer.write_table(arrowTable)
+
+if __name__=="__main__":
+    usage="\n\n%prog -h or --help\n%prog [OPTIONS]\n\nExports the BioInfer corpus into columnar tables of integer ids and offsets."
+    optionParser=OptionParser(usage)
+
+    group1=OptionGroup(optionParser,"*** Standard usage options ***")
+    group1.add_option("-b","--bioInferFile",action="store",dest="bioinferXmlFile",metavar="FILENAME",default=None,help="The XML file holding the BioInfer corpus. This parameter is compulsory.")
+    group1.add_option("-o","--output",action="store",dest="outputDir",metavar="DIRECTORY",default=None,help="The directory to write the tables into. This parameter is compulsory.")
+    group1.add_option("-f","--format",action="store",dest="format",default="npy",help="npy (the default) or arrow.")
+    optionParser.add_option_group(group1)
+
+    options,args=optionParser.parse_args()
+
+    if not options.bioinferXmlFile or not options.outputDir:
+        print("You must specify the --bioInferFile (-b) and --output (-o) options.", file=sys.stderr)
+        optionParser.print_help()
+        sys.exit(-1)
+    if options.format not in ("npy","arrow"):
+        print("Unknown format '%s'."%options.format, file=sys.stderr)
+        sys.exit(-1)
+    if options.format=="arrow" and pyarrow is None:
+        print("The arrow format requires the pyarrow package.", file=sys.stderr)
+        sys.exit(1)
+
+    parser=FastBIParser()
+    try:
+        parser.parse(options.bioinferXmlFile)
+    except IOError as e:
+        print("Failed to open '%s': %s" % (e.filename, e.strerror))
+        sys.exit(1)
+
+    tables=exportColumns(parser.bioinfer)
+    if options.format=="arrow":
+        saveArrow(tables,options.outputDir)
+    else:
+        saveColumns(tables,options.outputDir)
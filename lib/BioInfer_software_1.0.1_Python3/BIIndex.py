@@ -0,0 +1,315 @@
+# BioInfer supporting software tools
+# Copyright (C) 2006 University of Turku
+#
+# This is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this software in the file COPYING. If not, see
+# http://www.gnu.org/licenses/lgpl.html
+
+"""
+An inverted index of the BioInfer corpus for structured queries.
+
+The index maps predicates to the formula nodes using them, entity types to
+entities, argument signatures to formula nodes and nesting depths to formulas.
+It also records the byte range of every sentence in the XML file, so that the
+sentences matching a query can be parsed without parsing the rest of the corpus.
+The index is kept in a pickle file next to the corpus, see L{loadIndex}.
+
+Formula nodes are identified by (sentence, formula, node) triples, where
+C{sentence} is the position of the sentence in the corpus, C{formula} the
+position of the formula in L{Sentence.formulas<BasicClasses.Sentence>} and
+C{node} the position of the node in the preorder traversal of the formula.
+Entities are identified by (sentence, entity) pairs, C{entity} being the
+position in L{Sentence.entities<BasicClasses.Sentence>}.
+
+The signature of a relationship node is the pair of its predicate name and the
+sorted tuple of the labels of its arguments: the entity type name for entity
+arguments and the predicate name for nested relationships. The depth of a
+formula is the largest number of relationship nodes on a path from its root,
+so that a relationship of entities has depth 1.
+"""
+
+import os
+import pickle
+import sys
+from optparse import OptionParser,OptionGroup
+
+from BIParser import FastBIParser,ExpatFeeder
+
+def argumentLabel(node):
+    """
+    Returns the label of the formula node C{node} in the signature of its parent.
+    """
+    if node.isEntity():
+        if node.entity is None or getattr(node.entity,"type",None) is None:
+            return "?"
+        return node.entity.type.name
+    return node.predicate.name
+
+def formulaDepth(node):
+    """
+    Returns the depth of the formula tree rooted in C{node}.
+    """
+    if node.isEntity():
+        return 0
+    return 1+max([formulaDepth(a) for a in node.arguments] or [0])
+
+class CorpusIndex (object):
+    """
+    The inverted index of one corpus XML file.
+
+    @ivar xmlStat: The (size, modification time) of the indexed XML file.
+    @ivar headerEnd: The byte offset just past the I{sentences} open tag.
+    @ivar sentenceIds: The ids of the sentences, in the corpus order.
+    @ivar sentenceRanges: The (start, end) byte offsets of the I{sentence} elements.
+    @ivar predicates: Dictionary from predicate names to lists of formula nodes.
+    @ivar entityTypes: Dictionary from entity type names to lists of entities.
+    @ivar signatures: Dictionary from signatures to lists of formula nodes.
+    @ivar depths: Dictionary from formula depths to lists of (sentence, formula) pairs.
+    """
+
+    def __init__(self):
+        self.xmlStat=None
+        self.headerEnd=0
+        self.sentenceIds=[]
+        self.sentenceRanges=[]
+        self.predicates={}
+        self.entityTypes={}
+        self.signatures={}
+        self.depths={}
+
+    def addSentence(self,sentence,start,end):
+        """
+        Indexes C{sentence}, which spans the bytes from C{start} to C{end} of the XML file.
+        """
+        sIdx=len(self.sentenceIds)
+        self.sentenceIds.append(sentence.id)
+        self.sentenceRanges.append((start,end))
+        for eIdx,e in enumerate(sentence.entities):
+            if getattr(e,"type",None) is not None:
+                self.entityTypes.setdefault(e.type.name,[]).append((sIdx,eIdx))
+        for fIdx,f in enumerate(sentence.formulas):
+            self.depths.setdefault(f.getDepth(),[]).append((sIdx,fIdx))
+            for nIdx,node in enumerate(f.nodes):
+                if node.isPredicate():
+                    self.predicates.setdefault(node.predicate.name,[]).append((sIdx,fIdx,nIdx))
+                    signature=(node.predicate.name,tuple(sorted(argumentLabel(a) for a in node.arguments)))
+                    self.signatures.setdefault(signature,[]).append((sIdx,fIdx,nIdx))
+
+    def matchSignatures(self,predicate,arguments):
+        """
+        Returns the formula nodes with the predicate C{predicate} whose argument labels include
+        all labels in C{arguments} (with their multiplicity).
+        """
+        wanted={}
+        for a in arguments:
+            wanted[a]=wanted.get(a,0)+1
+        nodes=[]
+        for (p,labels),postings in self.signatures.items():
+            if p==predicate and all(labels.count(a)>=n for a,n in wanted.items()):
+                nodes.extend(postings)
+        return nodes
+
+    def query(self,predicate=None,arguments=(),entityTypes=(),depth=None):
+        """
+        Returns the positions of the sentences satisfying all given conditions, in the corpus order.
+
+        @param predicate: The sentence has a relationship with this predicate.
+        @param arguments: Together with C{predicate}: the relationship has arguments with these
+        labels (entity type names or predicate names), and possibly others.
+        @param entityTypes: The sentence has entities of all of these types.
+        @param depth: The sentence has a formula of this depth.
+        @rtype: list of integers
+        """
+        matches=None
+        def restrict(postings):
+            found=set(p[0] for p in postings)
+            return found if matches is None else matches&found
+        if predicate is not None:
+            if arguments:
+                matches=restrict(self.matchSignatures(predicate,arguments))
+            else:
+                matches=restrict(self.predicates.get(predicate,()))
+        for t in entityTypes:
+            matches=restrict(self.entityTypes.get(t,()))
+        if depth is not None:
+            matches=restrict(self.depths.get(depth,()))
+        if matches is None:
+            return list(range(len(self.sentenceIds)))
+        return sorted(matches)
+
+    def iterSentences(self,xmlFileName,sentenceIdxs,**args):
+        """
+        Parses only the given sentences of the indexed XML file.
+
+        @param sentenceIdxs: Positions of sentences, as returned by L{query}.
+        @param args: Passed to the parser, see L{BIParser<BIParser.BIParser>}.
+        @return: An iterator of (sentence, ontologies) pairs, as L{BIParser.iterparse<BIParser.BIParser.iterparse>}.
+        """
+        parser=FastBIParser(**args)
+        feeder=parser.createIncrementalParser()
+        parser.finishedSentences=[]
+        try:
+            with open(xmlFileName,"rb") as f:
+                feeder.feed(f.read(self.headerEnd))
+                for i in sentenceIdxs:
+                    start,end=self.sentenceRanges[i]
+                    f.seek(start)
+                    feeder.feed(f.read(end-start))
+                    while parser.finishedSentences:
+                        sentence=parser.finishedSentences.pop(0)
+                        yield sentence,parser.bioinfer.ontologies
+                        parser.bioinfer.sentences.removeSentence(sentence)
+        finally:
+            parser.finishedSentences=None
+
+class IndexBuilder (FastBIParser):
+    """
+    A parser recording the byte ranges of the sentences while parsing, used by L{buildIndex}.
+
+    @ivar sentencePositions: The (start, end) byte offsets of the I{sentence} open tags and end
+    handler calls of the sentences parsed but not yet consumed, in the corpus order.
+    """
+
+    def __init__(self,**args):
+        FastBIParser.__init__(self,**args)
+        self.feeder=None
+        self.sentencesOpen=None
+        self.sentenceStart=None
+        self.sentencePositions=[]
+
+    def createIncrementalParser(self):
+        self.feeder=FastBIParser.createIncrementalParser(self)
+        return self.feeder
+
+    def startElement(self,name,attrs):
+        if name=="sentence":
+            self.sentenceStart=self.feeder.parser.CurrentByteIndex
+        elif name=="sentences":
+            self.sentencesOpen=self.feeder.parser.CurrentByteIndex
+        FastBIParser.startElement(self,name,attrs)
+
+    def endElement(self,name):
+        if name=="sentence":
+            self.sentencePositions.append((self.sentenceStart,self.feeder.parser.CurrentByteIndex))
+        FastBIParser.endElement(self,name)
+
+def tagEnd(f,offset):
+    """
+    Returns the offset just past the first C{>} at or after C{offset} in the binary file C{f}.
+    """
+    f.seek(offset)
+    data=b""
+    while b">" not in data:
+        chunk=f.read(256)
+        if not chunk:
+            raise ValueError("Unterminated tag at byte %d"%offset)
+        data+=chunk
+    return offset+data.index(b">")+1
+
+def buildIndex(xmlFileName):
+    """
+    Parses C{xmlFileName} sentence by sentence and returns its L{CorpusIndex}.
+    """
+    index=CorpusIndex()
+    st=os.stat(xmlFileName)
+    index.xmlStat=(st.st_size,st.st_mtime)
+    builder=IndexBuilder()
+    with open(xmlFileName,"rb") as xml, open(xmlFileName,"rb") as f:
+        for sentence,ontologies in builder.iterparse(xml,dropSentences=True):
+            # the end handler is called at the close tag, or at the open tag of an empty sentence
+            start,end=builder.sentencePositions.pop(0)
+            index.addSentence(sentence,start,tagEnd(f,end))
+        if builder.sentencesOpen is not None:
+            index.headerEnd=tagEnd(f,builder.sentencesOpen)
+    return index
+
+def scanIndex(xmlFileName):
+    """
+    Returns a L{CorpusIndex} of C{xmlFileName} holding only the sentence ids and byte ranges,
+    which is enough for L{CorpusIndex.iterSentences}. The file is only tokenized, no corpus
+    objects are built, so this is much faster than L{buildIndex}.
+    """
+    index=CorpusIndex()
+    st=os.stat(xmlFileName)
+    index.xmlStat=(st.st_size,st.st_mtime)
+    positions=[]
+    sentencesOpen=[]
+    def startElement(name,attrs):
+        if name=="sentence":
+            index.sentenceIds.append(attrs.get("id"))
+            positions.append(feeder.parser.CurrentByteIndex)
+        elif name=="sentences":
+            sentencesOpen.append(feeder.parser.CurrentByteIndex)
+    def endElement(name):
+        if name=="sentence":
+            positions.append(feeder.parser.CurrentByteIndex)
+    feeder=ExpatFeeder(startElement,endElement)
+    with open(xmlFileName,"rb") as xml:
+        while True:
+            data=xml.read(1048576)
+            if not data:
+                break
+            feeder.feed(data)
+        feeder.close()
+    with open(xmlFileName,"rb") as f:
+        for i in range(0,len(positions),2):
+            index.sentenceRanges.append((positions[i],tagEnd(f,positions[i+1])))
+        if sentencesOpen:
+            index.headerEnd=tagEnd(f,sentencesOpen[0])
+    return index
+
+def loadIndex(xmlFileName,indexFileName=None):
+    """
+    Returns the L{CorpusIndex} of C{xmlFileName}. The index is read from C{indexFileName}, and
+    (re)built and saved first if it is missing or does not match the current XML file.
+
+    @param indexFileName: The index file to use. Defaults to C{xmlFileName+".idx"}.
+    """
+    if indexFileName is None:
+        indexFileName=xmlFileName+".idx"
+    st=os.stat(xmlFileName)
+    if os.path.exists(indexFileName):
+        with open(indexFileName,"rb") as f:
+            index=pickle.load(f)
+        if index.xmlStat==(st.st_size,st.st_mtime):
+            return index
+    index=buildIndex(xmlFileName)
+    tmpName=indexFileName+".tmp"
+    with open(tmpName,"wb") as out:
+        pickle.dump(index,out,pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpName,indexFileName)
+    return index
+
+if __name__=="__main__":
+    usage="\n\n%prog -h or --help\n%prog [OPTIONS]\n\nBuilds the query index of the BioInfer corpus XML file, used by the\nquery options of extract.py."
+    optionParser=OptionParser(usage)
+
+    group1=OptionGroup(optionParser,"*** Standard usage options ***")
+    group1.add_option("-b","--bioInferFile",action="store",dest="bioinferXmlFile",metavar="FILENAME",default=None,help="The XML file holding the BioInfer corpus. This parameter is compulsory.")
+    group1.add_option("-o","--output",action="store",dest="indexFile",metavar="FILENAME",default=None,help="The index file to write. Defaults to the XML file name with the suffix .idx.")
+    optionParser.add_option_group(group1)
+
+    options,args=optionParser.parse_args()
+
+    if not options.bioinferXmlFile:
+        print("You must specify the --bioInferFile (-b) option.", file=sys.stderr)
+        optionParser.print_help()
+        sys.exit(-1)
+
+    try:
+        index=buildIndex(options.bioinferXmlFile)
+    except IOError as e:
+        print("Failed to open '%s': %s" % (e.filename, e.strerror))
+        sys.exit(1)
+    with open(options.indexFile or options.bioinferXmlFile+".idx","wb") as out:
+        pickle.dump(index,out,pickle.HIGHEST_PROTOCOL)
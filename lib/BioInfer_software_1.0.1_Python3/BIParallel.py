@@ -0,0 +1,283 @@
+# BioInfer supporting software tools
+# Copyright (C) 2006 University of Turku
+#
+# This is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this software in the file COPYING. If not, see
+# http://www.gnu.org/licenses/lgpl.html
+
+"""
+Parallel parsing of the BioInfer XML file.
+
+Once the ontologies have been read, every I{sentence} element of the corpus
+is independent of the others. The sentence section of the file is split into
+byte ranges ending on C{</sentence>} boundaries, and the XML of each range
+is tokenized in a separate process into the event stream representation of
+L{BISnapshot}. The streams are then either replayed in order into a single
+parser, which builds the corpus objects exactly as the serial parse does, or
+merged into one snapshot file.
+
+The corpus objects themselves are always built by the calling process, since
+transferring them between processes costs more than building them. The
+parallel part of L{parseParallel} is therefore only the XML tokenization,
+and building the objects from the replayed events takes about as long as
+the whole serial parse with L{FastBIParser<BIParser.FastBIParser>}.
+L{compileSnapshotParallel} is parallel except for the final merge, and is
+the way to make use of several cores: compile the snapshot in parallel
+once, then load it with L{SnapshotParser<BISnapshot.SnapshotParser>}.
+
+Computations which only need a small summary of the sentences, such as
+counts or vocabularies, can run entirely in the worker processes with
+L{mapSentenceShards}: every worker parses its shard into corpus objects
+itself and returns only the result of a function applied to its sentences.
+"""
+
+import array
+import io
+import mmap
+import multiprocessing
+import os
+import sys
+from optparse import OptionParser,OptionGroup
+
+from BIParser import ExpatFeeder,FastBIParser
+from BISnapshot import SnapshotWriter,SnapshotParser,ATTRS_END,ELEMENT_END,xmlStamp
+
+SHARD_ROOT=b"shard"
+
+def planShards(xmlFileName,nShards):
+    """
+    Splits the sentence section of C{xmlFileName} into at most C{nShards} byte ranges
+    of roughly equal size, each one consisting of whole I{sentence} elements.
+
+    @return: A tuple (header, tail, shards), where C{header} holds the bytes of the file up to and
+    including the I{sentences} open tag, C{tail} the bytes from the I{sentences} close tag to the end,
+    and C{shards} is a list of (start, end) byte offsets. C{None} if the file has no
+    sentence section to split.
+    """
+    with open(xmlFileName,"rb") as f:
+        if os.fstat(f.fileno()).st_size==0:
+            return None
+        mm=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        try:
+            tagStart=mm.find(b"<sentences")
+            end=mm.rfind(b"</sentences>")
+            if tagStart<0 or end<0:
+                return None
+            start=mm.find(b">",tagStart)+1
+            shards=[]
+            step=max(1,(end-start)//max(1,nShards))
+            pos=start
+            while pos<end:
+                boundary=mm.find(b"</sentence>",pos+step,end)
+                boundary=end if boundary<0 else boundary+len(b"</sentence>")
+                shards.append((pos,boundary))
+                pos=boundary
+            return mm[:start],mm[end:],shards
+        finally:
+            mm.close()
+
+def xmlDeclaration(header):
+    """
+    Returns the XML declaration at the beginning of C{header}, or an empty byte string.
+    """
+    if header.startswith(b"<?xml"):
+        return header[:header.index(b"?>")+2]
+    return b""
+
+def recordEvents(data):
+    """
+    Tokenizes the XML document C{data} into a L{SnapshotWriter}.
+    """
+    writer=SnapshotWriter()
+    parser=ExpatFeeder(writer.startElement,writer.endElement)
+    parser.feed(data)
+    parser.close()
+    return writer
+
+def parseShard(task):
+    """
+    Tokenizes the sentences of one shard. Runs in the worker processes.
+
+    @param task: A tuple (xmlFileName, declaration, start, end).
+    @return: The string table and the event stream of the sentences, the latter as bytes.
+    """
+    xmlFileName,declaration,start,end=task
+    with open(xmlFileName,"rb") as f:
+        f.seek(start)
+        data=f.read(end-start)
+    writer=recordEvents(declaration+b"<"+SHARD_ROOT+b">"+data+b"</"+SHARD_ROOT+b">")
+    # Strip the events of the enclosing shard element. Its name is the first interned string,
+    # but it may also occur in the sentences, so the strings are renumbered in the order of
+    # their first use by the sentences. As strings are interned in the order of their first
+    # use, the ids used before the name are 1..k.
+    events=writer.events[2:-1]
+    strings=writer.strings
+    order=list(range(1,len(strings)))
+    if 0 in events:
+        k=max(0,max(events[:events.index(0)],default=0))
+        order.insert(k,0)
+    newIds=[0]*len(strings)
+    for newId,e in enumerate(order):
+        newIds[e]=newId
+    events=array.array("i",[newIds[e] if e>=0 else e for e in events])
+    return [strings[e] for e in order],events.tobytes()
+
+def parseHeader(header,tail):
+    """
+    Tokenizes the corpus without its sentences.
+
+    @return: A tuple (strings, before, after) of the string table, the events up to and including
+    the I{sentences} open tag, and the remaining events.
+    """
+    writer=recordEvents(header+tail)
+    strings,events=writer.strings,writer.events
+    i=0
+    while True:
+        tag=events[i]
+        i+=1
+        if tag==ELEMENT_END:
+            continue
+        while events[i]!=ATTRS_END:
+            i+=2
+        i+=1
+        if strings[tag]=="sentences":
+            break
+    return strings,events[:i],events[i:]
+
+def shardResults(xmlFileName,processes=None,shardsPerProcess=4):
+    """
+    Yields the tokenized shards of C{xmlFileName} in the document order, preceded by the
+    tokenized header and followed by the tokenized tail, as (strings, events) pairs.
+    """
+    processes=processes or os.cpu_count() or 1
+    plan=planShards(xmlFileName,processes*shardsPerProcess)
+    if plan is None:
+        raise ValueError("No sentences section found in %s"%xmlFileName)
+    header,tail,shards=plan
+    strings,before,after=parseHeader(header,tail)
+    yield strings,before
+    declaration=xmlDeclaration(header)
+    tasks=[(xmlFileName,declaration,start,end) for (start,end) in shards]
+    if processes==1:
+        results=map(parseShard,tasks)
+        pool=None
+    else:
+        pool=multiprocessing.Pool(processes)
+        results=pool.imap(parseShard,tasks)
+    try:
+        for shardStrings,shardEvents in results:
+            events=array.array("i")
+            events.frombytes(shardEvents)
+            yield shardStrings,events
+    finally:
+        if pool is not None:
+            pool.terminate()
+    yield strings,after
+
+def scanShard(task):
+    """
+    Parses the sentences of one shard and applies a function to them. Runs in the worker processes.
+
+    @param task: A tuple (xmlFileName, header, tail, start, end, function, args).
+    @return: The result of C{function} for the shard.
+    """
+    xmlFileName,header,tail,start,end,function,args=task
+    with open(xmlFileName,"rb") as f:
+        f.seek(start)
+        data=f.read(end-start)
+    parser=FastBIParser(**args)
+    return function(parser.iterparse(io.BytesIO(header+data+tail),dropSentences=True))
+
+def mapSentenceShards(xmlFileName,function,processes=None,shardsPerProcess=4,**args):
+    """
+    Splits the sentences of C{xmlFileName} into shards and calls C{function} on each shard in
+    a worker process. Every worker parses the ontologies and the sentences of its shard on its
+    own, so that only the results of C{function} are transferred between the processes.
+
+    @param function: A function taking an iterator of (sentence, ontologies) pairs, as
+    L{BIParser.iterparse<BIParser.BIParser.iterparse>}, and returning a picklable result.
+    It must be defined at the top level of a module. The sentences are dropped once consumed.
+    @param processes: The number of worker processes. Defaults to the number of CPUs.
+    With one process, the shards are processed in the calling process.
+    @param args: Passed to the parsers, see L{BIParser<BIParser.BIParser>}.
+    @return: An iterator of the results of C{function}, in the document order of the shards.
+    """
+    processes=processes or os.cpu_count() or 1
+    plan=planShards(xmlFileName,processes*shardsPerProcess)
+    if plan is None:
+        raise ValueError("No sentences section found in %s"%xmlFileName)
+    header,tail,shards=plan
+    tasks=[(xmlFileName,header,tail,start,end,function,args) for (start,end) in shards]
+    if processes==1:
+        for task in tasks:
+            yield scanShard(task)
+        return
+    pool=multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(scanShard,tasks):
+            yield result
+    finally:
+        pool.terminate()
+
+def parseParallel(xmlFileName,processes=None,**args):
+    """
+    Returns a parser holding the corpus in C{xmlFileName}, which is tokenized by
+    C{processes} worker processes. The result is identical to parsing the file
+    with L{BIParser<BIParser.BIParser>}.
+
+    @param processes: The number of worker processes. Defaults to the number of CPUs.
+    @param args: Passed to the parser, see L{BIParser<BIParser.BIParser>}.
+    @rtype: L{SnapshotParser<BISnapshot.SnapshotParser>}
+    """
+    parser=SnapshotParser(**args)
+    for strings,events in shardResults(xmlFileName,processes):
+        parser.replay(strings,events)
+    return parser
+
+def compileSnapshotParallel(xmlFileName,snapshotFileName,processes=None):
+    """
+    Compiles the XML file C{xmlFileName} into the snapshot C{snapshotFileName} using
+    C{processes} worker processes. The snapshot is the same as the one written by
+    L{compileSnapshot<BISnapshot.compileSnapshot>}.
+    """
+    stamp=xmlStamp(xmlFileName)
+    writer=SnapshotWriter()
+    for strings,events in shardResults(xmlFileName,processes):
+        writer.extend(strings,events)
+    tmpName=snapshotFileName+".tmp"
+    with open(tmpName,"wb") as out:
+        writer.write(out,stamp)
+    os.replace(tmpName,snapshotFileName)
+
+if __name__=="__main__":
+    usage="\n\n%prog -h or --help\n%prog [OPTIONS]\n\nCompiles the BioInfer corpus XML file into a binary snapshot, tokenizing\nthe sentences in several processes."
+    optionParser=OptionParser(usage)
+
+    group1=OptionGroup(optionParser,"*** Standard usage options ***")
+    group1.add_option("-b","--bioInferFile",action="store",dest="bioinferXmlFile",metavar="FILENAME",default=None,help="The XML file holding the BioInfer corpus. This parameter is compulsory.")
+    group1.add_option("-o","--output",action="store",dest="snapshotFile",metavar="FILENAME",default=None,help="The snapshot file to write. Defaults to the XML file name with the suffix .snap.")
+    group1.add_option("-j","--processes",action="store",type="int",dest="processes",default=None,help="The number of worker processes. Defaults to the number of CPUs.")
+    optionParser.add_option_group(group1)
+
+    options,args=optionParser.parse_args()
+
+    if not options.bioinferXmlFile:
+        print("You must specify the --bioInferFile (-b) option.", file=sys.stderr)
+        optionParser.print_help()
+        sys.exit(-1)
+
+    try:
+        compileSnapshotParallel(options.bioinferXmlFile,options.snapshotFile or options.bioinferXmlFile+".snap",options.processes)
+    except IOError as e:
+        print("Failed to open '%s': %s" % (e.filename, e.strerror))
+        sys.exit(1)
@@ -17,7 +17,7 @@
 
 from BasicClasses import (Sentences, Sentence,
                           Token, SubToken, Entity,
-                          Linkage, Link, NestedSubtoken,
+                          Linkage, parseLink, NestedSubtoken,
                           Formulas,Formula,RelNode,
                           EntityNode,
                           EntityNesting, Linkages,BioInfer)
@@ -26,9 +26,16 @@ from OntologyClasses import (Ontology,RelType,Predicate,EntityType)
 import xml.sax
 import xml.sax.saxutils
 import xml.sax.handler
+import xml.parsers.expat
+import io
 import sys
 from optparse import OptionParser,OptionGroup
 
+try:
+    from lxml import etree
+except ImportError:
+    etree=None
+
 class BIParser (xml.sax.handler.ContentHandler,
                  xml.sax.handler.DTDHandler,
                  xml.sax.handler.EntityResolver,
@@ -65,6 +72,10 @@ class BIParser (xml.sax.handler.ContentHandler,
     of the form C{sentenceCls=MySentence} in the C{__init__} method of the parser: C{myParser=BIParser(sentenceCls=MySentence)}.
     Any named argument whose name ends with I{Cls} is recognized as an assignment of a class to XML tag. The default assignment
     is specified in the class variable C{defaultClasses}.
+
+    The I{link} tag is the exception: by default it is handled by the function L{parseLink<BasicClasses.parseLink>},
+    which only records the link in the arrays of its L{Linkage<BasicClasses.Linkage>}, and the L{Link<BasicClasses.Link>}
+    instances are created from the arrays when they are first needed.
     """
 
     defaultClasses={"sentencesCls":Sentences,
@@ -73,7 +84,7 @@ class BIParser (xml.sax.handler.ContentHandler,
                     "subtokenCls":SubToken,
                     "entityCls":Entity,
                     "linkageCls":Linkage,
-                    "linkCls":Link,
+                    "linkCls":parseLink,
                     "nestedsubtokenCls":NestedSubtoken,
                     "formulasCls":Formulas,
                     "formulaCls":Formula,
@@ -95,6 +106,7 @@ class BIParser (xml.sax.handler.ContentHandler,
         self.objectStack=[]
         self.nameStack=[]
         self.bioinfer=None
+        self.finishedSentences=None
 
     def startElement(self,name,attrs):
         if name.lower()=="bioinfer": #Outer tag handled separately
@@ -108,6 +120,8 @@ class BIParser (xml.sax.handler.ContentHandler,
         self.objectStack.append(elementObject)
 
     def endElement(self,name):
+        if self.finishedSentences is not None and name.lower()=="sentence":
+            self.finishedSentences.append(self.objectStack[-1])
         del self.nameStack[-1]
         del self.objectStack[-1]
 
@@ -116,3 +130,150 @@ class BIParser (xml.sax.handler.ContentHandler,
         parser.setFeature(xml.sax.handler.feature_namespaces, 0)
         parser.setContentHandler(self)
         parser.parse(lines)
+
+    def createIncrementalParser(self):
+        """
+        Returns an XML parser delivering its events to this object, with C{feed(data)} and C{close()} methods.
+        """
+        parser=xml.sax.make_parser()
+        parser.setFeature(xml.sax.handler.feature_namespaces, 0)
+        parser.setContentHandler(self)
+        return parser
+
+    def iterparse(self,lines,dropSentences=False,chunkSize=65536):
+        """
+        Parses the XML document incrementally, yielding each sentence as soon as its
+        I{sentence} tag is closed. Parsing proceeds only as fast as the sentences are consumed.
+
+        @param lines: A file object or file name of the XML document.
+        @param dropSentences: If true, every sentence is removed from C{self.bioinfer.sentences}
+        once the consumer has taken it, so that the memory use does not grow with the corpus size.
+        @type dropSentences: bool
+        @param chunkSize: The number of characters read from C{lines} at a time.
+        @type chunkSize: integer
+        @return: An iterator of (sentence, ontologies) pairs, where C{ontologies} is the
+        dictionary of the ontologies seen so far, see L{BioInfer<BasicClasses.BioInfer>}.
+        """
+        if isinstance(lines,str):
+            with open(lines,"rt") as f:
+                for item in self.iterparse(f,dropSentences,chunkSize):
+                    yield item
+            return
+        parser=self.createIncrementalParser()
+        self.finishedSentences=[]
+        try:
+            while True:
+                data=lines.read(chunkSize)
+                if data:
+                    parser.feed(data)
+                else:
+                    parser.close()
+                while self.finishedSentences:
+                    sentence=self.finishedSentences.pop(0)
+                    yield sentence,self.bioinfer.ontologies
+                    if dropSentences:
+                        self.bioinfer.sentences.removeSentence(sentence)
+                if not data:
+                    break
+        finally:
+            self.finishedSentences=None
+
+
+class ExpatFeeder (object):
+    """
+    A thin wrapper giving a pyexpat parser the C{feed}/C{close} interface of
+    C{xml.sax.xmlreader.IncrementalParser}.
+    """
+
+    def __init__(self,startElement,endElement):
+        self.parser=xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text=True
+        self.parser.StartElementHandler=startElement
+        self.parser.EndElementHandler=endElement
+
+    def feed(self,data):
+        self.parser.Parse(data,False)
+
+    def close(self):
+        self.parser.Parse(b"",True)
+
+class FastBIParser (BIParser):
+    """
+    A L{BIParser} backend which bypasses C{xml.sax} and uses pyexpat directly or, on
+    request and when it is installed, lxml iterparse. The C{*Cls} extension mechanism and the
+    resulting object model are the same as for L{BIParser}. The tag to class dispatch
+    is resolved once per distinct tag name and cached, so that there is no per-event
+    string work.
+
+    @ivar backend: Either \"lxml\" or \"expat\".
+    @type backend: string
+    """
+
+    def __init__(self,backend="expat",**args):
+        """
+        @param backend: \"expat\" (the default) or \"lxml\". On the BioInfer corpus the
+        expat backend measures faster, lxml is mostly useful when it is the XML library
+        already used by the surrounding tools.
+        @param args: The C{*Cls} class assignments, see L{BIParser}.
+        """
+        BIParser.__init__(self,**args)
+        if backend=="lxml" and etree is None:
+            raise ValueError("The lxml backend requires the lxml package")
+        self.backend=backend
+        self.dispatch={}
+
+    def resolveClass(self,name):
+        """
+        Returns the class assigned to the tag C{name}, or C{None} for the outer I{bioinfer} tag,
+        which is handled by L{BIParser.startElement}.
+        """
+        if name.lower()=="bioinfer":
+            return None
+        return self.classCfg.get(name.lower()+"Cls",None)
+
+    def startElement(self,name,attrs):
+        try:
+            elementClass=self.dispatch[name]
+        except KeyError:
+            elementClass=self.dispatch[name]=self.resolveClass(name)
+        if elementClass is None:
+            BIParser.startElement(self,name,attrs)
+            return
+        self.nameStack.append(name)
+        self.objectStack.append(elementClass(parser=self,oStack=self.objectStack,attrs=attrs))
+
+    def createIncrementalParser(self):
+        return ExpatFeeder(self.startElement,self.endElement)
+
+    def parse(self,lines,chunkSize=1048576):
+        """
+        Parses a complete XML document.
+
+        @param lines: A file object or file name of the XML document.
+        """
+        if isinstance(lines,str):
+            with open(lines,"rb") as f:
+                return self.parse(f,chunkSize)
+        if self.backend=="lxml":
+            source=lines
+            if isinstance(lines,io.TextIOBase):
+                source=lines.buffer #lxml reads bytes and decodes itself
+            startElement=self.startElement
+            endElement=self.endElement
+            for event,elem in etree.iterparse(source,events=("start","end")):
+                if event=="start":
+                    startElement(elem.tag,elem.attrib)
+                else:
+                    endElement(elem.tag)
+                    # free the already processed part of the tree
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+            return
+        parser=self.createIncrementalParser()
+        while True:
+            data=lines.read(chunkSize)
+            if not data:
+                break
+            parser.feed(data)
+        parser.close()
@@ -0,0 +1,253 @@
+# BioInfer supporting software tools
+# Copyright (C) 2006 University of Turku
+#
+# This is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this software in the file COPYING. If not, see
+# http://www.gnu.org/licenses/lgpl.html
+
+"""
+Buffered XML output of the corpus.
+
+L{XMLWriter} produces exactly the same output as
+L{BIXMLWriteable.writeXML<BasicClasses.BIXMLWriteable.writeXML>}, but instead of
+looking up the output methods of every object and printing every tag separately,
+it resolves a serialization plan once per class and collects the output in a
+buffer, which is written to the output stream in large chunks.
+
+The nested items of the classes in L{BasicClasses} and L{OntologyClasses} are
+written by the writer itself, as long as a class uses the C{writeXMLNestedItems}
+of these modules (which is also the case for the classes of L{CompactClasses}).
+Classes which define their own output methods are written by calling these
+methods with the writer in place of the output stream, so their output is
+unchanged too.
+"""
+
+import re
+import xml.sax.saxutils
+
+from BasicClasses import (DEFAULT_INDENT, BIXMLWriteable,
+                          BioInfer, Sentences, Sentence, Token, Entity,
+                          Formula, FormulaNode, Linkage)
+from OntologyClasses import Ontology, OntologyNode
+
+SPECIAL_CHARS=re.compile("[&<>\"\n\r\t]")
+
+def quoteattr(s):
+    """
+    Same as C{xml.sax.saxutils.quoteattr}, with a shortcut for strings without special characters.
+    """
+    if SPECIAL_CHARS.search(s) is None:
+        return "\""+s+"\""
+    return xml.sax.saxutils.quoteattr(s)
+
+class WritePlan (object):
+    """
+    How the instances of one class are written.
+
+    @ivar writeXML: The C{writeXML} method of the class if it is not the one of
+    L{BIXMLWriteable}, in which case all output of the instances goes through it.
+    @ivar tag: The XML tag of the class.
+    @ivar persistentAttrs: Pairs of the persistent attribute names and their C{name=} prefixes.
+    @ivar computeXMLArgs: The C{computeXMLArgs} method of the class, or C{None}.
+    @ivar nestedItemsPresent: The C{nestedItemsPresent} method of the class, or C{None}.
+    @ivar writeNested: Writes the nested items of an instance, C{None} if the class has none.
+    """
+
+    __slots__=("writeXML","tag","persistentAttrs","computeXMLArgs","nestedItemsPresent","writeNested")
+
+class XMLWriter (object):
+    """
+    Writes corpus objects as XML into a buffer which is passed on to C{out} in chunks.
+    An C{XMLWriter} can also be used as a text stream: C{print(..., file=writer)} appends
+    to the buffer.
+
+    @ivar out: The output stream, or C{None} to keep everything in the buffer, see L{getvalue}.
+    """
+
+    def __init__(self,out=None,chunkSize=65536):
+        """
+        @param out: A text stream.
+        @param chunkSize: The number of buffered pieces of output after which the buffer is written to C{out}.
+        @type chunkSize: integer
+        """
+        self.out=out
+        self.chunkSize=chunkSize
+        self.parts=[]
+        self.plans={}
+        self.indents={}
+        self.fastNested={BioInfer.writeXMLNestedItems:self.writeBioInferItems,
+                         Sentence.writeXMLNestedItems:self.writeSentenceItems,
+                         Entity.writeXMLNestedItems:self.writeEntityItems,
+                         Sentences.writeXMLNestedItems:self.childWriter(lambda o:o.sentences),
+                         Token.writeXMLNestedItems:self.childWriter(lambda o:o.subTokens),
+                         Linkage.writeXMLNestedItems:self.childWriter(lambda o:o.links),
+                         FormulaNode.writeXMLNestedItems:self.childWriter(lambda o:o.arguments),
+                         Formula.writeXMLNestedItems:self.childWriter(lambda o:(o.rootNode,)),
+                         Ontology.writeXMLNestedItems:self.childWriter(lambda o:(o.rootNode,)),
+                         OntologyNode.writeXMLNestedItems:self.writeOntologyNodeItems,
+                         }
+
+    def write(self,s):
+        """
+        Appends the string C{s} to the output.
+        """
+        self.parts.append(s)
+        if len(self.parts)>=self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered output to C{out}. Does nothing if C{out} is C{None}.
+        """
+        if self.out is not None and self.parts:
+            self.out.write("".join(self.parts))
+            self.parts=[]
+
+    def getvalue(self):
+        """
+        Returns the buffered output.
+        """
+        return "".join(self.parts)
+
+    def indent(self,indent):
+        try:
+            return self.indents[indent]
+        except KeyError:
+            return self.indents.setdefault(indent," "*indent)
+
+    def plan(self,cls):
+        """
+        Returns the L{WritePlan} of the class C{cls}.
+        """
+        try:
+            return self.plans[cls]
+        except KeyError:
+            pass
+        plan=WritePlan()
+        if (cls.writeXML is not BIXMLWriteable.writeXML or cls.XMLAttrs is not BIXMLWriteable.XMLAttrs
+            or cls.writeXMLOpen is not BIXMLWriteable.writeXMLOpen or cls.writeXMLClose is not BIXMLWriteable.writeXMLClose):
+            plan.writeXML=cls.writeXML
+        else:
+            plan.writeXML=None
+        plan.tag=cls.XMLTag
+        plan.persistentAttrs=tuple((a,str(a)+"=") for a in cls.persistentAttrs)
+        plan.computeXMLArgs=getattr(cls,"computeXMLArgs",None)
+        plan.nestedItemsPresent=getattr(cls,"nestedItemsPresent",None)
+        nested=getattr(cls,"writeXMLNestedItems",None)
+        if nested is None:
+            plan.writeNested=None
+        elif nested in self.fastNested:
+            plan.writeNested=self.fastNested[nested]
+        else:
+            plan.writeNested=lambda obj,indent,kwArgs: obj.writeXMLNestedItems(self,indent,**kwArgs)
+        self.plans[cls]=plan
+        return plan
+
+    def writeObject(self,obj,indent=0,**kwArgs):
+        """
+        Writes C{obj} the same way as C{obj.writeXML(out,indent,**kwArgs)} does.
+        """
+        plan=self.plan(type(obj))
+        if plan.writeXML is not None:
+            plan.writeXML(obj,self,indent,**kwArgs)
+            return
+        attrs=[]
+        for a,prefix in plan.persistentAttrs:
+            try:
+                value=getattr(obj,a)
+            except AttributeError:
+                continue
+            attrs.append(prefix+quoteattr(str(value)))
+        if plan.computeXMLArgs is not None:
+            try:
+                computed=plan.computeXMLArgs(obj)
+            except AttributeError: #as in BIXMLWriteable.XMLAttrs
+                computed=()
+            for a,s in computed:
+                attrs.append(str(a)+"="+quoteattr(s))
+        head=self.indent(indent)+"<"+plan.tag
+        if attrs:
+            head+=" "+" ".join(attrs)
+        hasNestedItems=True
+        if plan.nestedItemsPresent is not None:
+            try:
+                hasNestedItems=plan.nestedItemsPresent(obj)
+            except:
+                pass
+        if hasNestedItems and plan.writeNested is not None:
+            self.write(head+">\n")
+            plan.writeNested(obj,indent+DEFAULT_INDENT,kwArgs)
+            self.write(self.indent(indent)+"</"+plan.tag+">\n")
+        else:
+            self.write(head+"/>\n")
+
+    def childWriter(self,children,extraIndent=0):
+        """
+        Returns a function writing the objects C{children(obj)} nested in C{obj}.
+        """
+        def writeChildren(obj,indent,kwArgs):
+            writeObject=self.writeObject
+            for child in children(obj):
+                writeObject(child,indent+extraIndent)
+        return writeChildren
+
+    def writeBioInferItems(self,obj,indent,kwArgs):
+        if kwArgs.get("includeOntologies",False):
+            for o in list(obj.ontologies.values()):
+                self.writeObject(o,indent)
+        self.writeObject(obj.sentences,indent)
+
+    def writeSentenceItems(self,obj,indent,kwArgs):
+        writeObject=self.writeObject
+        write=self.write
+        ind=self.indent(indent)
+        for t in obj.tokens:
+            writeObject(t,indent)
+        for e in obj.entities:
+            writeObject(e,indent)
+        for e in obj.entities:
+            if type(e).writeXMLNestedEntities is Entity.writeXMLNestedEntities:
+                outer=quoteattr(e.id)
+                for n in e.nestedEntities:
+                    write(ind+"<entitynesting outerid="+outer+" innerid="+quoteattr(n.id)+"/>\n")
+            else:
+                e.writeXMLNestedEntities(self,indent)
+        write(ind+"<linkages>\n")
+        for l in list(obj.linkages.values()):
+            writeObject(l,indent+DEFAULT_INDENT)
+        write(ind+"</linkages>\n")
+        write(ind+"<formulas>\n")
+        for f in obj.formulas:
+            writeObject(f,indent+DEFAULT_INDENT)
+        write(ind+"</formulas>\n")
+
+    def writeEntityItems(self,obj,indent,kwArgs):
+        ind=self.indent(indent)
+        for s in obj.subTokens:
+            self.write(ind+"<nestedsubtoken id="+quoteattr(s.id)+"/>\n")
+
+    def writeOntologyNodeItems(self,obj,indent,kwArgs):
+        for s in obj.predicates:
+            self.writeObject(s,indent+2)
+        for s in obj.specs:
+            self.writeObject(s,indent+2)
+
+def writeXML(obj,out,indent=0,chunkSize=65536,**kwArgs):
+    """
+    Writes C{obj} into the text stream C{out} with an L{XMLWriter}. The output is the
+    same as that of C{obj.writeXML(out,indent,**kwArgs)}, for example
+    C{writeXML(parser.bioinfer,out,includeOntologies=True)} writes the whole corpus.
+    """
+    writer=XMLWriter(out,chunkSize)
+    writer.writeObject(obj,indent,**kwArgs)
+    writer.flush()
@@ -17,12 +17,15 @@
 
 import xml.sax.saxutils
 import itertools
+import array
 
 currentSentence=None
 DEFAULT_INDENT=2
 
 class BIObject (object):
 
+    __slots__=() #Lets the compact variants in CompactClasses do without an instance __dict__
+
     XMLTag=None
 
     def __init__(self,attrs):
@@ -64,6 +67,8 @@ class BIXMLWriteable (object):
       are included by default.
     """
 
+    __slots__=()
+
     persistentAttrs=[]
 
     def writeXMLOpen(self,out,indent=0,closing=False):
@@ -95,7 +100,7 @@ class BIXMLWriteable (object):
             args2=self.computeXMLArgs() #Is the computeXMLArgs method defined by this object?
         except AttributeError:
             args2=() #no
-        args1=((a,str(self.__dict__[a])) for a in self.persistentAttrs if a in self.__dict__) #Gather the values indicated in persistentAttrs
+        args1=((a,str(getattr(self,a))) for a in self.persistentAttrs if hasattr(self,a)) #Gather the values indicated in persistentAttrs
         xmlStrings=(str(a)+"="+xml.sax.saxutils.quoteattr(s) for a,s in itertools.chain(args1,args2))
         return " ".join(xmlStrings)
 
@@ -201,6 +206,14 @@ class Sentences (BIObject,BIXMLWriteable):
 
     @ivar sentences: List of L{Sentence} objects.
     @type sentences: list
+    @ivar sentenceIdxById: Dictionary mapping sentence ids to their index in C{sentences}.
+    @type sentenceIdxById: dictionary
+    @ivar tokensById: Dictionary of the L{tokens<Token>} of all sentences, where the token id serves as key.
+    @type tokensById: dictionary
+    @ivar subTokensById: Dictionary of the L{subtokens<SubToken>} of all sentences, where the subtoken id serves as key.
+    @type subTokensById: dictionary
+    @ivar entitiesById: Dictionary of the L{entities<Entity>} of all sentences, where the entity id serves as key.
+    @type entitiesById: dictionary
     """
 
     XMLTag="sentences"
@@ -218,15 +231,93 @@ class Sentences (BIObject,BIXMLWriteable):
         BIObject.__init__(self,attrs)
         self.sentences=[]
         """A list of `Sentence` objects."""
+        self.sentenceIdxById={}
+        self.tokensById={}
+        self.subTokensById={}
+        self.entitiesById={}
 
     def addSentence(self,sentence):
         """
-        Appends C{sentence} to the end of the list of sentences.
+        Appends C{sentence} to the end of the list of sentences. The tokens, subtokens
+        and entities subsequently added to the sentence are registered in the id maps.
 
         @param sentence: The sentence to be appended.
         @type sentence: Instance of L{Sentence<BasicClasses.Sentence>}, or derived.
         """
+        self.sentenceIdxById[sentence.id]=len(self.sentences)
         self.sentences.append(sentence)
+        sentence.sentences=self
+        self.registerElements(sentence)
+
+    def removeSentence(self,sentence):
+        """
+        Removes C{sentence} from the list of sentences and its elements from the id maps.
+
+        @param sentence: The sentence to be removed.
+        @type sentence: Instance of L{Sentence<BasicClasses.Sentence>}, or derived.
+        """
+        idx=self.sentenceIdxById.get(sentence.id)
+        if idx is None or self.sentences[idx] is not sentence:
+            idx=self.sentences.index(sentence)
+        del self.sentences[idx]
+        if self.sentenceIdxById.get(sentence.id)==idx:
+            del self.sentenceIdxById[sentence.id]
+        for i in range(idx,len(self.sentences)):
+            self.sentenceIdxById[self.sentences[i].id]=i
+        self.unregisterElements(sentence)
+        sentence.sentences=None
+
+    def getSentenceIndex(self,sentenceId):
+        """
+        Returns the index in C{sentences} of the sentence whose id is C{sentenceId}, or C{None} if there is no such sentence.
+        """
+        return self.sentenceIdxById.get(sentenceId)
+
+    def getSentence(self,sentenceId):
+        """
+        Returns the sentence whose id is C{sentenceId}, or C{None} if there is no such sentence.
+        """
+        idx=self.sentenceIdxById.get(sentenceId)
+        if idx is None:
+            return None
+        return self.sentences[idx]
+
+    def registerElements(self,sentence):
+        """
+        Includes the tokens, subtokens and entities of C{sentence} into the id maps.
+        """
+        for t in sentence.tokens:
+            self.tokensById[t.id]=t
+            for st in t.subTokens:
+                self.subTokensById[st.id]=st
+        for e in sentence.entities:
+            self.entitiesById[e.id]=e
+
+    def unregisterElements(self,sentence):
+        """
+        Removes the tokens, subtokens and entities of C{sentence} from the id maps.
+        """
+        def unregister(d,o):
+            if d.get(o.id) is o:
+                del d[o.id]
+        for t in sentence.tokens:
+            unregister(self.tokensById,t)
+            for st in t.subTokens:
+                unregister(self.subTokensById,st)
+        for e in sentence.entities:
+            unregister(self.entitiesById,e)
+
+    def reindex(self):
+        """
+        Rebuilds the id maps from scratch. Only needed if the ids of the sentences were changed.
+        """
+        self.sentenceIdxById={}
+        self.tokensById={}
+        self.subTokensById={}
+        self.entitiesById={}
+        for i,sentence in enumerate(self.sentences):
+            self.sentenceIdxById[sentence.id]=i
+            self.registerElements(sentence)
 
     def writeXMLNestedItems(self,out,indent):
         for s in self.sentences:
@@ -262,6 +353,7 @@ class Sentence (BIObject,BIXMLWriteable):
     @type persistentAttrs: List of strings
     @ivar sentences: The C{sentences} instance to which this sentence belongs.
     @type sentences: L{sentences}
+    @ivar offsetTables: The character offsets of the tokens and subtokens, see L{getOffsetTables}. C{None} until first needed.
     """
 
     XMLTag="sentence"
@@ -295,6 +387,8 @@ class Sentence (BIObject,BIXMLWriteable):
         self.linkages={}
         self.tokenSequence=-1
         self.subTokenSequence=-1
+        self.offsetTables=None
+        self.sentences=None
         oStack[-1].addSentence(self)
 
     def getTokenSequence(self):
@@ -311,6 +405,37 @@ class Sentence (BIObject,BIXMLWriteable):
         self.subTokenSequence+=1
         return self.subTokenSequence
 
+    def getOffsetTables(self):
+        """
+        Returns the character offsets of the tokens and subtokens of the sentence
+        in the original text. The tables are computed on the first call and kept
+        until the tokens of the sentence change.
+
+        @return: A pair of integer arrays (tokenOffsets, subTokenOffsets). The first is indexed by the position
+        of the token in C{self.tokens}, the second by the L{sequence<SubToken.sequence>} of the subtoken.
+        @rtype: (array, array)
+        """
+        if self.offsetTables is None:
+            tokenOffsets=array.array("l")
+            subTokenOffsets=array.array("l")
+            for t in self.tokens:
+                offset=int(t.charOffset)
+                tokenOffsets.append(offset)
+                for st in t.subTokens:
+                    if st.sequence>=len(subTokenOffsets):
+                        subTokenOffsets.extend([0]*(st.sequence+1-len(subTokenOffsets)))
+                    subTokenOffsets[st.sequence]=offset
+                    offset+=len(st.text)
+            self.offsetTables=(tokenOffsets,subTokenOffsets)
+        return self.offsetTables
+
+    def invalidateOffsets(self):
+        """
+        Discards the tables computed by L{getOffsetTables}. Must be called when the text or
+        the offsets of the tokens and subtokens of the sentence are changed.
+        """
+        self.offsetTables=None
+
     def getText(self):
         """
         A space-delimited string of all tokens in the sentence. 
@@ -325,11 +450,17 @@ class Sentence (BIObject,BIXMLWriteable):
         the corpus data was changed (re-tokenized, etc...).  This is
         not to be used unless you know exactly what you are doing.
         """
+        self.offsetTables=None
+        if self.sentences is not None:
+            self.sentences.unregisterElements(self)
         for seq,token in enumerate(self.tokens):
             token.id="t.%s.%d"%(self.id,seq)
             token.regenId()
         for seq,entity in enumerate(self.entities): #There is no natural order for entities, but the self.entities takes care the order is preserved as in the XML file
             entity.id="e.%s.%d"%(self.id,seq)
+        self.entitiesById=dict((e.id,e) for e in self.entities)
+        if self.sentences is not None:
+            self.sentences.registerElements(self)
 
     def addToken(self,token):
         """
@@ -340,6 +471,9 @@ class Sentence (BIObject,BIXMLWriteable):
         self.tokens.append(token)
         token.sentence=self
         token.sequence=len(self.tokens)-1
+        self.offsetTables=None
+        if self.sentences is not None:
+            self.sentences.tokensById[token.id]=token
 
 
     def addEntity(self,entity):
@@ -351,6 +485,8 @@ class Sentence (BIObject,BIXMLWriteable):
         entity.sentence=self
         self.entitiesById[entity.id]=entity
         self.entities.append(entity)
+        if self.sentences is not None:
+            self.sentences.entitiesById[entity.id]=entity
 
     def writeXMLNestedItems(self,out,indent):
         for t in self.tokens:
@@ -418,6 +554,11 @@ class Token (BIObject,BIXMLWriteable):
         """
         subToken.token=self
         self.subTokens.append(subToken)
+        sentence=getattr(self,"sentence",None)
+        if sentence is not None:
+            sentence.offsetTables=None
+            if sentence.sentences is not None:
+                sentence.sentences.subTokensById[subToken.id]=subToken
 
     def writeXMLNestedItems(self,out,indent):
         for st in self.subTokens:
@@ -454,8 +595,11 @@ class SubToken (BIObject,BIXMLWriteable):
         Returns the zero-based character offset of this subtoken in the
         string representing the original untokenized text of the sentence.
         """
-        # calculate as on the character offset of the token plus the
-        # lengths of preceding subtokens
+        # the character offset of the token plus the lengths of
+        # preceding subtokens, as tabulated by the sentence
+        sentence = getattr(self.token,"sentence",None)
+        if sentence is not None:
+            return sentence.getOffsetTables()[1][self.sequence]
         offset = int(self.token.charOffset)
         for st in [st for st in self.token.subTokens if st.sequence<self.sequence]:
             offset += len(st.text)
@@ -480,20 +624,43 @@ class Link (BIObject,BIXMLWriteable):
 
     def __init__(self,oStack,attrs,**args):
         BIObject.__init__(self,attrs)
-        token1IDComponents=attrs["token1"].split(".")
-        token2IDComponents=attrs["token2"].split(".")
-        if len(token1IDComponents)==3:
-            del token1IDComponents[0] #Remove the "t" from the begining of token ids
-        if len(token2IDComponents)==3:
-            del token2IDComponents[0] #Remove the "t" from the begining of token ids
-        s1,t1=(int(x) for x in token1IDComponents)
-        s2,t2=(int(x) for x in token2IDComponents)
-        self.token1=oStack[-1].sentence.tokens[t1]
-        self.token2=oStack[-1].sentence.tokens[t2]
+        sentence=oStack[-1].sentence
+        self.token1=Link.resolveToken(sentence,attrs["token1"])
+        self.token2=Link.resolveToken(sentence,attrs["token2"])
         self.category=attrs["category"].split(",")
         self.type=attrs["type"]
         oStack[-1].addLink(self)
 
+    @staticmethod
+    def resolveToken(sentence,tokenId):
+        """
+        Returns the token of C{sentence} whose id is C{tokenId}. The token is looked up in the
+        id map of the L{Sentences}, the id is only parsed if the lookup fails.
+        """
+        if sentence.sentences is not None:
+            token=sentence.sentences.tokensById.get(tokenId)
+            if token is not None and token.sentence is sentence:
+                return token
+        idComponents=tokenId.split(".")
+        if len(idComponents)==3:
+            del idComponents[0] #Remove the "t" from the begining of token ids
+        s,t=(int(x) for x in idComponents)
+        return sentence.tokens[t]
+
+    @classmethod
+    def fromRow(cls,linkage,i):
+        """
+        Creates the link number C{i} of C{linkage} from the link arrays of the linkage.
+        """
+        link=cls.__new__(cls)
+        tokens=linkage.sentence.tokens
+        link.token1=tokens[linkage.token1s[i]]
+        link.token2=tokens[linkage.token2s[i]]
+        link.category=linkage.getCategories()[linkage.categoryIds[i]].split(",")
+        link.type=linkage.getLinkTypes()[linkage.typeIds[i]]
+        link.linkage=linkage
+        return link
+
     def __getMacro(self):
         if "macro" in self.category:
             return True
@@ -505,6 +672,20 @@ class Link (BIObject,BIXMLWriteable):
         return ("token1",self.token1.id),("token2",self.token2.id),("category",",".join(self.category))
 
 
+def parseLink(oStack,attrs,**args):
+    """
+    Records a I{link} element in the link arrays of the linkage being parsed, without creating
+    a L{Link}. This is the default handler of the I{link} tag; the links are created when
+    L{Linkage.links<Linkage>} is first used. Passing C{linkCls=Link} to the parser creates them
+    during the parsing instead.
+    """
+    linkage=oStack[-1]
+    sentence=linkage.sentence
+    linkage.appendRow(Link.resolveToken(sentence,attrs["token1"]).sequence,
+                      Link.resolveToken(sentence,attrs["token2"]).sequence,
+                      attrs["type"],attrs["category"])
+
+
 class Entity (BIObject,BIXMLWriteable):
     """
     The representation of Entity as a list of subtokens.
@@ -522,6 +703,8 @@ class Entity (BIObject,BIXMLWriteable):
     @type formulaNodesUsingMe: list
     @ivar type: The L{entity type<OntologyClasses.EntityType>} of this entity. The type is a node in an ontology.
     @type type: L{EntityType<OntologyClasses.EntityType>}
+    @ivar typeId: The id of the entity type in the I{Entity} ontology, -1 if the type is unknown.
+    @type typeId: integer
     """
     
     XMLTag="entity"
@@ -536,8 +719,10 @@ class Entity (BIObject,BIXMLWriteable):
         self.formulaNodesUsingMe=[]
         oStack[-1].addEntity(self)
         typeName=attrs["type"]
+        self.typeId=-1
         try:
             self.type=parser.bioinfer.ontologies["Entity"].findPredicate(typeName)
+            self.typeId=self.type.index
         except KeyError:
             print("Unknown",typeName)
         try:
@@ -553,14 +738,15 @@ class Entity (BIObject,BIXMLWriteable):
         """
         Returns the text of the entity.
         """
-        text, prevSt = "", None
+        text, prevEnd = "", None
         for st in self.subTokens:
             # only add separating space if the SubTokens are not consequtive
             # in the original text of the sentence.
-            if prevSt is not None and prevSt.getCharOffset()+len(prevSt.text) != st.getCharOffset():
+            offset = st.getCharOffset()
+            if prevEnd is not None and prevEnd != offset:
                 text += " "
             text += st.text
-            prevSt = st
+            prevEnd = offset+len(st.text)
             
         if getType:
             text += " ("+self.type.name+")"
@@ -583,7 +769,10 @@ class Entity (BIObject,BIXMLWriteable):
         # either consequtive or separated by a single space in the
         # original text.
 
-        offsets =[(st.getCharOffset(), st.getCharOffset()+len(st.text)-1) for st in self.subTokens]
+        offsets = []
+        for st in self.subTokens:
+            o = st.getCharOffset()
+            offsets.append((o, o+len(st.text)-1))
 
         text = self.subTokens[0].token.sentence.origText
         merged, start, end = [], offsets[0][0], offsets[0][1]
@@ -659,6 +848,11 @@ class NestedSubtoken (BIObject):
     def __init__(self,oStack,attrs,**args):
         global currentSentence
         BIObject.__init__(self,attrs)
+        if currentSentence.sentences is not None:
+            subToken=currentSentence.sentences.subTokensById.get(attrs["id"])
+            if subToken is not None and subToken.token.sentence is currentSentence:
+                oStack[-1].addSubToken(subToken)
+                return
         idComponents=attrs["id"].split(".")
         if len(idComponents)==4: #New ID numbering
             del idComponents[0] #Remove the "st" in subtokenIDs
@@ -695,14 +889,38 @@ class Formula (BIObject,BIXMLWriteable):
     can be either a relationship (L{RelNode}), or an entity L{EntityNode}.
     The C{Formula} instance holds the root node of the formula tree.
 
+    The tree is also kept flattened: the nodes are numbered in preorder, which is
+    the order of the XML file, so that every node comes after its parent and the
+    descendants of node C{i} are the nodes C{i+1} to C{subtreeStops[i]-1}. The
+    arrays are filled in as the nodes are parsed and are indexed by the node number.
+
     @ivar rootNode: The root node of the formula.
     @type rootNode: L{RelNode}
+    @ivar nodes: The formula nodes in preorder. C{nodes[0]} is the root node.
+    @type nodes: list
+    @ivar parents: The number of the parent of each node, -1 for the root node.
+    @type parents: array of integers
+    @ivar depths: The depth of each node, 0 for the root node.
+    @type depths: array of integers
+    @ivar subtreeStops: The number following the last node of the subtree rooted in each node.
+    @type subtreeStops: array of integers
+    @ivar predicateIds: The L{predicateId<RelNode>} of each node, -1 for entity nodes.
+    @type predicateIds: array of integers
+    @ivar entityIndices: The position of the text binding entity of each node in
+    C{sentence.entities}, -1 if the node has none.
+    @type entityIndices: array of integers
     """
 
     XMLTag="formula"
 
     def __init__(self,oStack,attrs,**args):
         BIObject.__init__(self,attrs)
+        self.nodes=[]
+        self.parents=array.array("l")
+        self.depths=array.array("l")
+        self.subtreeStops=array.array("l")
+        self.predicateIds=array.array("l")
+        self.entityIndices=array.array("l")
         oStack[-1].addFormula(self)
 
     def addArgument(self,root):
@@ -713,6 +931,47 @@ class Formula (BIObject,BIXMLWriteable):
         """
         self.rootNode=root
 
+    def addNode(self,node,parent):
+        """
+        Appends a node to the flattened formula tree. It is called by C{FormulaNode.__init__}
+        during XML parsing, when the text binding entity and the predicate of the node are known.
+        @param node: The node to be added.
+        @type node: L{FormulaNode}
+        @param parent: The number of the parent of the node, -1 for the root node.
+        @type parent: integer
+        @return: The number of the node.
+        @rtype: integer
+        """
+        index=len(self.nodes)
+        self.nodes.append(node)
+        self.parents.append(parent)
+        self.depths.append(self.depths[parent]+1 if parent>=0 else 0)
+        self.subtreeStops.append(index+1)
+        while parent>=0: #The node extends the subtrees of all its ancestors
+            self.subtreeStops[parent]=index+1
+            parent=self.parents[parent]
+        self.predicateIds.append(node.predicateId if node.isPredicate() else -1)
+        self.entityIndices.append(self.sentence.entities.index(node.entity) if node.entity else -1)
+        return index
+
+    def getChildren(self,index):
+        """
+        Returns the numbers of the children of node C{index}, in argument order.
+        """
+        result=[]
+        child=index+1
+        stop=self.subtreeStops[index]
+        while child<stop:
+            result.append(child)
+            child=self.subtreeStops[child]
+        return result
+
+    def getDepth(self):
+        """
+        Returns the largest number of relationship nodes on a path from the root node to a leaf.
+        """
+        return max([d+1 for d,n in zip(self.depths,self.nodes) if n.isPredicate()] or [0])
+
     def writeXMLNestedItems(self,out,indent):
         self.rootNode.writeXML(out,indent)
 
@@ -727,12 +986,17 @@ class FormulaNode (BIObject,BIXMLWriteable):
     @ivar entity: The L{Entity} used as text binding for this formula node. In the rare cases when the formula node
     does not have a text binding, the C{entity} is set to C{None}.
     @type entity: L{Entity}
+    @ivar formula: The formula to which this node belongs.
+    @type formula: L{Formula}
+    @ivar index: The number of this node in the flattened tree of C{formula}.
+    @type index: integer
     """
     
     def __init__(self,oStack,attrs,**args):
         BIObject.__init__(self,attrs)
         self.arguments=[]
-        self.myArgumentPosition=oStack[-1].addArgument(self)
+        parent=oStack[-1]
+        self.myArgumentPosition=parent.addArgument(self)
         self.entity=None
         tbEntityId=None
         try:
@@ -746,6 +1010,12 @@ class FormulaNode (BIObject,BIXMLWriteable):
         if tbEntityId:
             self.setEntity(tbEntityId)
             self.entity.registerFormulaNode(self) #Inform the entity it's being used in a formula
+        if isinstance(parent,Formula):
+            self.formula=parent
+            self.index=parent.addNode(self,-1)
+        else:
+            self.formula=parent.formula
+            self.index=parent.formula.addNode(self,parent.index)
 
     def addArgument(self,argument):
         """
@@ -802,12 +1072,10 @@ class FormulaNode (BIObject,BIXMLWriteable):
         Return a list of all entities used as a text binding in this node and, if C{recursive==True}, in the
         subtree rooted by this node.
         """
-        result = []
-        if self.entity:
-            result.append(self.entity)
-        if recursive:
-            result.extend(j for i in self.arguments for j in i.getEntities(True))
-        return result
+        if not recursive:
+            return [self.entity] if self.entity else []
+        entities=self.formula.sentence.entities
+        return [entities[e] for e in self.formula.entityIndices[self.index:self.formula.subtreeStops[self.index]] if e>=0]
         
 class RelNode (FormulaNode):
     """
@@ -817,17 +1085,21 @@ class RelNode (FormulaNode):
 
     @ivar predicate: A L{Predicate<OntologyClasses.Predicate>} instance representing the predicate of the relationship.
     @type predicate: L{OntologyClasses.Predicate}
+    @ivar predicateId: The id of the predicate in the I{Relationship} ontology, -1 if the predicate is unknown.
+    @type predicateId: integer
     """
 
     XMLTag="relnode"
 
     def __init__(self,oStack,parser,attrs,**args):
-        FormulaNode.__init__(self,oStack,attrs)
         predicateName=attrs["predicate"]
+        self.predicateId=-1
         try:
             self.predicate=parser.bioinfer.ontologies["Relationship"].findPredicate(predicateName)
+            self.predicateId=self.predicate.index
         except:
             print("Unknown predicate",predicateName)
+        FormulaNode.__init__(self,oStack,attrs) #Registers the node in the formula, which needs the predicate
 
 
     def computeXMLArgs(self):
@@ -878,8 +1150,22 @@ class Linkage (BIObject,BIXMLWriteable):
     may have several linkages, which are distinguished by linkage type. The type as annotated
     by the corpus annotators has type \"raw\"
 
+    The links are stored as arrays indexed by the link number, in the order of the XML file.
+    The L{Link} objects are only created, as instances of the class variable C{linkCls}, when
+    C{links} is first used. Links should be added with L{addLink}, which keeps the arrays up to date.
+
     @ivar links: A list of links in no particular order. The order of the links in the XML file is used.
     @type links: list
+    @ivar token1s: The position of the first token of each link in C{sentence.tokens}.
+    @type token1s: array of integers
+    @ivar token2s: The position of the second token of each link in C{sentence.tokens}.
+    @type token2s: array of integers
+    @ivar typeIds: The id of the link type of each link, see L{getLinkTypes}.
+    @type typeIds: array of integers
+    @ivar categoryIds: The id of the comma-separated categories of each link, see L{getCategories}.
+    @type categoryIds: array of integers
+    @ivar macros: 1 for the macro links, 0 for the others.
+    @type macros: array of integers
     @ivar sentence: The sentence to which this linkage belongs
     @type sentence: L{Sentence}
     @ivar type: The type of the linkage as a string.
@@ -890,6 +1176,7 @@ class Linkage (BIObject,BIXMLWriteable):
 
     XMLTag="linkage"
     persistentAttrs=["type"]
+    linkCls=Link
 
     def __init__(self,oStack,attrs,**args):
         BIObject.__init__(self,attrs)
@@ -898,10 +1185,36 @@ class Linkage (BIObject,BIXMLWriteable):
             self.reliability=attrs["reliability"]
         except KeyError:
             self.reliability=None
-        self.links=[]
+        self.token1s=array.array("l")
+        self.token2s=array.array("l")
+        self.typeIds=array.array("l")
+        self.categoryIds=array.array("l")
+        self.macros=array.array("b")
+        self.linkTypeIds={}
+        self.categoryStringIds={}
+        self.linkObjects=None
+        self.adjacency=None
         self.sentence=oStack[-2]
         oStack[-1].addLinkage(self)
 
+    def appendRow(self,token1,token2,linkType,category):
+        """
+        Appends a link to the link arrays.
+
+        @param token1: The position of the first token in C{sentence.tokens}.
+        @param token2: The position of the second token in C{sentence.tokens}.
+        @param linkType: The link type.
+        @type linkType: string
+        @param category: The comma-separated categories of the link.
+        @type category: string
+        """
+        self.token1s.append(token1)
+        self.token2s.append(token2)
+        self.typeIds.append(self.linkTypeIds.setdefault(linkType,len(self.linkTypeIds)))
+        self.categoryIds.append(self.categoryStringIds.setdefault(category,len(self.categoryStringIds)))
+        self.macros.append("macro" in category.split(","))
+        self.adjacency=None
+
     def addLink(self,link):
         """
         Add a new link to the linkage.
@@ -909,8 +1222,85 @@ class Linkage (BIObject,BIXMLWriteable):
         @param link: The link to be added
         @type link: L{Link}
         """
+        links=self.links
         link.linkage=self
-        self.links.append(link)
+        self.appendRow(link.token1.sequence,link.token2.sequence,link.type,",".join(link.category))
+        links.append(link)
+
+    def getLinks(self):
+        """
+        Returns the list of the L{Link} objects, creating them from the link arrays on the first call.
+        """
+        if self.linkObjects is None:
+            self.linkObjects=[self.linkCls.fromRow(self,i) for i in range(len(self.token1s))]
+        return self.linkObjects
+
+    links=property(getLinks)
+
+    def getLinkTypes(self):
+        """
+        Returns the link types of this linkage as a list indexed by the ids in C{typeIds}.
+        """
+        return list(self.linkTypeIds)
+
+    def getCategories(self):
+        """
+        Returns the comma-separated link categories of this linkage as a list indexed by the ids in C{categoryIds}.
+        """
+        return list(self.categoryStringIds)
+
+    def getAdjacency(self):
+        """
+        Returns the links as an undirected graph over the tokens in compressed sparse row form,
+        built on the first call. The graph is a tuple C{(offsets, neighbours, links)} of arrays:
+        the neighbours of the token at position C{t} of C{sentence.tokens} are
+        C{neighbours[offsets[t]:offsets[t+1]]}, connected to it by the links whose numbers
+        are in C{links[offsets[t]:offsets[t+1]]}.
+        """
+        if self.adjacency is None:
+            counts=[0]*(len(self.sentence.tokens)+1)
+            for t in itertools.chain(self.token1s,self.token2s):
+                counts[t+1]+=1
+            offsets=array.array("l",itertools.accumulate(counts))
+            free=offsets[:-1] #The next unused position of each token
+            neighbours=array.array("l",[0])*offsets[-1]
+            links=array.array("l",[0])*offsets[-1]
+            for i,(t1,t2) in enumerate(zip(self.token1s,self.token2s)):
+                neighbours[free[t1]]=t2
+                links[free[t1]]=i
+                free[t1]+=1
+                neighbours[free[t2]]=t1
+                links[free[t2]]=i
+                free[t2]+=1
+            self.adjacency=(offsets,neighbours,links)
+        return self.adjacency
+
+    def shortestPath(self,token1,token2):
+        """
+        Returns the positions in C{sentence.tokens} of the tokens on a shortest path of links from the
+        token at position C{token1} to the token at position C{token2}, both included. The direction
+        of the links is ignored.
+
+        @return: A list of token positions, or C{None} if the tokens are not connected.
+        """
+        offsets,neighbours,links=self.getAdjacency()
+        previous={token1:-1}
+        frontier=[token1]
+        while frontier and token2 not in previous:
+            nextFrontier=[]
+            for t in frontier:
+                for n in neighbours[offsets[t]:offsets[t+1]]:
+                    if n not in previous:
+                        previous[n]=t
+                        nextFrontier.append(n)
+            frontier=nextFrontier
+        if token2 not in previous:
+            return None
+        path=[token2]
+        while path[-1]!=token1:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path
 
     def writeXMLNestedItems(self,out,indent):
         for l in self.links:
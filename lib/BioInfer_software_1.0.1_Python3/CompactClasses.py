@@ -0,0 +1,83 @@
+# BioInfer supporting software tools
+# Copyright (C) 2006 University of Turku
+#
+# This is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this software in the file COPYING. If not, see
+# http://www.gnu.org/licenses/lgpl.html
+
+"""
+C{__slots__} based variants of the most numerous corpus classes.
+
+The classes in L{BasicClasses} keep their instance variables in a per-instance
+C{__dict__}. The compact variants defined here have the same methods and instance
+variables, but store the variables in fixed slots, which takes considerably less
+memory per instance. They are selected through the usual C{*Cls} mechanism of the
+parser::
+
+  parser=BIParser(**compactClasses)
+
+The compact classes cannot be given instance variables which are not listed in their
+C{__slots__}. Code that attaches its own variables to corpus objects should subclass
+them and extend C{__slots__}, or keep using the classes in L{BasicClasses}.
+"""
+
+from BasicClasses import (BIObject, BIXMLWriteable,
+                          Sentence, Token, SubToken, Entity, Link, Linkage,
+                          FormulaNode, RelNode, EntityNode)
+
+def compactClass(cls,bases,slots):
+    """
+    Returns a variant of C{cls} which stores its instance variables in C{__slots__}.
+
+    @param cls: The class whose methods and class variables are copied.
+    @param bases: The base classes of the new class. They must not have an instance C{__dict__}.
+    @param slots: The names of the instance variables of the new class, in addition to those of C{bases}.
+    @type slots: tuple of strings
+    """
+    namespace=dict((k,v) for (k,v) in cls.__dict__.items() if k not in ("__dict__","__weakref__"))
+    name="Compact"+cls.__name__
+    namespace.update(__slots__=slots,__module__=__name__,__qualname__=name)
+    return type(name,bases,namespace)
+
+CompactSentence=compactClass(Sentence,(BIObject,BIXMLWriteable),
+                             ("tokens","id","origText","entitiesById","entities",
+                              "formulas","linkages","tokenSequence","subTokenSequence",
+                              "offsetTables","sentences"))
+CompactToken=compactClass(Token,(BIObject,BIXMLWriteable),
+                          ("subTokens","id","charOffset","sequence","sentence"))
+CompactSubToken=compactClass(SubToken,(BIObject,BIXMLWriteable),
+                             ("token","text","id","sequence"))
+CompactEntity=compactClass(Entity,(BIObject,BIXMLWriteable),
+                           ("sentence","id","subTokens","nestedEntities","formulaNodesUsingMe",
+                            "type","typeId","annotation","other"))
+CompactLink=compactClass(Link,(BIObject,BIXMLWriteable),
+                         ("token1","token2","category","type","linkage"))
+CompactLinkage=compactClass(Linkage,(BIObject,BIXMLWriteable),
+                            ("type","reliability","token1s","token2s","typeIds","categoryIds","macros",
+                             "linkTypeIds","categoryStringIds","linkObjects","adjacency","sentence"))
+CompactLinkage.linkCls=CompactLink
+CompactFormulaNode=compactClass(FormulaNode,(BIObject,BIXMLWriteable),
+                                ("arguments","myArgumentPosition","entity","parent",
+                                 "formula","index"))
+CompactRelNode=compactClass(RelNode,(CompactFormulaNode,),("predicate","predicateId"))
+CompactEntityNode=compactClass(EntityNode,(CompactFormulaNode,),())
+
+compactClasses={"sentenceCls":CompactSentence,
+                "tokenCls":CompactToken,
+                "subtokenCls":CompactSubToken,
+                "entityCls":CompactEntity,
+                "linkageCls":CompactLinkage,
+                "relnodeCls":CompactRelNode,
+                "entitynodeCls":CompactEntityNode,
+                }
+"""The C{*Cls} assignments selecting the compact classes, to be passed to the L{BIParser<BIParser.BIParser>} constructor."""
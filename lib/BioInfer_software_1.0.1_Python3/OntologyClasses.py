@@ -22,6 +22,14 @@ class Ontology (BIObject, BIXMLWriteable):
     The representation of an ontology. Instances of C{Ontology} hold
     the root C{OntologyNode} of the ontology tree. For simplicity, we
     call ontology items I{predicates}.
+
+    Every predicate is given a dense integer id, its C{index}, in the order
+    in which the predicates are registered, that is, in the order of the XML file.
+
+    @ivar predicates: Dictionary of the predicates, where the predicate name serves as key.
+    @type predicates: dictionary
+    @ivar predicateList: The predicates, indexed by their C{index}.
+    @type predicateList: list
     """
     
     XMLTag="ontology"
@@ -33,17 +41,34 @@ class Ontology (BIObject, BIXMLWriteable):
         oStack[-1].addOntology(self)
         oStack[-1].currentOntology=self
         self.predicates={}
+        self.predicateList=[]
         self.instances={}
 
     def addSpecialization(self,spec):
         self.rootNode=spec
 
     def registerPredicate(self,pred):
+        previous=self.predicates.get(pred.name)
+        if previous is None:
+            pred.index=len(self.predicateList)
+            self.predicateList.append(pred)
+        else: #a redefinition replaces the predicate, but keeps its id
+            pred.index=previous.index
+            self.predicateList[pred.index]=pred
         self.predicates[pred.name]=pred
 
     def findPredicate(self,name):
         return self.predicates[name]
 
+    def findPredicateById(self,index):
+        return self.predicateList[index]
+
+    def getPredicateNames(self):
+        """
+        Returns the names of the predicates, indexed by the predicate ids.
+        """
+        return [p.name for p in self.predicateList]
+
     def writeXMLNestedItems(self,out,indent):
         self.rootNode.writeXML(out,indent)
 
@@ -0,0 +1,233 @@
+# BioInfer supporting software tools
+# Copyright (C) 2006 University of Turku
+#
+# This is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this software in the file COPYING. If not, see
+# http://www.gnu.org/licenses/lgpl.html
+
+import gc
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from optparse import OptionParser,OptionGroup
+
+from BIParser import BIParser,FastBIParser,etree
+from BISnapshot import compileSnapshot
+from BIParallel import parseParallel,compileSnapshotParallel
+from BIWriter import writeXML
+from CompactClasses import compactClasses
+
+def bestTime(func,repeat):
+    """
+    Calls C{func} C{repeat} times and returns the shortest wall clock time in seconds.
+    """
+    best=None
+    for i in range(repeat):
+        start=time.perf_counter()
+        func()
+        elapsed=time.perf_counter()-start
+        if best is None or elapsed<best:
+            best=elapsed
+    return best
+
+def scaleCorpus(xmlFileName,factor,outFileName):
+    """
+    Writes a synthetic corpus consisting of the sentences of C{xmlFileName} repeated C{factor}
+    times. The sentence ids of the copies are suffixed with the copy number to keep them unique.
+    """
+    with open(xmlFileName,"rb") as f:
+        data=f.read()
+    start=data.index(b">",data.index(b"<sentences"))+1
+    end=data.rindex(b"</sentences>")
+    body=data[start:end]
+    idPattern=re.compile(rb'(<sentence\s[^>]*?\bid=")([^"]*)"')
+    with open(outFileName,"wb") as out:
+        out.write(data[:start])
+        for copy in range(factor):
+            if copy==0:
+                out.write(body)
+            else:
+                out.write(idPattern.sub(lambda m: m.group(1)+m.group(2)+b".%d\""%copy,body))
+        out.write(data[end:])
+
+def benchmarkParsers(xmlFileName,repeat):
+    """
+    Times parsing C{xmlFileName} with the SAX based L{BIParser} and the L{FastBIParser} backends.
+
+    @return: A list of (name, seconds) pairs.
+    """
+    def run(makeParser):
+        def parse():
+            with open(xmlFileName,"rb") as f:
+                makeParser().parse(f)
+        return parse
+    results=[("sax",bestTime(run(BIParser),repeat)),
+             ("expat",bestTime(run(lambda: FastBIParser(backend="expat")),repeat))]
+    if etree is not None:
+        results.append(("lxml",bestTime(run(lambda: FastBIParser(backend="lxml")),repeat)))
+    return results
+
+def accessAttributes(subTokens,links):
+    """
+    Reads the attributes of every subtoken and link of the object model benchmark.
+    """
+    for st in subTokens:
+        st.text, st.sequence, st.token.charOffset
+    for l in links:
+        l.token1.sequence, l.token2.sequence, l.type
+
+def measureObjectModel(xmlFileName,classes,repeat):
+    """
+    Parses C{xmlFileName} with the given C{classes} and measures the memory held by the
+    parsed corpus and the time of L{accessAttributes}. The corpus is released on return.
+
+    @return: A (bytes, seconds) pair.
+    """
+    gc.collect()
+    tracemalloc.start()
+    parser=FastBIParser(**classes)
+    parser.parse(xmlFileName)
+    gc.collect()
+    size=tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    sentences=parser.bioinfer.sentences.sentences
+    subTokens=[st for s in sentences for t in s.tokens for st in t.subTokens]
+    links=[l for s in sentences for k in s.linkages.values() for l in k.links]
+    return size,bestTime(lambda: accessAttributes(subTokens,links),repeat)
+
+def benchmarkObjectModel(xmlFileName,repeat):
+    """
+    Compares the dict based classes of L{BasicClasses} with the C{__slots__} based
+    classes of L{CompactClasses}: the memory held by the parsed corpus, and the time of
+    reading the attributes of every subtoken and link.
+
+    @return: A list of (name, bytes, seconds) triples.
+    """
+    return [(name,)+measureObjectModel(xmlFileName,classes,repeat)
+            for name,classes in (("dict",{}),("slots",compactClasses))]
+
+def benchmarkParallel(xmlFileName,repeat,maxProcesses):
+    """
+    Times the parallel parse and the parallel snapshot compilation of C{xmlFileName} with
+    1 to C{maxProcesses} worker processes, against the serial L{FastBIParser} and L{compileSnapshot}.
+
+    @return: A list of (processes, parse seconds, compile seconds) triples, where the serial
+    baseline has 0 processes.
+    """
+    snapshotFileName=os.path.join(os.path.dirname(xmlFileName),"benchmark.snap")
+    results=[(0,bestTime(lambda: FastBIParser().parse(xmlFileName),repeat),
+              bestTime(lambda: compileSnapshot(xmlFileName,snapshotFileName),repeat))]
+    for n in range(1,maxProcesses+1):
+        results.append((n,bestTime(lambda: parseParallel(xmlFileName,n),repeat),
+                        bestTime(lambda: compileSnapshotParallel(xmlFileName,snapshotFileName,n),repeat)))
+    os.remove(snapshotFileName)
+    return results
+
+def benchmarkWriter(xmlFileName,repeat):
+    """
+    Times a parse-write-parse round trip of C{xmlFileName}, writing the corpus with
+    L{BIXMLWriteable.writeXML<BasicClasses.BIXMLWriteable.writeXML>} and with the
+    buffered L{writeXML<BIWriter.writeXML>}, and checks that both write the same file.
+
+    @return: A list of (name, seconds) pairs of the write times, followed by the round trip times.
+    """
+    parser=FastBIParser()
+    parser.parse(xmlFileName)
+    outFileNames={}
+    def run(name,write):
+        outFileNames[name]=os.path.join(os.path.dirname(xmlFileName),"roundtrip.%s.xml"%name)
+        def writeFile():
+            with open(outFileNames[name],"wt") as out:
+                write(parser.bioinfer,out)
+        return writeFile
+    writers=[("print",lambda b,out: b.writeXML(out,0,includeOntologies=True)),
+             ("buffered",lambda b,out: writeXML(b,out,includeOntologies=True))]
+    results=[(name,bestTime(run(name,write),repeat)) for name,write in writers]
+    with open(outFileNames["print"],"rb") as f1, open(outFileNames["buffered"],"rb") as f2:
+        if f1.read()!=f2.read():
+            raise AssertionError("The buffered writer output differs from BIXMLWriteable.writeXML")
+    def roundTrip(write):
+        def parseWriteParse():
+            first=FastBIParser()
+            first.parse(xmlFileName)
+            out=io.StringIO()
+            write(first.bioinfer,out)
+            FastBIParser().parse(io.BytesIO(out.getvalue().encode("utf-8")))
+        return parseWriteParse
+    results+=[(name,bestTime(roundTrip(write),repeat)) for name,write in writers]
+    for fileName in outFileNames.values():
+        os.remove(fileName)
+    return results
+
+def printResults(title,results):
+    print(title)
+    base=results[0][1]
+    for name,seconds in results:
+        print("  %-10s %8.3fs  %5.2fx"%(name,seconds,base/seconds))
+
+if __name__=="__main__":
+    usage="\n\n%prog -h or --help\n%prog [OPTIONS]\n\nBenchmarks the BioInfer parsing tools on the corpus XML file and on a\nsynthetic corpus made by replicating its sentences."
+    optionParser=OptionParser(usage)
+
+    group1=OptionGroup(optionParser,"*** Standard usage options ***")
+    group1.add_option("-b","--bioInferFile",action="store",dest="bioinferXmlFile",metavar="FILENAME",default=None,help="The XML file holding the BioInfer corpus. This parameter is compulsory.")
+    group1.add_option("-x","--scale",action="store",type="int",dest="scale",default=10,help="Replication factor of the synthetic corpus (default 10). Use 1 to skip it.")
+    group1.add_option("-r","--repeat",action="store",type="int",dest="repeat",default=3,help="Number of timed runs; the best one is reported (default 3).")
+    optionParser.add_option_group(group1)
+
+    group2=OptionGroup(optionParser,"*** Benchmarks ***")
+    group2.add_option("--parsers",action="store_true",dest="parsers",default=False,help="Compare the SAX parser with the expat and lxml backends.")
+    group2.add_option("--parallel",action="store_true",dest="parallel",default=False,help="Measure the scaling of the parallel parse and snapshot compilation from 1 to --processes worker processes.")
+    group2.add_option("-j","--processes",action="store",type="int",dest="processes",default=os.cpu_count() or 1,help="The largest number of worker processes for --parallel (default: the number of CPUs).")
+    group2.add_option("--writer",action="store_true",dest="writer",default=False,help="Compare writing the corpus with BIXMLWriteable.writeXML and with the buffered BIWriter, and time the parse-write-parse round trip.")
+    group2.add_option("--objects",action="store_true",dest="objects",default=False,help="Compare the memory use and attribute access time of the dict based and the compact __slots__ based classes.")
+    optionParser.add_option_group(group2)
+
+    options,args=optionParser.parse_args()
+
+    if not options.bioinferXmlFile:
+        print("You must specify the --bioInferFile (-b) option.", file=sys.stderr)
+        optionParser.print_help()
+        sys.exit(-1)
+
+    corpora=[(options.bioinferXmlFile,"corpus")]
+    tmpDir=tempfile.TemporaryDirectory()
+    if options.scale>1:
+        scaledFileName=os.path.join(tmpDir.name,"scaled.xml")
+        scaleCorpus(options.bioinferXmlFile,options.scale,scaledFileName)
+        corpora.append((scaledFileName,"%dx synthetic corpus"%options.scale))
+
+    for fileName,title in corpora:
+        if options.parsers:
+            printResults("Parsing, %s:"%title,benchmarkParsers(fileName,options.repeat))
+        if options.writer:
+            results=benchmarkWriter(fileName,options.repeat)
+            printResults("Writing, %s:"%title,results[:2])
+            printResults("Parse-write-parse, %s:"%title,results[2:])
+        if options.objects:
+            results=benchmarkObjectModel(fileName,options.repeat)
+            print("Object model, %s:"%title)
+            for name,size,seconds in results:
+                print("  %-10s %8.1f MB %8.3fs attribute access"%(name,size/2.0**20,seconds))
+            print("  memory reduction %.1f%%, access speedup %.2fx"%(100.0*(1-results[1][1]/results[0][1]),results[0][2]/results[1][2]))
+        if options.parallel:
+            results=benchmarkParallel(fileName,options.repeat,options.processes)
+            print("Parallel parsing, %s, %d CPUs:"%(title,os.cpu_count() or 1))
+            print("  %-10s %9s %7s %9s %7s"%("processes","parse","","snapshot",""))
+            for n,parseSeconds,compileSeconds in results:
+                print("  %-10s %8.3fs %6.2fx %8.3fs %6.2fx"%(n or "serial",parseSeconds,results[0][1]/parseSeconds,compileSeconds,results[0][2]/compileSeconds))
+    tmpDir.cleanup()
@@ -16,7 +16,8 @@
 # http://www.gnu.org/licenses/lgpl.html
 
 import sys
-from BIParser import BIParser
+from BIParser import FastBIParser
+from BIIndex import loadIndex
 from optparse import OptionParser,OptionGroup
 
 def printText(sentence):
@@ -52,9 +53,10 @@ def printTokenOffsets(sentence):
     @type sentence: L{BasicClasses.Sentence}
     """
 
+    tokenOffsets = sentence.getOffsetTables()[0]
     for i, t in enumerate(sentence.tokens):
         text     = t.getText()
-        from_off = int(t.charOffset)
+        from_off = tokenOffsets[i]
         to_off   = from_off + len(text) - 1
         print("token(%d, [%d-%d], '%s')" % (i, from_off, to_off, text), end=' ')
 
@@ -76,18 +78,19 @@ def printLinkageDependencies(sentence, linkage):
     if linkage not in sentence.linkages:
         print("missing '%s' linkage for sentece %s" % (linkage, sentence.id), file=sys.stderr)
         sys.exit(1)
-    links = sentence.linkages[linkage].links
+    links = sentence.linkages[linkage]
+    link_types = links.getLinkTypes()
 
-    for l in links:
-        if l.type is not None:
-            type_string = "[%s]" % l.type
+    for token1, token2, type_id, macro in zip(links.token1s, links.token2s, links.typeIds, links.macros):
+        if link_types[type_id] is not None:
+            type_string = "[%s]" % link_types[type_id]
         else:
             type_string = ""
 
-        if l.macro:
+        if macro:
             type_string = "[macro]"
 
-        print("%s-%s%s" % (l.token1.sequence, l.token2.sequence, type_string), end=' ')
+        print("%s-%s%s" % (token1, token2, type_string), end=' ')
 
 def printBasicDependencies(sentence):
     """
@@ -161,14 +164,18 @@ def relationshipToString(r):
 
     s = "%s([%s], " % (r.predicate.name, ",".join(["%d-%d" % a for a in st_offsets]))
 
-    # recursively build the string for the included entites and relationships
-    for a in r.arguments:
+    # recursively build the string for the included entites and relationships,
+    # the children of r in the flattened formula
+    f = r.formula
+    children = f.getChildren(r.index)
+    for i in children:
+        a = f.nodes[i]
         if a.isEntity():
             s += a.entity.id
         else:
             s += relationshipToString(a)
 
-        if a != r.arguments[-1]:
+        if i != children[-1]:
             s += ", "
 
     s += ")"
@@ -228,6 +235,14 @@ if __name__=="__main__":
         group2.add_option(a[2],a[3],dest=a[0],help=a[4], default=0, action="store_true")
     optionParser.add_option_group(group2)
 
+    group3=OptionGroup(optionParser,"*** Query options ***","Extract only the sentences satisfying all of the given conditions. The sentences are looked up in an index, which is built and saved next to the corpus file on first use.")
+    group3.add_option("--predicate",action="store",dest="predicate",metavar="NAME",default=None,help="The sentence has a relationship with the predicate NAME.")
+    group3.add_option("--arguments",action="store",dest="arguments",metavar="LABELS",default=None,help="Together with --predicate: the relationship has arguments with these comma-separated labels, which are entity type names or, for nested relationships, predicate names.")
+    group3.add_option("--entityType",action="append",dest="entityTypes",metavar="NAME",default=[],help="The sentence has an entity of the type NAME. Can be given several times.")
+    group3.add_option("--depth",action="store",type="int",dest="depth",metavar="N",default=None,help="The sentence has a formula with N levels of nested relationships.")
+    group3.add_option("--index",action="store",dest="indexFile",metavar="FILENAME",default=None,help="The index file. Defaults to the corpus file name with the suffix .idx.")
+    optionParser.add_option_group(group3)
+
     options,args=optionParser.parse_args()
 
 
@@ -244,6 +259,10 @@ if __name__=="__main__":
         optionParser.print_help()
         sys.exit(1)
 
+    if options.arguments and not options.predicate:
+        print("The --arguments option requires --predicate.", file=sys.stderr)
+        sys.exit(1)
+
     try:
         bioinferFile=open(options.bioinferXmlFile,"rt")
     except IOError as e:
@@ -251,18 +270,26 @@ if __name__=="__main__":
         sys.exit(1)
 
 
-    # parse the XML file
-    parser=BIParser()
-    parser.parse(bioinferFile)
-    bioinferFile.close()
-
-
-    # for each sentence and all action for which the option is set
-    # (a[0] is true), print the sentence and action identifiers,
-    # invoke the action function (action[1]), and finally print
-    # a newline.    
-    for s in parser.bioinfer.sentences.sentences:
+    # parse the XML file incrementally and, for each sentence and
+    # all action for which the option is set (a[0] is true), print
+    # the sentence and action identifiers, invoke the action function
+    # (action[1]), and finally print a newline. Sentences are dropped
+    # once printed, so the memory use does not grow with the corpus.
+    if options.predicate or options.entityTypes or options.depth is not None:
+        # parse only the sentences matching the query
+        bioinferFile.close()
+        index=loadIndex(options.bioinferXmlFile,options.indexFile)
+        matches=index.query(predicate=options.predicate,
+                            arguments=options.arguments.split(",") if options.arguments else (),
+                            entityTypes=options.entityTypes,
+                            depth=options.depth)
+        sentences=index.iterSentences(options.bioinferXmlFile,matches)
+    else:
+        parser=FastBIParser()
+        sentences=parser.iterparse(bioinferFile,dropSentences=True)
+    for s,ontologies in sentences:
         for action in [a for a in actions if options.__dict__[a[0]]]:
             print("%s:%s:" % (s.id, action[0]), end=' ')
             action[1](s)
             print()
+    bioinferFile.close()
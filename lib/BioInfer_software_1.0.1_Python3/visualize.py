@@ -42,9 +42,106 @@ except ImportError:
 import tkinter.filedialog as fd
 import tkinter.messagebox as mb
 import tkinter.simpledialog as sd
-import functools
+import os
+import queue
+import collections
+import threading
+import time
 from tkinter.font import Font
-from BIParser import BIParser
+from BIParser import BIParser,FastBIParser
+
+def assignLanes(intervals,gap=1):
+    """
+    Assigns horizontal intervals to lanes so that the intervals in a lane do not
+    overlap. Every interval goes to the first lane where it fits, in the given order.
+
+    @param intervals: A list of (key, x1, x2) triples.
+    @param gap: Intervals closer to each other than this are considered overlapping.
+    @return: A dictionary from the keys to the lanes, numbered from 1.
+    """
+    lanes = [] # the intervals placed in each lane
+    result = {}
+    for key,x1,x2 in intervals:
+        for lane,placed in enumerate(lanes):
+            if all(x1 > p2+gap or p1 > x2+gap for p1,p2 in placed):
+                placed.append((x1,x2))
+                break
+        else:
+            lane = len(lanes)
+            lanes.append([(x1,x2)])
+        result[key] = lane+1
+    return result
+
+class CanvasLayout(object):
+    """
+    The items of a canvas, recorded so that they can be drawn again with
+    L{replay} without computing their positions.
+
+    @ivar items: The (type, coordinates, options) triples of the items, in the stacking order.
+    @ivar scrollregion: The scroll region of the canvas.
+    @ivar state: The state of the view needed with the items, see L{DepView.saveLayout} and L{RelView.saveLayout}.
+    """
+
+    def __init__(self,canvas,state=None):
+        """
+        Records the items of C{canvas}.
+        """
+        self.items = []
+        for item in canvas.find_all():
+            options = {}
+            for name,config in canvas.itemconfigure(item).items():
+                if config[4] != config[3]:
+                    options[name] = config[4]
+            # "current" is maintained by Tk for the item under the mouse
+            options["tags"] = tuple(t for t in canvas.gettags(item) if t != CURRENT)
+            self.items.append((canvas.type(item),canvas.coords(item),options))
+        self.scrollregion = canvas.cget("scrollregion")
+        self.state = state
+
+    def replay(self,canvas):
+        """
+        Draws the recorded items on C{canvas}, which should be empty.
+
+        @return: The ids of the new items, in the recorded order.
+        """
+        canvas.configure(scrollregion=self.scrollregion)
+        return [getattr(canvas,"create_"+kind)(*coords,**options)
+                for kind,coords,options in self.items]
+
+
+class LayoutCache(object):
+    """
+    A least recently used cache of the layouts of the shown sentences.
+    """
+
+    def __init__(self,size=32):
+        """
+        @param size: The maximum number of cached sentences.
+        """
+        self.size = size
+        self.layouts = collections.OrderedDict()
+
+    def __contains__(self,key):
+        return key in self.layouts
+
+    def get(self,key):
+        """
+        Returns the layouts cached for C{key}, or C{None}.
+        """
+        layouts = self.layouts.get(key)
+        if layouts is not None:
+            self.layouts.move_to_end(key)
+        return layouts
+
+    def put(self,key,layouts):
+        self.layouts[key] = layouts
+        self.layouts.move_to_end(key)
+        while len(self.layouts) > self.size:
+            self.layouts.popitem(last=False)
+
+    def clear(self):
+        self.layouts.clear()
+
 
 class TextAsListbox(Frame):
     """
@@ -318,6 +415,7 @@ class DepView(Frame):
 
         self.default_link_type = ""
         self.entity_reserve_height = 100
+        # horizontal extent of the rectangles of each entity, by entity id
         self.entity_rect_x = {}
         self.entity_rect_width = {}
         self.entity_rect_color = "#006ab3"
@@ -349,6 +447,9 @@ class DepView(Frame):
 
         self.canvas.bind("<Enter>", self.focus)
 
+        # hidden canvas for computing layouts in the background
+        self.scratch = Canvas(self)
+
     def focus(self,event):
         """
         Called when this widget gets focus. Passes focus down to the
@@ -362,6 +463,8 @@ class DepView(Frame):
         """
 
         self.default_link_type = ""
+        self.entity_rect_x = {}
+        self.entity_rect_width = {}
         self.canvas.delete(ALL)
 
     def drawTokens(self, sentence):
@@ -435,6 +538,15 @@ class DepView(Frame):
         y2 = (c2[3]+c2[1]+self.entity_rect_height)/2
         coords = [x1,y1,x2,y2]
 
+        if entity.id in self.entity_rect_x:
+            left = self.entity_rect_x[entity.id]
+            right = left+self.entity_rect_width[entity.id]
+            left, right = min(left, x1), max(right, x2)
+        else:
+            left, right = x1, x2
+        self.entity_rect_x[entity.id] = left
+        self.entity_rect_width[entity.id] = right-left
+
         color = self.entity_rect_color
         if entity.isFormulaRelationship():
             color = self.relationship_rect_color
@@ -580,10 +692,7 @@ class DepView(Frame):
                                          bbox[2]+self.horizontal_margin,
                                          bbox[3]+self.bottom_margin))
 
-    def draw(self, sentence):
-        """
-        Draws everything relating to the given sentence.
-        """
+    def drawItems(self, sentence):
         self.clear()
 
         self.drawTokens(sentence)
@@ -592,7 +701,52 @@ class DepView(Frame):
 
         self.updateScrollregion()
 
+    def saveLayout(self):
+        """
+        Returns the L{CanvasLayout} of the drawn sentence.
+        """
+        return CanvasLayout(self.canvas,
+                            (self.default_link_type,
+                             dict(self.entity_rect_x),
+                             dict(self.entity_rect_width)))
+
+    def layout(self, sentence):
+        """
+        Returns the L{CanvasLayout} of the given sentence, drawn on a hidden
+        canvas. The view is not changed.
+        """
+        shown = (self.canvas, self.default_link_type,
+                 self.entity_rect_x, self.entity_rect_width)
+        self.canvas = self.scratch
+        try:
+            self.drawItems(sentence)
+            return self.saveLayout()
+        finally:
+            self.scratch.delete(ALL)
+            (self.canvas, self.default_link_type,
+             self.entity_rect_x, self.entity_rect_width) = shown
+
+    def draw(self, sentence, layout=None):
+        """
+        Draws everything relating to the given sentence.
+
+        @param layout: The layout of the sentence, see L{layout}. If given,
+        the sentence is drawn from the layout.
+        @return: The layout of the sentence.
+        """
+        if layout is None:
+            self.drawItems(sentence)
+            layout = self.saveLayout()
+        else:
+            self.clear()
+            layout.replay(self.canvas)
+            link_type, rect_x, rect_width = layout.state
+            self.default_link_type = link_type
+            self.entity_rect_x = dict(rect_x)
+            self.entity_rect_width = dict(rect_width)
+
         self.visualiser.showLinks(self.default_link_type)
+        return layout
 
     def hideLinks(self):
         """
@@ -632,40 +786,18 @@ class DepView(Frame):
             tags.remove("entity")
 
         # remove tags without a box.
-        cleaned_tags = []
-        for t in tags:
-            if self.canvas.bbox(t) is not None:
-                cleaned_tags.append(t)
-        tags = cleaned_tags
-
-        for t in tags:
-            # empty coords may be returned for entities without a box
-            if len(self.canvas.coords(t)) != 0:
-                self.canvas.move(t,0,(bbox_token[3]-self.canvas.coords(t)[1]+
-                                      self.entity_rect_y_space))
-
-        # Sort the shortest boxes into the beginning.
-        def bbox_comp(a,b):
-            c1 = self.canvas.bbox(a)
-            c2 = self.canvas.bbox(b)
-            result = (c1[2]-c1[0]) - (c2[2]-c2[0])
-            if result==0:
-                return cmp(a,b)
-            return int(result)
-
-        tags = sorted(tags, key = functools.cmp_to_key(bbox_comp))
-
-        # Move the boxes down if they overlap.
+        tags = [t for t in tags if t in self.entity_rect_x]
+
+        # Stack the boxes below the tokens, shortest boxes first, each
+        # one in the topmost lane where it does not overlap other boxes.
+        tags = sorted(tags, key=lambda t: (self.entity_rect_width[t], t))
+        lanes = assignLanes([(t, self.entity_rect_x[t],
+                              self.entity_rect_x[t]+self.entity_rect_width[t])
+                             for t in tags])
         step = self.entity_rect_y_space + self.entity_rect_height
         for t in tags:
-            while True:
-                self.canvas.move(t,0,step)
-                bbox = self.canvas.bbox(t)
-                if bbox is not None:
-                    c = self.canvas.find_overlapping(bbox[0],bbox[1],bbox[2],bbox[3])
-                    d = self.canvas.find_withtag(t)
-                    if c==d:
-                        break
+            y = bbox_token[3]+self.entity_rect_y_space+lanes[t]*step
+            self.canvas.move(t,0,y-self.canvas.coords(t)[1])
 
         # Update scrollregion: size may have changed.
         self.updateScrollregion()
@@ -811,6 +943,9 @@ class RelView(Frame):
         self.row_height = abs(self.font_height) + 4
         self.indent = self.row_height + 10
 
+        # hidden canvas for computing layouts in the background
+        self.scratch = Canvas(self)
+
     def roll(self,event):
         if event.delta:
             self.canvas.yview('scroll', event.delta, 'units')
@@ -979,45 +1114,66 @@ class RelView(Frame):
                 tags.remove("current")
             self.visualiser.highlight(tags)
 
-    def draw(self,sentence):
+    def saveLayout(self):
+        """
+        Returns the L{CanvasLayout} of the drawn sentence.
+        """
+        position = dict((item,i) for i,item in enumerate(self.canvas.find_all()))
+        return CanvasLayout(self.canvas,
+                            (position[self.cursor],
+                             [(position[item],node) for item,(node,hidden) in self.nodes.items()]))
+
+    def layout(self,sentence):
+        """
+        Returns the L{CanvasLayout} of the given sentence, drawn on a hidden
+        canvas. The view is not changed.
+        """
+        shown = (self.canvas, self.nodes, self.cursor)
+        self.canvas = self.scratch
+        try:
+            self.drawItems(sentence)
+            return self.saveLayout()
+        finally:
+            self.scratch.delete(ALL)
+            self.canvas, self.nodes, self.cursor = shown
+
+    def draw(self,sentence,layout=None):
         """
         Lists the relationships in the given sentence.
 
         @param sentence: The Sentence object to be shown.
+        @param layout: The layout of the sentence, see L{layout}. If given,
+        the sentence is drawn from the layout.
+        @return: The layout of the sentence.
         """
-        def drawChildren(f,x,y):
-            x += self.indent
-            for i in f.arguments:
-                y += self.row_height
-                if i.arguments:
-                    tags = ('BI_all','expanded')
-                else:
-                    tags = ('BI_all',)
-                num = self.canvas.create_text(x, y, anchor='w',
-                                text="- "+i.getText(descend=False),
-                                tags=tags+tuple(e.id for e in i.getEntities()),
-                                font=self.font)
-                self.nodes[num] = (i,[])
-                x,y = drawChildren(i,x,y)
-            return (x-self.indent,y)
+        if layout is None:
+            self.drawItems(sentence)
+            return self.saveLayout()
+        self.clear()
+        items = layout.replay(self.canvas)
+        cursor, nodes = layout.state
+        self.cursor = items[cursor]
+        self.nodes = dict((items[i],(node,[])) for i,node in nodes)
+        return layout
 
+    def drawItems(self,sentence):
         self.clear()
         self.cursor = self.canvas.create_rectangle(0,0,0,0,state='hidden')
 
-        x = 10
         y = - (self.row_height)//2 + 5
-        for f in [f.rootNode for f in sentence.formulas]:
-            y += self.row_height
-            if f.arguments:
-                tags = ('BI_all','expanded')
-            else:
-                tags = ('BI_all',)
-            num = self.canvas.create_text(x, y, anchor='w',
-                               text="- "+f.getText(descend=False),
-                               tags=tags+tuple(e.id for e in f.getEntities()),
-                               font=self.font)
-            self.nodes[num] = (f,[])
-            x,y = drawChildren(f,x,y)
+        for f in sentence.formulas:
+            # one row per node in preorder, indented by the depth of the node
+            for i,node in enumerate(f.nodes):
+                y += self.row_height
+                if f.subtreeStops[i] > i+1:
+                    tags = ('BI_all','expanded')
+                else:
+                    tags = ('BI_all',)
+                num = self.canvas.create_text(10+f.depths[i]*self.indent, y, anchor='w',
+                                text="- "+node.getText(descend=False),
+                                tags=tags+tuple(e.id for e in node.getEntities()),
+                                font=self.font)
+                self.nodes[num] = (node,[])
 
         if self.nodes:
             bbox = self.canvas.bbox(ALL)
@@ -1043,6 +1199,11 @@ class RelView(Frame):
 class SentenceSelector(TextAsListbox):
     """
     A frame for selecting sentences.
+
+    The selector is virtualized: the text widget only holds the rows that fit
+    in the view, and scrolling replaces them with other rows of the sentence
+    list. Sentence indices given to and returned by the selector refer to the
+    whole list, the line numbers of L{select} and L{highlight} start from 1.
     """
 
     def __init__(self,master,visualiser,**args):
@@ -1057,6 +1218,16 @@ class SentenceSelector(TextAsListbox):
         self.list.bind("<ButtonRelease-1>",self.changeSentence)
         self.list.bind("<Key-space>",self.changeSentence)
         self.list.bind("<Key-Return>",self.changeSentence)
+        self.list.bind("<Prior>",self.pageUp)
+        self.list.bind("<Next>",self.pageDown)
+        self.list.bind("<MouseWheel>",self.wheel)
+        self.list.bind("<Button-4>",self.wheel)
+        self.list.bind("<Button-5>",self.wheel)
+        self.list.bind("<Configure>",self.resize)
+
+        # the scrollbar follows the sentence list, not the text widget
+        self.list.scroll_y.config(command=self.yview)
+        self.list['yscrollcommand'] = ''
 
         self.font_height = -12   # Tk: negative size guarantees pixels
         self.font_family = "Helvetica"
@@ -1066,37 +1237,217 @@ class SentenceSelector(TextAsListbox):
 
         self.list.config(font=self.font)
 
-    def draw(self,sentenceList):
+        self.sentences = []   # the listed sentences
+        self.count = 0        # the number of sentences that can be shown
+        self.top = 0          # the index of the first shown sentence
+        self.rows = 1         # the number of rows that fit in the view
+        self.shown = 0        # the number of rows currently in the text widget
+        self.current = None   # the index of the sentence under the cursor
+        self.highlighted = None
+
+    def draw(self,sentenceList,count=None):
         """
         Lists the sentences in the given list.
 
-        @param sentenceList: The list to be shown.
+        @param sentenceList: The list to be shown. The list may grow afterwards, see L{grow}.
+        @param count: The number of sentences of the list to be shown, by default all of them.
         """
-        self.clear()
+        self.sentences = sentenceList
+        self.count = len(sentenceList) if count is None else count
+        self.top = 0
+        self.current = None
+        self.highlighted = None
+        self.refresh()
+
+    def grow(self,count):
+        """
+        Shows the first C{count} sentences of the list given to L{draw}.
+        """
+        self.count = count
+        if self.shown < self.rows:
+            self.refresh()
+        else:
+            self.updateScrollbar()
+
+    def refresh(self):
+        """
+        Fills the text widget with the rows in view.
+        """
+        end = min(self.count,self.top+self.rows)
+        rows = [i.id+": "+i.getText() for i in self.sentences[self.top:end]]
+        self.shown = len(rows)
         self.list.config(state="normal")
-        for i in sentenceList:
-            text = i.id+": "+i.getText()
-            self.list.insert(END,text+"\n")
+        self.list.delete("1.0",END)
+        self.list.insert(END,"\n".join(rows))
         self.list.config(state="disabled")
+        self.list.tag_remove(SEL,1.0,END)
+        self.list.tag_remove("mytag",1.0,END)
+        if self.isShown(self.highlighted):
+            self.highlightRow(self.highlighted-self.top+1)
+        if self.isShown(self.current):
+            TextAsListbox.select(self,self.current-self.top+1)
+        self.updateScrollbar()
+
+    def updateScrollbar(self):
+        if self.count:
+            self.list.scroll_y.set(self.top/self.count,(self.top+self.shown)/self.count)
+        else:
+            self.list.scroll_y.set(0.0,1.0)
 
-    def highlight(self,idx):
-        idx = str(idx)
-        start = idx+".0 linestart"
-        end = idx+".0 lineend"
+    def isShown(self,idx):
+        return idx is not None and self.top <= idx < self.top+self.shown
+
+    def scrollTo(self,top):
+        """
+        Scrolls the view so that the sentence C{top} is the first row.
+        """
+        top = max(0,min(top,self.count-self.rows))
+        if top != self.top:
+            self.top = top
+            self.refresh()
+
+    def see(self,idx):
+        """
+        Scrolls the view so that the sentence C{idx} is visible.
+        """
+        if idx < self.top:
+            self.scrollTo(idx)
+        elif idx >= self.top+self.rows:
+            self.scrollTo(idx-self.rows+1)
+
+    def yview(self,*args):
+        if args[0] == "moveto":
+            self.scrollTo(int(float(args[1])*self.count))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.rows
+            self.scrollTo(self.top+step)
+
+    def wheel(self,event):
+        if event.num == 4 or event.delta > 0:
+            self.scrollTo(self.top-3)
+        else:
+            self.scrollTo(self.top+3)
+        return "break"
+
+    def resize(self,event):
+        rows = max(1,event.height//self.font.metrics("linespace"))
+        if rows != self.rows:
+            self.rows = rows
+            self.refresh()
+
+    def click(self,event):
+        self.select(self.top+int(self.list.index(CURRENT).split(".")[0]))
+
+    def select(self,line):
+        idx = int(line)-1
+        if not 0 <= idx < self.count:
+            return
+        self.current = idx
+        self.see(idx)
+        TextAsListbox.select(self,idx-self.top+1)
+
+    def down(self,event):
+        if self.current is None:
+            self.select(self.top+1)
+        else:
+            self.select(self.current+2)
+        return "break"
+
+    def up(self,event):
+        if self.current is not None:
+            self.select(self.current)
+        return "break"
+
+    def pageDown(self,event):
+        self.select(min(self.count,(self.current or 0)+self.rows+1))
+        return "break"
+
+    def pageUp(self,event):
+        self.select(max(1,(self.current or 0)-self.rows+1))
+        return "break"
+
+    def clear(self):
+        self.draw([])
+
+    def getIndex(self):
+        """
+        Gives the index for the sentence under the cursor.
+        """
+        if self.current is None:
+            return self.top
+        return self.current
+
+    def highlightRow(self,line):
+        start = str(line)+".0 linestart"
+        end = str(line)+".0 lineend"
         self.list.tag_config("mytag",foreground=self.highlight_color)
         self.list.tag_config("mytag",font=self.highlight_font)
         self.list.tag_remove("mytag",1.0,END)
         self.list.tag_add("mytag",start,end)
 
+    def highlight(self,idx):
+        self.highlighted = int(idx)-1
+        if self.isShown(self.highlighted):
+            self.highlightRow(self.highlighted-self.top+1)
+        else:
+            self.list.tag_remove("mytag",1.0,END)
+
     def changeSentence(self,event):
         """
         Callback function for changing the shown sentence.
         """
+        if self.getIndex() >= self.count:
+            return
         self.visualiser.showSentenceByIndex(self.getIndex())
         line = str(self.getIndex()+1)
         self.highlight(line)
 
 
+class CorpusLoader(threading.Thread):
+    """
+    Parses a corpus file in a background thread.
+
+    The parsed sentences are added to C{parser.bioinfer} as usual. The thread
+    does not touch the widgets; it posts its progress to the queue C{messages},
+    which the Tk main loop polls (see L{Visualiser.pollLoader}). The messages are
+    tuples C{("progress", sentences, fraction)}, C{("done", sentences, 1.0)}
+    and C{("error", exception)}, where C{sentences} is the number of completely
+    parsed sentences and C{fraction} the part of the file read so far.
+    """
+
+    def __init__(self,fileName,interval=0.1):
+        """
+        @param fileName: The corpus file.
+        @param interval: The minimum time in seconds between two progress messages.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fileName = fileName
+        self.interval = interval
+        self.parser = FastBIParser()
+        self.messages = queue.Queue()
+        self.cancelled = False
+
+    def run(self):
+        try:
+            size = max(1,os.path.getsize(self.fileName))
+            count = 0
+            last = time.time()
+            with open(self.fileName,"rb") as f:
+                for sentence,ontologies in self.parser.iterparse(f):
+                    if self.cancelled:
+                        return
+                    count += 1
+                    if count == 1 or time.time()-last >= self.interval:
+                        self.messages.put(("progress",count,f.tell()/size))
+                        last = time.time()
+            self.messages.put(("done",count,1.0))
+        except Exception as e:
+            self.messages.put(("error",e))
+
+
 class Visualiser(Tk):
     """
     A Tk derivative for visualising BioInfer corpus.
@@ -1108,6 +1459,10 @@ class Visualiser(Tk):
         """
         Tk.__init__(self)
         self.parser = BIParser()
+        self.loader = None
+        self.previousParser = None
+        self.layouts = LayoutCache()
+        self.shownIndex = None
 
         self.rowconfigure(0,weight=1)
         self.columnconfigure(0,weight=1)
@@ -1132,6 +1487,8 @@ class Visualiser(Tk):
         self.toolbar = Toolbar(self.barview, relief=RIDGE, borderwidth=1)
         self.sentencebar = Statusbar(self.barview, "Sentence: ",
                                    relief=RIDGE, borderwidth=1, width=20)
+        self.loadbar = Statusbar(self.barview, "Loaded: ",
+                                 relief=RIDGE, borderwidth=1, width=20)
         self.dependencybar = Pulldown(self.barview, "",
                                       [],
                                       self.depview.showLinks,
@@ -1164,6 +1521,7 @@ class Visualiser(Tk):
         Label(self.barview, text="Linkage type:").grid(sticky=W,
                                                           row=0, column=2)
         self.dependencybar.grid(sticky=W, row=0, column=3)
+        self.loadbar.grid(sticky=W, row=0, column=4)
 
         # Dependency view
         self.depview.grid(sticky=N+E+W+S, row=1, columnspan=2)
@@ -1211,10 +1569,23 @@ class Visualiser(Tk):
         self.depview.unhighlight(tags)
         self.relview.unhighlight(tags)
 
-    def showCorpus(self):
-        self.selector.draw(self.parser.bioinfer.sentences.sentences)
+    def showCorpus(self,count=None):
+        """
+        Lists the sentences of the corpus and shows the first one.
+
+        @param count: The number of sentences parsed so far, by default all of them.
+        """
+        self.layouts.clear()
+        self.selector.draw(self.parser.bioinfer.sentences.sentences,count)
         self.showSentenceByIndex(0)
 
+    def clearViews(self):
+        self.sentencebar.clear()
+        self.selector.clear()
+        self.depview.clear()
+        self.entview.clear()
+        self.relview.clear()
+
     def showSentenceByIndex(self,idx):
         """
         Shows a sentence.
@@ -1224,7 +1595,8 @@ class Visualiser(Tk):
         if self.parser.bioinfer is None:
             return
 
-        self.sentencebar.draw(self.parser.bioinfer.sentences.sentences[idx].id)
+        sentence = self.parser.bioinfer.sentences.sentences[idx]
+        self.sentencebar.draw(sentence.id)
         linktype = self.dependencybar.getType()
 
         # "selectable" sentence view is disabled.
@@ -1235,13 +1607,35 @@ class Visualiser(Tk):
         
         self.selector.highlight(idx+1)
         self.selector.select(idx+1)
-        self.dependencybar.setTypes(list(self.parser.bioinfer.sentences.sentences[idx].linkages.keys()))
-        self.depview.draw(self.parser.bioinfer.sentences.sentences[idx])
-        self.entview.draw(self.parser.bioinfer.sentences.sentences[idx])
-        self.relview.draw(self.parser.bioinfer.sentences.sentences[idx])
+        self.dependencybar.setTypes(list(sentence.linkages.keys()))
+        layouts = self.layouts.get(idx) or (None,None)
+        depLayout = self.depview.draw(sentence,layouts[0])
+        self.entview.draw(sentence)
+        relLayout = self.relview.draw(sentence,layouts[1])
+        self.layouts.put(idx,(depLayout,relLayout))
 
         self.dependencybar.switch(linktype)
 
+        self.shownIndex = idx
+        self.after_idle(self.prefetch,idx)
+
+    def prefetch(self,idx):
+        """
+        Computes the layouts of the sentences next to the shown sentence C{idx}
+        in advance, one sentence per call while the program is idle.
+        """
+        if idx != self.shownIndex or self.parser.bioinfer is None:
+            return
+        for i in (idx+1,idx-1):
+            if 0 <= i < self.selector.count and i not in self.layouts:
+                sentence = self.parser.bioinfer.sentences.sentences[i]
+                self.layouts.put(i,(self.depview.layout(sentence),
+                                    self.relview.layout(sentence)))
+                # the shown sentence stays the most recently used one
+                self.layouts.get(idx)
+                self.after_idle(self.prefetch,idx)
+                return
+
     def showSentenceById(self,uid):
         """
         Shows a sentence.
@@ -1255,44 +1649,92 @@ class Visualiser(Tk):
     def idToIdx(self,uid):
         if self.parser.bioinfer is None:
             return None
-        for i,j in enumerate(self.parser.bioinfer.sentences.sentences):
-            if j.id==str(uid):
-                return i
-        return None
+        return self.parser.bioinfer.sentences.getSentenceIndex(str(uid))
 
     def isValidId(self,uid):
-        if self.idToIdx(uid) == None:
+        idx = self.idToIdx(uid)
+        if idx == None or idx >= self.selector.count: # not parsed yet
             return False
         return True
         
     def openFile(self,event=None):
         """
-        Opens and parses a corpus. The file is selected with a dialog.
+        Opens a corpus. The file is selected with a dialog and parsed in the
+        background by a L{CorpusLoader}, see L{pollLoader}.
         """
         selected = fd.askopenfilename()
 
         if selected: # not None can fail, may return empty tuple
-            newParser = BIParser()
-
             try:
                 f=open(selected)
             except IOError as inst:
                 mb.showinfo("IO error", inst.args[0])
                 return
+            f.close()
 
-            try:
-                newParser.parse(f)
-            except:
-                mb.showinfo("Parsing failed",
+            if self.loader is not None:
+                self.loader.cancelled = True
+            if self.loader is None or self.parser is not self.loader.parser:
+                self.previousParser = self.parser
+            self.loader = CorpusLoader(selected)
+            self.loadbar.draw("0 sentences")
+            self.loader.start()
+            self.after(100, self.pollLoader, self.loader)
+
+    def pollLoader(self,loader):
+        """
+        Shows the progress of a L{CorpusLoader}. The corpus is shown as soon as
+        its first sentences are parsed, and the sentence selector grows as the
+        parsing proceeds. Called periodically until the loader has finished.
+        """
+        if loader is not self.loader: # another file was opened
+            return
+        message = None
+        try:
+            while message is None or message[0] == "progress":
+                message = loader.messages.get_nowait()
+        except queue.Empty:
+            pass
+        if message is None:
+            self.after(100, self.pollLoader, loader)
+            return
+        if message[0] == "error":
+            self.loadFailed(loader, "Parsing failed",
                             "The file might be corrupted.")
-            else:
-                if newParser.bioinfer.isValid():
-                    self.parser = newParser
-                    self.showCorpus()
-                else:
-                    mb.showinfo("Missing corpus component",
+            return
+
+        kind, count, fraction = message
+        bioinfer = loader.parser.bioinfer
+        if self.parser is loader.parser:
+            self.selector.grow(count)
+        elif count and bioinfer is not None and bioinfer.isValid():
+            self.parser = loader.parser
+            self.showCorpus(count)
+
+        if kind == "done":
+            self.loader = None
+            if self.parser is not loader.parser:
+                self.loadFailed(loader, "Missing corpus component",
                                 "The opened corpus does not contain all required components.")
-            f.close()
+                return
+            self.loadbar.draw("%d sentences" % count)
+        else:
+            self.loadbar.draw("%d sentences (%d%%)" % (count, 100*fraction))
+            self.after(100, self.pollLoader, loader)
+
+    def loadFailed(self,loader,title,text):
+        """
+        Reports a failed L{CorpusLoader} and goes back to the previously opened corpus.
+        """
+        self.loader = None
+        self.loadbar.clear()
+        mb.showinfo(title, text)
+        if self.parser is loader.parser:
+            self.parser = self.previousParser
+            if self.parser.bioinfer is None:
+                self.clearViews()
+            else:
+                self.showCorpus()
 
     def closeProgram(self,event=None):
         """
@@ -1352,6 +1794,10 @@ The toolbar contains the following items:
    * Go to : Go to a sentence
 * Sentence number
 * Linkage type selector
+* Number of loaded sentences
+
+A corpus is parsed in the background. Its sentences can be viewed as
+soon as they are loaded.
 
 The linkage type selector can be used to select the type of linkage
 annotation shown for the sentence.
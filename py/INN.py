@@ -3,7 +3,7 @@ from pytorch_lightning import metrics
 import torch
 from torch import nn
 from torch.nn import functional as functional
-from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence, pad_sequence
 from transformers import *
 
 from config import *
@@ -34,9 +34,23 @@ def collate_cat_keys(new_batch, batch, cat_keys):
     return new_batch
 
 
+def collate_bert_tokens(new_batch, batch):
+    """
+    pads the bert tokens of the samples to the longest sample of the batch,
+    and makes the attention mask of the padded tokens
+    """
+    tokens = [sample["bert_tokens"] for sample in batch]
+    lengths = torch.tensor([len(t) for t in tokens])
+    new_batch["bert_tokens"] = pad_sequence(tokens, batch_first=True)
+    new_batch["mask"] = (
+        torch.arange(new_batch["bert_tokens"].shape[1]) < lengths.unsqueeze(1)
+    ).long()
+    return new_batch
+
+
 def collate_func(batch):
     cat_keys = ["element_names", "L", "labels", "is_entity", "L"]
-    list_keys = ["from_scratch_tokens", "bert_tokens", "entity_spans", "mask", "text"]
+    list_keys = ["from_scratch_tokens", "bert_offsets", "entity_spans", "text"]
 
     if type(batch) == dict:
         batch = [batch]
@@ -44,6 +58,7 @@ def collate_func(batch):
     new_batch = {}
     new_batch = collate_list_keys(new_batch, batch, list_keys)
     new_batch = collate_cat_keys(new_batch, batch, cat_keys)
+    new_batch = collate_bert_tokens(new_batch, batch)
     new_batch = update_batch_S(new_batch, batch)
 
     T = torch.arange(len(new_batch["element_names"]))
@@ -115,28 +130,47 @@ class BERTEncoder(pl.LightningModule):
 
     @staticmethod
     def bert_new_embedding(bert_encodings,split):
-        return torch.stack([torch.mean(chunk,dim=0) for chunk in torch.split(bert_encodings[0],split)]).unsqueeze(0)
+        # a word without bert tokens (an empty word between two spaces, or a word
+        # cut off by the truncation) gets a zero embedding instead of the nan mean
+        return torch.stack([torch.mean(chunk,dim=0) if len(chunk) else chunk.new_zeros(chunk.shape[1:]) for chunk in torch.split(bert_encodings[0],split)]).unsqueeze(0)
 
-    def forward(self, bert_tokens, masks, text, epoch):
-        bert_outs = []
-        for toks, mask, txt in zip(bert_tokens, masks, text):
-            if(epoch < FREEZE_BERT_EPOCH):
-                bert_out = self.bert(toks, attention_mask=mask)[0]
-            else:
-                with torch.no_grad():
-                    bert_out = self.bert(toks, attention_mask=mask)[0]
+    @staticmethod
+    def offset_splits(seq_original, offsets):
+        """
+        the number of bert tokens of every word of seq_original, from the
+        character offsets of the tokens in the text (see
+        BioInferDataset.bert_tokens), without [CLS] and [SEP]. words without
+        tokens, also at the end of the text, get 0
+        """
+        word_starts = torch.tensor([len(w) + 1 for w in seq_original]).cumsum(0)
+        words = torch.searchsorted(
+            word_starts, offsets[1:-1, 0].contiguous(), right=True
+        )
+        return torch.bincount(words, minlength=len(seq_original)).tolist()
 
-            a = torch.sum(mask)
+    def forward(self, bert_tokens, masks, text, epoch, offsets=None):
+        if(epoch < FREEZE_BERT_EPOCH):
+            bert_out_batch = self.bert(bert_tokens, attention_mask=masks)[0]
+        else:
+            with torch.no_grad():
+                bert_out_batch = self.bert(bert_tokens, attention_mask=masks)[0]
+
+        bert_outs = []
+        for i, txt in enumerate(text):
+            a = torch.sum(masks[i])
             seq_original = [w.lower() for w in txt.split(' ')]
-            om = self.tokenizer.encode_plus(seq_original,  # the sentence to be encoded
-                            add_special_tokens=True,  # Add [CLS] and [SEP]
-                            pad_to_max_length=True,  # Add [PAD]s
-                            is_split_into_words=True,
-                            return_attention_mask = False,
-                            return_offsets_mapping=True,
-                            return_length=False)['offset_mapping'][1:]
-            splits = self.parse_bert(seq_original, om)
-            bert_out = bert_out[:,0:a,:]
+            if offsets is not None:
+                splits = self.offset_splits(seq_original, offsets[i])
+            else:
+                om = self.tokenizer.encode_plus(seq_original,  # the sentence to be encoded
+                                add_special_tokens=True,  # Add [CLS] and [SEP]
+                                pad_to_max_length=True,  # Add [PAD]s
+                                is_split_into_words=True,
+                                return_attention_mask = False,
+                                return_offsets_mapping=True,
+                                return_length=False)['offset_mapping'][1:]
+                splits = self.parse_bert(seq_original, om)
+            bert_out = bert_out_batch[i:i + 1, 0:a, :]
             bert_out = bert_out[:,1:-1,:]
             bert_out = self.bert_new_embedding(bert_out,splits)
             bert_out = bert_out.permute(1, 0, 2)
@@ -240,6 +274,7 @@ class INNModel(pl.LightningModule):
         tokens,
         bert_tokens,
         mask,
+        bert_offsets,
         text,
         entity_spans,
         element_names,
@@ -251,7 +286,7 @@ class INNModel(pl.LightningModule):
     ):
         encoding_out = None
         if self.encoding_method == "bert":
-            encoding_out, token_splits = self.encoder(bert_tokens, mask,text,epoch)
+            encoding_out, token_splits = self.encoder(bert_tokens, mask, text, epoch, bert_offsets)
         elif self.encoding_method == "from-scratch":
             encoding_out, token_splits = self.encoder(tokens)
         if encoding_out is None:
@@ -474,6 +509,7 @@ class INNModelLightning(pl.LightningModule):
             batch_sample["from_scratch_tokens"],
             batch_sample["bert_tokens"],
             batch_sample["mask"],
+            batch_sample["bert_offsets"],
             batch_sample["text"],
             batch_sample["entity_spans"],
             batch_sample["element_names"],
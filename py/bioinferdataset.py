@@ -1,127 +1,350 @@
+import hashlib
+import os
 import pickle
 import sys
+from bisect import bisect_left
+from itertools import chain
 
 import dgl
 import numpy as np
 
 sys.path.append("../lib/BioInfer_software_1.0.1_Python3/")
 sys.path.append("../py/")
-from collections import Counter
-from itertools import product
 from multiprocessing import Pool
 
 import pandas as pd
 import torch
 import tqdm
-from BIParser import BIParser
-from torch import nn
+from BIIndex import scanIndex
 from torch.nn import functional as functional
 from torch.utils.data import Dataset
 from transformers import *
 
-import istarmap
 from config import *
 from config import ENTITY_PREFIX, PREDICATE_PREFIX
+from corpusstats import invert_schema, load_corpus_stats, lookup_elements
+from stagecache import StageCache, digest, file_digest
 
-
-def get_child_indices(g, node_idx):
-    return torch.stack(g.out_edges(node_idx))[1].tolist()
+# versions of the stages of load_prepared(): the scan of the corpus, the
+# sentence features of process_sentence() and bert_tokens(), and the candidate
+# generation of candidate_arrays(). cached stages of another version are
+# prepared again
+CORPUS_VERSION = 1
+FEATURES_VERSION = 2
+CANDIDATES_VERSION = 2
 
 
 def sort_args(arguments):
     return tuple(sorted(arguments))
 
 
-def process_sample(sample, inverse_schema):
+def pair_schema(inverse_schema):
     """
-    process a single sample.
+    compiles inverse_schema into a map from an element type to its partner
+    types in argument pairs, and from a partner type to the predicates of the
+    pair, in the order of inverse_schema
+    """
+    partners = {}
+    for key, predicates in inverse_schema.items():
+        if len(key) == 2:
+            a, b = key
+            partners.setdefault(a, {})[b] = list(predicates)
+            partners.setdefault(b, {})[a] = list(predicates)
+    return partners
+
+
+def schema_pairs(element_names, partners, start=0):
+    """
+    yields (i, j, predicates) for the pairs i < j of elements whose types are
+    an argument pair of the schema, in the order of torch.combinations.
+    only the pairs with j >= start are generated
+    """
+    positions = {}
+    for j, t in enumerate(element_names):
+        positions.setdefault(t, []).append(j)
+    for i, t in enumerate(element_names):
+        compatible = partners.get(t)
+        if not compatible:
+            continue
+        later = []
+        for partner, predicates in compatible.items():
+            p = positions.get(partner, ())
+            later.extend(
+                (j, predicates) for j in p[bisect_left(p, max(i + 1, start)) :]
+            )
+        later.sort(key=lambda x: x[0])
+        for j, predicates in later:
+            yield i, j, predicates
+
+
+def gold_relations(graphs, node_idx_to_element_idxs):
+    """
+    flattens the gold relation graphs of a sample into lists over their
+    nodes, numbered graph by graph: the predicate, the children in edge order
+    and the element index of every node
+    """
+    predicates = []
+    children = []
+    element_idxs = []
+    for graph, node_element_idxs in zip(graphs, node_idx_to_element_idxs):
+        offset = len(predicates)
+        predicates += graph.ndata["element_names"].tolist()
+        graph_children = [[] for _ in range(graph.num_nodes())]
+        for u, v in zip(*(x.tolist() for x in graph.edges())):
+            graph_children[u].append(offset + v)
+        children += graph_children
+        element_idxs += [node_element_idxs[n] for n in range(graph.num_nodes())]
+    return predicates, children, element_idxs
+
+
+class GoldRelationIndex:
     """
-    element_names = sample["element_names"].flatten().tolist()
-    num_true_elements = len(element_names)
-    T_temp = torch.arange(num_true_elements)
-
-    S_temp = [
-        nn.functional.pad(e, pad=(0, 2 - len(e)), mode="constant", value=-1)
-        for e in list(T_temp.chunk(num_true_elements))
-    ]
-
-    labels_temp = [1 for _ in T_temp]
-    layers_temp = [0 for _ in T_temp]
-    is_entity_temp = [1 for _ in T_temp]
-
-    max_layers = MAX_LAYERS
-
-    for layer in range(max_layers):
-        for arg_indices in torch.combinations(T_temp):
-            arguments = [element_names[idx] for idx in arg_indices.tolist()]
-            key = sort_args(arguments)
-            if key in inverse_schema.keys():
-                for predicate in inverse_schema[key].keys():
-                    S_temp.append(arg_indices)
-                    is_entity_temp.append(0)
-                    element_names.append(predicate)
-                    layers_temp.append(layer + 1)
-                    L = 0  # default label is false
-                    for i, graph in enumerate(sample["relation_graphs"]):
-                        for n in graph.nodes():
-                            n_predicate = graph.ndata["element_names"][n]
-                            child_indices = torch.tensor(
-                                [
-                                    sample["node_idx_to_element_idxs"][i][idx]
-                                    for idx in get_child_indices(graph, node_idx=n)
-                                ]
-                            )
-                            if child_indices.shape == arg_indices.shape:
-                                # TODO ordering
-                                if (
-                                    child_indices.tolist() == arg_indices.tolist()
-                                    and predicate == n_predicate
-                                ):  # check if children match and the predicate type is correct
-                                    sample["node_idx_to_element_idxs"][i][
-                                        n.item()
-                                    ] = num_true_elements
-                                    L = 1  # this label is true because we found this candidate in the gold standard relation graphs
-                    labels_temp.append(L)
-                    num_true_elements += 1
-                    T_temp = torch.arange(len(is_entity_temp))
-
-    sample["labels"] = torch.tensor(labels_temp, dtype=torch.long)
-    sample["T"] = T_temp = torch.arange(len(is_entity_temp))
-    sample["S"] = torch.stack(S_temp)
-    sample["element_names"] = torch.tensor(element_names)
-    sample["L"] = torch.tensor(layers_temp)
-    sample["is_entity"] = torch.tensor(is_entity_temp)
+    the nodes of the gold relation graphs of a sample (see gold_relations),
+    hashed by (predicate, element indices of the children). the children are
+    kept in edge order, so a node only matches a candidate whose arguments are
+    listed in the same order.
+
+    the element index of a node changes when a candidate matches it, which
+    re-hashes its parents
+    """
+
+    def __init__(self, predicates, children, element_idxs):
+        self.predicates = predicates
+        self.children = children
+        self.element_idxs = list(element_idxs)
+        self.parents = [set() for _ in predicates]
+        self.keys = [None for _ in predicates]
+        self.nodes = {}
+        for n, node_children in enumerate(children):
+            for c in node_children:
+                self.parents[c].add(n)
+        for n, node_children in enumerate(children):
+            if node_children:
+                self.rehash(n)
+
+    def rehash(self, node):
+        old_key = self.keys[node]
+        if old_key is not None:
+            self.nodes[old_key].discard(node)
+        key = (
+            self.predicates[node],
+            tuple(self.element_idxs[c] for c in self.children[node]),
+        )
+        self.keys[node] = key
+        self.nodes.setdefault(key, set()).add(node)
+
+    def match(self, predicate, arg_indices, element_idx):
+        """
+        gives element_idx to the nodes with predicate and the children
+        arg_indices. returns the label of the candidate, 1 if a node matched
+        """
+        matched = self.nodes.get((predicate, arg_indices))
+        if not matched:
+            return 0
+        for n in list(matched):
+            self.element_idxs[n] = element_idx
+            for parent in self.parents[n]:
+                self.rehash(parent)
+        return 1
+
+
+def sample_payload(sample):
+    """
+    what candidate_arrays() needs of a pre-prepped sample or of its
+    sentence_features(): the entity types and the gold relations
+    """
+    gold = sample.get("gold_relations")
+    if gold is None:
+        gold = gold_relations(
+            sample["relation_graphs"], sample["node_idx_to_element_idxs"]
+        )
+    return sample["element_names"].flatten().tolist(), gold
+
+
+def sentence_features(sample):
+    """
+    the sentence features of a pre-prepped sample, as load_prepared() caches
+    them: the sample with the flat gold_relations() instead of the relation
+    graphs
+    """
+    features = {
+        key: value
+        for key, value in sample.items()
+        if key not in ("relation_graphs", "node_idx_to_element_idxs", "element_locs")
+    }
+    features["gold_relations"] = gold_relations(
+        sample["relation_graphs"], sample["node_idx_to_element_idxs"]
+    )
+    return features
+
+
+def candidate_arrays(payload, partners, gold_index_cls=GoldRelationIndex):
+    """
+    generates and labels the candidates of a sample_payload() with the
+    compiled schema partners (see pair_schema). returns the arrays of the
+    arguments S, the element names, the layers L and the labels of the
+    entities followed by the candidates
+    """
+    entity_names, gold = payload
+    element_names = list(entity_names)
+    num_entities = len(element_names)
+    S_temp = [[i, -1] for i in range(num_entities)]
+    labels_temp = [1] * num_entities
+    layers_temp = [0] * num_entities
+
+    gold = gold_index_cls(*gold)
+
+    # the elements of the previous layer start at layer_start, the entities
+    # are layer 0. a layer only pairs elements with at least one element of
+    # the previous layer, so no candidate is generated twice
+    layer_start = 0
+    for layer in range(MAX_LAYERS):
+        num_elements = len(element_names)
+        for i, j, predicates in schema_pairs(
+            element_names[:], partners, layer_start
+        ):
+            for predicate in predicates:
+                # the label is true if the candidate is in the gold standard relation graphs
+                labels_temp.append(gold.match(predicate, (i, j), len(element_names)))
+                S_temp.append([i, j])
+                element_names.append(predicate)
+                layers_temp.append(layer + 1)
+        layer_start = num_elements
+
+    return (
+        np.array(S_temp, dtype=np.int64).reshape(-1, 2),
+        np.array(element_names, dtype=np.int64),
+        np.array(layers_temp, dtype=np.int64),
+        np.array(labels_temp, dtype=np.int64),
+    )
+
+
+def finish_sample(sample, arrays):
+    """
+    puts the candidate_arrays() of a pre-prepped sample or of its
+    sentence_features() into it as tensors
+    """
+    S, element_names, layers, labels = (torch.from_numpy(a) for a in arrays)
+    sample["labels"] = labels
+    sample["T"] = torch.arange(len(labels))
+    sample["S"] = S
+    sample["element_names"] = element_names
+    sample["L"] = layers
+    sample["is_entity"] = (layers == 0).long()
 
     # only need certain elements from data
-    del sample["relation_graphs"]
-    del sample["node_idx_to_element_idxs"]
+    sample.pop("relation_graphs", None)
+    sample.pop("node_idx_to_element_idxs", None)
+    sample.pop("gold_relations", None)
     # del sample["text"]
-    del sample["element_locs"]
+    sample.pop("element_locs", None)
 
     return sample
 
 
+def process_sample(sample, inverse_schema, gold_index_cls=GoldRelationIndex):
+    """
+    process a single sample.
+    """
+    arrays = candidate_arrays(
+        sample_payload(sample), pair_schema(inverse_schema), gold_index_cls
+    )
+    return finish_sample(sample, arrays)
+
+
+# the compiled schema of a process_samples() worker process
+_worker_partners = None
+
+
+def init_worker(inverse_schema):
+    global _worker_partners
+    _worker_partners = pair_schema(inverse_schema)
+
+
+def process_payload(payload):
+    return candidate_arrays(payload, _worker_partners)
+
+
+# what the prepare_sentences() workers need of the dataset, see worker_state()
+WORKER_STATE = (
+    "xml_file",
+    "entity_prefix",
+    "predicate_prefix",
+    "vocab_dict",
+    "element_names",
+    "element_to_idx",
+    "entity_type_elements",
+    "predicate_elements",
+    "inverse_schema",
+)
+
+# the dataset and corpus index of a prepare_sentences() worker process
+_worker_dataset = None
+_worker_index = None
+
+
+def init_sentence_worker(state, index):
+    global _worker_dataset, _worker_index
+    _worker_dataset = BioInferDataset.from_worker_state(state)
+    _worker_index = index
+
+
+def prepare_chunk(task):
+    sentence_idxs, fuse, features = task
+    return _worker_dataset.prepare_chunk(
+        _worker_index, sentence_idxs, fuse, features
+    )
+
+
 class BioInferDataset(Dataset):
     def __init__(
-        self, xml_file, entity_prefix=ENTITY_PREFIX, predicate_prefix=PREDICATE_PREFIX
+        self,
+        xml_file,
+        entity_prefix=ENTITY_PREFIX,
+        predicate_prefix=PREDICATE_PREFIX,
+        cache_dir=PREPPED_CACHE_DIR,
     ):
         self.entity_prefix = entity_prefix
         self.predicate_prefix = predicate_prefix
-        self.parser = BIParser()
+        self.xml_file = xml_file
         self.sample_list = []
-        with open(xml_file, "r") as f:
-            self.parser.parse(f)
-        self.vocab_dict = self.create_vocab_dictionary(self.parser)
-        entities = self.get_entities(self.parser)
-        predicates = self.get_predicates(self.parser)
-        elements = entities + predicates
-        self.element_to_idx = {elements[i]: i for i in range(len(elements))}
-        self.schema = self.get_schema(self.parser, self.element_to_idx)
-        self.inverse_schema = self.invert_schema(self.schema)
+        self.stats = load_corpus_stats(xml_file, cache_dir)
+        if (self.stats.entity_prefix, self.stats.predicate_prefix) != (
+            entity_prefix,
+            predicate_prefix,
+        ):
+            self.stats.build_tables(entity_prefix, predicate_prefix)
+        self.vocab_dict = self.stats.vocab_dict
+        self.element_names = self.stats.element_names
+        self.element_to_idx = self.stats.element_to_idx
+        self.entity_type_elements = self.stats.entity_type_elements
+        self.predicate_elements = self.stats.predicate_elements
+        self.schema = self.stats.schema
+        self.inverse_schema = self.stats.inverse_schema
         self.tokenizer = AutoTokenizer.from_pretrained(
             "allenai/scibert_scivocab_uncased"
         )
 
+    def worker_state(self):
+        """
+        the tables which the worker processes of prepare_sentences() need to
+        run process_sentence(), sent to them instead of the whole dataset
+        with its samples and tokenizer
+        """
+        return {key: getattr(self, key) for key in WORKER_STATE}
+
+    @classmethod
+    def from_worker_state(cls, state):
+        """
+        a dataset with only the tables of worker_state(), which can prepare
+        sentences but has no samples, corpus stats or tokenizer
+        """
+        dataset = cls.__new__(cls)
+        dataset.__dict__.update(state)
+        dataset.sample_list = []
+        dataset.tokenizer = None
+        return dataset
+
     def __len__(self):
         return len(self.sample_list)
 
@@ -129,6 +352,11 @@ class BioInferDataset(Dataset):
         return self.sample_list[idx]
 
     def load_samples_from_pickle(self, pickle_file=PREPPED_DATA_PATH):
+        """
+        loads a sample_list saved by samples_to_pickle(). train.py uses
+        load_prepared() instead; these are kept for the notebooks, which
+        save and load a fixed prepared dataset
+        """
         print("loading data...")
         self.sample_list = pickle.load(open(pickle_file, "rb"))
         return self
@@ -136,32 +364,202 @@ class BioInferDataset(Dataset):
     def samples_to_pickle(self, pickle_file=PREPPED_DATA_PATH):
         pickle.dump(self.sample_list, open(pickle_file, "wb"))
 
-    def pre_prep_data(self):
-        print("pre-prepping data...")
-        self.sample_list = tqdm.tqdm(
-            [
-                self.process_sentence(sent, self.inverse_schema)
-                for i, sent in enumerate(self.parser.bioinfer.sentences.sentences)
-                if i not in EXCLUDE_SAMPLES
-            ]
-        )
+    def pre_prep_data(self, fuse=False):
+        """
+        runs the sentences of the corpus through process_sentence(), and
+        also through process_sample() with fuse, see prepare_sentences()
+        """
+        print("preparing data..." if fuse else "pre-prepping data...")
+        index = scanIndex(self.xml_file)
+        sentence_idxs = [
+            i for i in range(len(index.sentenceIds)) if i not in EXCLUDE_SAMPLES
+        ]
+        self.sample_list = self.prepare_sentences(index, sentence_idxs, fuse)
 
-    def prep_data(self):
+    def prep_data(self, fuse=True):
         """
         prepares the each data sample using process_sample()
-        stores the result in sample_list
+        stores the result in sample_list. if sample_list is empty, the
+        sentences are pre-prepped first, in the same pass with fuse
         """
         if not len(self.sample_list):
-            self.pre_prep_data()
+            self.pre_prep_data(fuse)
+            if fuse:
+                return
         print("processing data...")
-        with Pool() as p:
-            self.sample_list = list(
+        self.sample_list = self.process_samples(self.sample_list)
+
+    def prepare_sentences(self, index, sentence_idxs, fuse=False, features=False):
+        """
+        runs the sentences at sentence_idxs of the xml file (see
+        BIIndex.CorpusIndex) through process_sentence() in a process pool,
+        where every worker parses its own sentences. with fuse the workers
+        also run process_sample(), and with features they return the
+        sentence_features(), so the relation graphs are not sent back.
+        the texts of all the sentences are then tokenized at once by
+        add_bert_tokens(). returns the samples in the order of sentence_idxs
+        """
+        processes = os.cpu_count() or 1
+        # every chunk parses the ontologies again, so chunks are not too small
+        chunksize = max(16, len(sentence_idxs) // (processes * 8))
+        tasks = [
+            (sentence_idxs[i : i + chunksize], fuse, features)
+            for i in range(0, len(sentence_idxs), chunksize)
+        ]
+        pool = None
+        if processes == 1:
+            results = (self.prepare_chunk(index, *task) for task in tasks)
+        else:
+            pool = Pool(
+                processes,
+                initializer=init_sentence_worker,
+                initargs=(self.worker_state(), index),
+            )
+            results = pool.imap(prepare_chunk, tasks)
+        samples = []
+        try:
+            with tqdm.tqdm(total=len(sentence_idxs)) as progress:
+                for chunk_samples in results:
+                    samples += chunk_samples
+                    progress.update(len(chunk_samples))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return self.add_bert_tokens(samples)
+
+    def prepare_chunk(self, index, sentence_idxs, fuse, features=False):
+        samples = []
+        for sentence, _ in index.iterSentences(self.xml_file, sentence_idxs):
+            sample = self.process_sentence(sentence, self.inverse_schema)
+            if fuse:
+                sample = process_sample(sample, self.inverse_schema)
+            elif features:
+                sample = sentence_features(sample)
+            samples.append(sample)
+        return samples
+
+    def process_samples(self, samples):
+        """
+        runs process_sample() on samples in a process pool
+        """
+        results = self.generate_candidates(samples)
+        return [finish_sample(s, r) for s, r in zip(samples, results)]
+
+    def generate_candidates(self, samples):
+        """
+        the candidate_arrays() of samples, generated in a process pool
+        """
+        payloads = [sample_payload(sample) for sample in samples]
+        processes = os.cpu_count() or 1
+        # a few chunks per worker keep the workers busy without a round trip per sample
+        chunksize = max(1, len(payloads) // (processes * 4))
+        # the workers get the schema once, and only payloads and arrays are pickled per sample
+        with Pool(
+            processes, initializer=init_worker, initargs=(self.inverse_schema,)
+        ) as p:
+            results = list(
                 tqdm.tqdm(
-                    p.istarmap(
-                        process_sample, product(self.sample_list, [self.inverse_schema])
-                    )
+                    p.imap(process_payload, payloads, chunksize),
+                    total=len(payloads),
                 )
             )
+        return results
+
+    def sentence_hashes(self):
+        """
+        returns the index of the sentences in the xml file (see
+        BIIndex.scanIndex) and the sha1 hash of the xml of every sentence
+        """
+        index = scanIndex(self.xml_file)
+        hashes = []
+        with open(self.xml_file, "rb") as f:
+            for start, end in index.sentenceRanges:
+                f.seek(start)
+                hashes.append(hashlib.sha1(f.read(end - start)).hexdigest())
+        return index, hashes
+
+    def features_key(self):
+        """
+        digest of what the sentence features depend on besides the sentence
+        xml. the vocabulary is left out since from_scratch_tokens are
+        recomputed for cached samples
+        """
+        return digest(
+            self.element_names,
+            MAX_ENTITY_TOKENS,
+            self.tokenizer.name_or_path,
+            FEATURES_VERSION,
+        )
+
+    def candidates_key(self, features_key):
+        """
+        digest of what the candidates depend on besides the sentence features
+        """
+        return digest(
+            features_key,
+            [(k, list(v.items())) for k, v in self.inverse_schema.items()],
+            MAX_LAYERS,
+            CANDIDATES_VERSION,
+        )
+
+    def load_prepared(self, cache_dir=PREPPED_CACHE_DIR, keep=PREPPED_CACHE_KEEP):
+        """
+        fills sample_list from the StageCache in cache_dir, which keeps the
+        keep most recently used entries of every stage, preparing only the
+        stages whose inputs changed:
+        - corpus: the index and the sentence hashes of the xml file, keyed by
+          the digest of the file
+        - features: the sentence_features() of every sentence, kept by the
+          hash of its xml, so only added or changed sentences are prepared
+        - candidates: the candidate_arrays() of every sentence, likewise
+        the key of every stage includes the config values and the code
+        version it depends on, e.g. changing MAX_LAYERS only generates the
+        candidates again. returns the names of the stages that were prepared
+        """
+        cache = StageCache(cache_dir, keep)
+        prepared = []
+        corpus_key = digest(file_digest(self.xml_file), CORPUS_VERSION)
+        corpus = cache.load("corpus", corpus_key)
+        if corpus is None:
+            corpus = cache.save("corpus", corpus_key, self.sentence_hashes())
+            prepared.append("corpus")
+        index, hashes = corpus
+        wanted = [i for i in range(len(hashes)) if i not in EXCLUDE_SAMPLES]
+
+        # the features and candidates are kept by sentence hash, so their
+        # keys do not include the xml file but the corpus wide tables of the
+        # element vocabulary and the schema
+        features_key = self.features_key()
+        features = cache.load("features", features_key) or {}
+        changed = [i for i in wanted if hashes[i] not in features]
+        print(f"reusing the features of {len(wanted) - len(changed)} of {len(wanted)}")
+        if changed:
+            print("pre-prepping data...")
+            samples = self.prepare_sentences(index, changed, features=True)
+            features.update((hashes[i], f) for i, f in zip(changed, samples))
+            features = {hashes[i]: features[hashes[i]] for i in wanted}
+            cache.save("features", features_key, features)
+            prepared.append("features")
+
+        candidates_key = self.candidates_key(features_key)
+        candidates = cache.load("candidates", candidates_key) or {}
+        changed = [hashes[i] for i in wanted if hashes[i] not in candidates]
+        if changed:
+            print("processing data...")
+            arrays = self.generate_candidates([features[h] for h in changed])
+            candidates.update(zip(changed, arrays))
+            candidates = {hashes[i]: candidates[hashes[i]] for i in wanted}
+            cache.save("candidates", candidates_key, candidates)
+            prepared.append("candidates")
+
+        self.sample_list = []
+        for i in wanted:
+            sample = dict(features[hashes[i]])
+            sample["from_scratch_tokens"] = self.sent_to_idxs(
+                sample["text"], self.vocab_dict
+            )
+            self.sample_list.append(finish_sample(sample, candidates[hashes[i]]))
+        return prepared
 
     def process_sentence(self, sentence, inverse_schema):
         entities, entity_locs = self.get_entities_from_sentence(sentence)
@@ -177,15 +575,11 @@ class BioInferDataset(Dataset):
             node_idx_to_element_idxs,
         ) = self.get_relation_graphs_from_sentence(sentence, entity_locs)
 
-        input_ids, attention_mask = self.bert_tokens(sentence.getText())
-
         sample = {
             "text": sentence.getText(),
             "from_scratch_tokens": self.sent_to_idxs(
                 sentence.getText(), self.vocab_dict
             ),
-            "bert_tokens": input_ids,
-            "mask": attention_mask,
             "element_names": entity_names,
             "element_locs": entity_locs,
             "entity_spans": entity_spans,
@@ -195,62 +589,72 @@ class BioInferDataset(Dataset):
 
         return sample
 
-    def bert_tokens(self, sentence):
-        tokenized = self.tokenizer.encode_plus(
-            text=sentence,  # the sentence to be encoded
+    def bert_tokens(self, texts):
+        """
+        tokenizes texts in one batched call of the tokenizer, which the fast
+        tokenizers run in parallel. returns the unpadded token ids and their
+        character offsets in the texts as flat arrays, and the start of the
+        tokens of every text in them (followed by the total length)
+        """
+        tokenized = self.tokenizer(
+            list(texts),
             add_special_tokens=True,  # Add [CLS] and [SEP]
             max_length=147,  # maximum length of a sentence
-            pad_to_max_length=True,  # Add [PAD]s
             truncation=True,
-            #     padding=True,
-            return_attention_mask=True,  # Generate the attention mask
-            #     return_tensors = 'pt',  # ask the function to return PyTorch tensors
+            return_attention_mask=False,  # the mask is made when batching
+            return_offsets_mapping=True,
         )
-        input_ids = torch.LongTensor([np.array(tokenized["input_ids"])])
-        attention_mask = torch.LongTensor([np.array(tokenized["attention_mask"])])
-        return input_ids, attention_mask
-
-    def create_vocab_dictionary(self, parser):
-        vocab = set()
-
-        for s in parser.bioinfer.sentences.sentences:
-            for token in s.tokens:
-                vocab.add(token.getText())
-
-        vocab_size = len(vocab)
-        vocab_index_list = [index for index in range(1, vocab_size)]
-
-        vocab_dict = dict(zip(vocab, vocab_index_list))
-        vocab_dict["UNK"] = 0
-        return vocab_dict
-
-    def get_entities(self, parser):
-        entities = set()
-        for s in parser.bioinfer.sentences.sentences:
-            for e in s.entities:
-                entity_type = e.type.name
-                if "RELATIONSHIP" not in entity_type:
-                    entities.add(f"{self.entity_prefix}{entity_type}")
-
-        return list(entities)
-
-    def get_predicates(self, parser):
-        predicates = [
-            f"{self.predicate_prefix}{p}"
-            for p in parser.bioinfer.ontologies["Relationship"].predicates.keys()
-        ]
+        lengths = [len(ids) for ids in tokenized["input_ids"]]
+        starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=starts[1:])
+        input_ids = np.fromiter(
+            chain.from_iterable(tokenized["input_ids"]), np.int64, starts[-1]
+        )
+        offsets = np.fromiter(
+            chain.from_iterable(chain.from_iterable(tokenized["offset_mapping"])),
+            np.int64,
+            2 * starts[-1],
+        ).reshape(-1, 2)
+        return input_ids, offsets, starts
+
+    def add_bert_tokens(self, samples):
+        """
+        adds the unpadded bert tokens of the texts of samples and their
+        character offsets, see bert_tokens(). collate_func pads them to the
+        longest sample in the batch. every sample gets copies of its slices
+        of the flat arrays: a tensor view pickles the whole buffer it views,
+        and the samples are pickled one by one (see load_prepared())
+        """
+        if not samples:
+            return samples
+        input_ids, offsets, starts = self.bert_tokens(s["text"] for s in samples)
+        for sample, start, stop in zip(samples, starts[:-1], starts[1:]):
+            sample["bert_tokens"] = torch.from_numpy(input_ids[start:stop].copy())
+            sample["bert_offsets"] = torch.from_numpy(offsets[start:stop].copy())
+        return samples
+
+    def entity_element(self, entity):
+        return int(lookup_elements(self.entity_type_elements, entity.typeId))
 
-        return list(set(predicates))
+    def predicate_element(self, relnode):
+        return int(lookup_elements(self.predicate_elements, relnode.predicateId))
+
+    def node_element(self, node):
+        if node.isPredicate():
+            return self.predicate_element(node)
+        elif node.isEntity():
+            return self.entity_element(node.entity)
+        else:
+            raise ValueError("node is neither predicate nor entity")
 
     def get_entities_from_sentence(self, sentence):
         entity_locs = {}
         entities = []
         i = 0
         for e in sentence.entities:
-            entity_type = e.type.name
-            if "RELATIONSHIP" not in entity_type:
+            if "RELATIONSHIP" not in e.type.name:
                 entity = (
-                    f"{ENTITY_PREFIX}{entity_type}",
+                    self.entity_element(e),
                     tuple([st.token.sequence for st in e.subTokens]),
                 )
                 entities.append(entity)
@@ -287,7 +691,7 @@ class BioInferDataset(Dataset):
     def entities_to_tensors(self, entities, entity_locs):
         if len(entities) > 0:
             entity_names = torch.tensor(
-                [torch.tensor(self.element_to_idx[e[0]]) for e in entities]
+                [torch.tensor(e[0]) for e in entities]
             )
             entity_names = entity_names.reshape(-1, 1)
             entity_spans = torch.stack(
@@ -306,16 +710,10 @@ class BioInferDataset(Dataset):
             return torch.tensor([]), torch.tensor([]), torch.tensor([])
 
     def get_relnode_argument_types(self, relnode) -> tuple:
-        arguments = set()
-        for a in relnode.arguments:
-            if a.isEntity():
-                arguments.add(f"{self.entity_prefix}{a.entity.type.name}")
-            elif a.isPredicate():
-                arguments.add(f"{self.predicate_prefix}{a.predicate.name}")
-            else:
-                raise ValueError
-
-        return tuple(sorted(list(arguments)))
+        """
+        returns the sorted element indices of the argument types of relnode
+        """
+        return tuple(sorted(set(self.node_element(a) for a in relnode.arguments)))
 
     def sent_to_idxs(self, sentence, vocab_dict):
         token_list = sentence.split()
@@ -328,63 +726,36 @@ class BioInferDataset(Dataset):
                 index_list.append(vocab_dict["UNK"])
         return torch.LongTensor(index_list)
 
-    def get_schema(self, parser, element_to_idx):
-        schema = {}
-        for s in parser.bioinfer.sentences.sentences:
-            for f in s.formulas:
-                if f.rootNode.isPredicate() and not f.rootNode.isEntity():
-                    predicate_name = f.rootNode.predicate.name
-                    key = f"{self.predicate_prefix}{predicate_name}"
-                    num_key = self.element_to_idx[key]
-                    if num_key not in schema.keys():
-                        schema[num_key] = Counter()
-                    arguments = self.get_relnode_argument_types(f.rootNode)
-                    try:
-                        arguments = tuple(
-                            sorted([self.element_to_idx[arg] for arg in arguments])
-                        )
-                    except:
-                        print(f.rootNode)
-                    schema[num_key][arguments] += 1
-                else:
-                    raise ValueError("formula rootNode should not be Entity")
-        return schema
-
     def invert_schema(self, schema):
-        inverted_schema = {}
-
-        for rel, argsets in schema.items():
-            for argset in argsets:
-                if argset not in inverted_schema.keys():
-                    inverted_schema[argset] = Counter()
-                inverted_schema[argset][rel] += 1
-
-        return inverted_schema
+        return invert_schema(schema)
 
     def construct_graph_pairs(self, node):
-        pairs = []
-        filler_prefix = "x.{}"
-        filler_idx = 1
-        if node.isPredicate():
-            node_type = f"{self.predicate_prefix}{node.predicate.name}"
-        elif node.isEntity():
-            node_type = f"{self.entity_prefix}{node.entity.type.name}"
-        else:
+        """
+        [parent entity id, argument entity id, parent element] for every
+        argument in the subtree of node, in preorder. a parent without a text
+        binding entity gets the filler id x.1
+        """
+        filler_id = "x.1"
+        if not (node.isPredicate() or node.isEntity()):
             raise ValueError("node is neither predicate nor entity")
 
-        if not node.entity:
-            node_entity_id = filler_prefix.format(filler_idx)
-            filler_idx += 1
-        else:
-            node_entity_id = node.entity.id
-
-        for arg in node.arguments:
-            pairs.append(
-                [node_entity_id, arg.entity.id, self.element_to_idx[node_type]]
-            )
-            pairs += self.construct_graph_pairs(arg)
-
-        return pairs
+        f = node.formula
+        start, stop = node.index + 1, f.subtreeStops[node.index]
+        entity_indices = np.array(f.entityIndices, dtype=np.int64)
+        if (entity_indices[start:stop] < 0).any():
+            raise ValueError("formula argument has no text binding entity")
+        entity_ids = [
+            f.sentence.entities[e].id if e >= 0 else filler_id for e in entity_indices
+        ]
+        parents = np.array(f.parents, dtype=np.int64)[start:stop]
+        # parents are relnodes, as entity nodes have no arguments
+        node_types = lookup_elements(
+            self.predicate_elements, np.array(f.predicateIds, dtype=np.int64)[parents]
+        )
+        return [
+            [entity_ids[p], entity_ids[i], int(t)]
+            for i, p, t in zip(range(start, stop), parents, node_types)
+        ]
 
     def pairs_to_graph(self, pairs):
         if len(pairs) > 0:
@@ -10,7 +10,14 @@ MAX_LAYERS = 2
 MAX_ENTITY_TOKENS = 5
 LEARNING_RATE = 0.01                #changed for BERT
 
+# a single pickled sample_list, only used by the notebooks
+# (BioInferDataset.samples_to_pickle / load_samples_from_pickle)
 PREPPED_DATA_PATH = "../data/prepped_dataset.pickle"
+# the stage cache of BioInferDataset.load_prepared, which train.py uses, and
+# the number of entries (configs) it keeps per stage. removing the directory
+# is always safe
+PREPPED_CACHE_DIR = "../data/prepped/"
+PREPPED_CACHE_KEEP = 2
 XML_PATH = "../data/BioInfer_corpus_1.1.1.xml"
 
 WORD_EMBEDDING_DIM = 256                        #changed for BERT
@@ -0,0 +1,214 @@
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.append("../lib/BioInfer_software_1.0.1_Python3/")
+from BIParallel import mapSentenceShards
+from BIParser import FastBIParser
+
+from config import (
+    ENTITY_PREFIX,
+    PREDICATE_PREFIX,
+    PREPPED_CACHE_DIR,
+    PREPPED_CACHE_KEEP,
+)
+from stagecache import StageCache, digest, file_digest
+
+# version of CorpusStats, cached stats of another version are collected again
+STATS_VERSION = 1
+
+# argument kinds of the formula signatures, paired with an ontology id
+ENTITY_ARGUMENT = 0
+PREDICATE_ARGUMENT = 1
+
+
+def lookup_elements(table, ids, allow_missing=False):
+    """
+    maps the ontology ids (Entity.typeId, RelNode.predicateId) of ids, an int
+    or an array, to element indices through table, one of the tables of
+    CorpusStats.build_tables(). the parser gives the id -1 to types and
+    predicates which are not in the ontology, and numpy would wrap it around
+    to the last element, so it raises KeyError instead. so does an id which is
+    no element, unless allow_missing, in which case it maps to -1
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if (ids < 0).any():
+        raise KeyError("type or predicate not in the ontology")
+    elements = table[ids]
+    if not allow_missing and (elements < 0).any():
+        raise KeyError(f"ontology ids {ids[elements < 0].tolist()} are no elements")
+    return elements
+
+
+def invert_schema(schema):
+    inverted_schema = {}
+
+    for rel, argsets in schema.items():
+        for argset in argsets:
+            if argset not in inverted_schema.keys():
+                inverted_schema[argset] = Counter()
+            inverted_schema[argset][rel] += 1
+
+    return inverted_schema
+
+
+class CorpusStats:
+    """
+    corpus-wide tables of BioInferDataset, collected in a single pass over
+    the sentences: the token vocabulary, the entity types, the predicates and
+    the counts of the argument types of the formula roots.
+
+    the raw statistics are kept in ontology ids, so that statistics of
+    separate shards of the corpus can be combined with merge(). build_tables()
+    then derives the element vocabulary, the schema and the inverse schema,
+    which do not depend on how the corpus was sharded.
+    """
+
+    def __init__(self):
+        self.num_sentences = 0
+        self.entity_type_names = []
+        self.predicate_names = []
+        self.vocab = set()
+        self.entity_types = set()
+        # predicate id -> Counter of argument signatures, in corpus order
+        self.root_signatures = {}
+
+    def add_sentence(self, sentence, ontologies):
+        if not self.entity_type_names:
+            self.entity_type_names = ontologies["Entity"].getPredicateNames()
+            self.predicate_names = ontologies["Relationship"].getPredicateNames()
+        self.num_sentences += 1
+
+        for token in sentence.tokens:
+            self.vocab.add(token.getText())
+
+        for e in sentence.entities:
+            if "RELATIONSHIP" not in e.type.name:
+                self.entity_types.add(e.typeId)
+
+        for f in sentence.formulas:
+            root = f.rootNode
+            if root.isPredicate() and not root.isEntity():
+                signatures = self.root_signatures.setdefault(
+                    root.predicateId, Counter()
+                )
+                signature = set()
+                for a in root.arguments:
+                    if a.isEntity():
+                        signature.add((ENTITY_ARGUMENT, a.entity.typeId))
+                    elif a.isPredicate():
+                        signature.add((PREDICATE_ARGUMENT, a.predicateId))
+                    else:
+                        raise ValueError
+                signatures[frozenset(signature)] += 1
+            else:
+                raise ValueError("formula rootNode should not be Entity")
+
+    def merge(self, other):
+        """
+        adds the statistics of other, which covers the sentences following
+        the ones of self
+        """
+        if not self.entity_type_names:
+            self.entity_type_names = other.entity_type_names
+            self.predicate_names = other.predicate_names
+        self.num_sentences += other.num_sentences
+        self.vocab |= other.vocab
+        self.entity_types |= other.entity_types
+        for predicate_id, signatures in other.root_signatures.items():
+            self.root_signatures.setdefault(predicate_id, Counter()).update(
+                signatures
+            )
+        return self
+
+    def build_tables(
+        self, entity_prefix=ENTITY_PREFIX, predicate_prefix=PREDICATE_PREFIX
+    ):
+        """
+        derives the vocabulary dictionary, the element vocabulary and the
+        schema from the statistics.
+        entity_type_elements and predicate_elements map the ontology ids of
+        Entity.typeId and RelNode.predicateId to element indices (-1 if the
+        id is not an element)
+        """
+        self.entity_prefix = entity_prefix
+        self.predicate_prefix = predicate_prefix
+        vocab = sorted(self.vocab)
+        self.vocab_dict = dict(zip(vocab, range(1, len(vocab))))
+        self.vocab_dict["UNK"] = 0
+
+        entity_ids = sorted(self.entity_types)
+        self.entity_type_elements = np.full(
+            len(self.entity_type_names), -1, dtype=np.int64
+        )
+        self.entity_type_elements[entity_ids] = np.arange(len(entity_ids))
+        self.predicate_elements = np.arange(
+            len(entity_ids), len(entity_ids) + len(self.predicate_names)
+        )
+        self.element_names = [
+            f"{self.entity_prefix}{self.entity_type_names[i]}" for i in entity_ids
+        ] + [f"{self.predicate_prefix}{p}" for p in self.predicate_names]
+        self.element_to_idx = {name: i for i, name in enumerate(self.element_names)}
+
+        self.schema = {}
+        tables = {
+            ENTITY_ARGUMENT: self.entity_type_elements,
+            PREDICATE_ARGUMENT: self.predicate_elements,
+        }
+        for predicate_id, signatures in self.root_signatures.items():
+            predicate = int(lookup_elements(self.predicate_elements, predicate_id))
+            counter = self.schema[predicate] = Counter()
+            for signature, count in signatures.items():
+                elements = [
+                    lookup_elements(tables[kind], i, allow_missing=True)
+                    for kind, i in signature
+                ]
+                if min(elements, default=0) < 0:
+                    # an argument type which is not an element
+                    continue
+                counter[tuple(sorted(int(e) for e in elements))] += count
+        self.inverse_schema = invert_schema(self.schema)
+        return self
+
+
+def collect_stats(sentences):
+    """
+    returns the CorpusStats of an iterator of (sentence, ontologies) pairs
+    """
+    stats = CorpusStats()
+    for sentence, ontologies in sentences:
+        stats.add_sentence(sentence, ontologies)
+    return stats
+
+
+def build_corpus_stats(xml_file, processes=None):
+    """
+    collects the CorpusStats of xml_file, parsing shards of the corpus in
+    processes worker processes (all CPUs by default, 1 parses in this process)
+    """
+    if processes == 1:
+        parser = FastBIParser()
+        stats = collect_stats(parser.iterparse(xml_file, dropSentences=True))
+    else:
+        stats = CorpusStats()
+        for shard_stats in mapSentenceShards(xml_file, collect_stats, processes):
+            stats.merge(shard_stats)
+    return stats.build_tables()
+
+
+def load_corpus_stats(
+    xml_file, cache_dir=PREPPED_CACHE_DIR, keep=PREPPED_CACHE_KEEP, processes=None
+):
+    """
+    returns the CorpusStats of xml_file, kept as the "stats" stage of the
+    StageCache in cache_dir (see BioInferDataset.load_prepared), keyed by the
+    digest of the file. they are built and saved first if there is no entry
+    for the current contents of xml_file
+    """
+    cache = StageCache(cache_dir, keep)
+    key = digest(file_digest(xml_file), STATS_VERSION)
+    stats = cache.load("stats", key)
+    if stats is None:
+        stats = cache.save("stats", key, build_corpus_stats(xml_file, processes))
+    return stats
@@ -0,0 +1,232 @@
+import argparse
+import copy
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.append("../py")
+sys.path.append("../lib/BioInfer_software_1.0.1_Python3/")
+
+from bioinferdataset import (
+    BioInferDataset,
+    GoldRelationIndex,
+    candidate_arrays,
+    pair_schema,
+    sample_payload,
+    schema_pairs,
+    sort_args,
+)
+from config import *
+
+
+def combination_pairs(element_names, inverse_schema):
+    """
+    the candidate pairs of process_sample before schema_pairs: every pair from
+    torch.combinations, looked up in inverse_schema. kept as the reference
+    """
+    pairs = []
+    for arg_indices in torch.combinations(torch.arange(len(element_names))):
+        i, j = arg_indices.tolist()
+        key = sort_args([element_names[i], element_names[j]])
+        if key in inverse_schema.keys():
+            pairs.append((i, j, list(inverse_schema[key].keys())))
+    return pairs
+
+
+def get_child_indices(g, node_idx):
+    return torch.stack(g.out_edges(node_idx))[1].tolist()
+
+
+class GoldRelationScan:
+    """
+    labels candidates by scanning all nodes of the gold relation graphs, as
+    process_sample did before GoldRelationIndex. kept as the reference, on
+    the relation graphs of the pre-prepped samples rather than on the
+    gold_relations() that GoldRelationIndex is built from
+    """
+
+    def __init__(self, graphs, node_idx_to_element_idxs):
+        self.graphs = graphs
+        self.element_idxs = node_idx_to_element_idxs
+
+    def match(self, predicate, arg_indices, element_idx):
+        L = 0
+        for i, graph in enumerate(self.graphs):
+            for n in graph.nodes():
+                n_predicate = graph.ndata["element_names"][n]
+                child_indices = [
+                    self.element_idxs[i][idx]
+                    for idx in get_child_indices(graph, node_idx=n)
+                ]
+                if tuple(child_indices) == arg_indices and predicate == n_predicate:
+                    self.element_idxs[i][n.item()] = element_idx
+                    L = 1
+        return L
+
+
+def scan_payload(sample):
+    """
+    the payload of candidate_arrays() for GoldRelationScan: the entity types,
+    the relation graphs and a copy of the element indices of their nodes,
+    which the scan updates
+    """
+    return (
+        sample["element_names"].flatten().tolist(),
+        (
+            sample["relation_graphs"],
+            copy.deepcopy(sample["node_idx_to_element_idxs"]),
+        ),
+    )
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_labelling(dataset, num_samples, repeat):
+    """
+    times candidate_arrays() on the num_samples pre-prepped samples with the
+    most entities, labelling the candidates with GoldRelationScan over the
+    relation graphs and with GoldRelationIndex over their gold_relations(),
+    and checks that both give the same labels
+    """
+    samples = sorted(
+        dataset.sample_list, key=lambda s: len(s["element_names"]), reverse=True
+    )[:num_samples]
+    partners = pair_schema(dataset.inverse_schema)
+    results = {}
+    for name, payload, gold_index_cls in (
+        ("scan", scan_payload, GoldRelationScan),
+        ("index", sample_payload, GoldRelationIndex),
+    ):
+        processed = []
+
+        def run():
+            processed[:] = [
+                candidate_arrays(payload(s), partners, gold_index_cls) for s in samples
+            ]
+
+        results[name] = (best_time(run, repeat), [arrays[3] for arrays in processed])
+
+    for a, b in zip(results["scan"][1], results["index"][1]):
+        if not np.array_equal(a, b):
+            raise AssertionError("GoldRelationIndex labels differ from the scan")
+    return samples, results
+
+
+def benchmark_pairs(dataset, samples, repeat):
+    """
+    times the candidate pairs of every layer of the processed samples with
+    combination_pairs and schema_pairs, and checks that both give the same
+    pairs. returns the seconds of both
+    """
+    layer_elements = []
+    for s in samples:
+        element_names = s["element_names"].tolist()
+        layers = s["L"].tolist()
+        for layer in range(MAX_LAYERS):
+            # the elements existing when the layer starts
+            layer_elements.append(element_names[: sum(l <= layer for l in layers)])
+
+    def scan():
+        return [combination_pairs(e, dataset.inverse_schema) for e in layer_elements]
+
+    def index():
+        partners = pair_schema(dataset.inverse_schema)
+        return [list(schema_pairs(e, partners)) for e in layer_elements]
+
+    if scan() != index():
+        raise AssertionError("schema_pairs differs from combination_pairs")
+    return best_time(scan, repeat), best_time(index, repeat)
+
+
+def layer_candidate_counts(entity_names, partners, incremental):
+    """
+    the number of candidates generated in each layer for a sentence with
+    entities of the types entity_names. the layers either pair all elements
+    again, as process_sample did before, or only pair elements with at least
+    one element of the previous layer
+    """
+    element_names = list(entity_names)
+    counts = []
+    layer_start = 0
+    for layer in range(MAX_LAYERS):
+        num_elements = len(element_names)
+        start = layer_start if incremental else 0
+        for i, j, predicates in schema_pairs(element_names[:], partners, start):
+            element_names.extend(predicates)
+        counts.append(len(element_names) - num_elements)
+        layer_start = num_elements
+    return counts
+
+
+def count_candidates(dataset):
+    """
+    the total number of candidates per layer over the pre-prepped samples,
+    before and after the layers were made incremental
+    """
+    partners = pair_schema(dataset.inverse_schema)
+    totals = {"all pairs": [0] * MAX_LAYERS, "incremental": [0] * MAX_LAYERS}
+    for s in dataset.sample_list:
+        entity_names = s["element_names"].flatten().tolist()
+        for name, incremental in (("all pairs", False), ("incremental", True)):
+            counts = layer_candidate_counts(entity_names, partners, incremental)
+            totals[name] = [t + c for t, c in zip(totals[name], counts)]
+    return totals
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description="benchmarks the candidate generation and labelling of process_sample"
+    )
+    parser.add_argument("--xml", default=XML_PATH, help="the BioInfer XML file")
+    parser.add_argument(
+        "--samples", type=int, default=20, help="number of largest sentences"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs")
+    parser.add_argument(
+        "--layers",
+        action="store_true",
+        help="count the candidates per layer with and without incremental layers",
+    )
+    parser.add_argument(
+        "--pairs",
+        action="store_true",
+        help="also time the candidate pairs of all samples, from the processed dataset",
+    )
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    dataset = BioInferDataset(args.xml)
+    dataset.pre_prep_data()
+    if args.layers:
+        print(f"candidates per layer of {len(dataset)} samples")
+        for name, counts in count_candidates(dataset).items():
+            print(f"  {name:<12} " + " ".join(f"{c:9d}" for c in counts))
+    samples, results = benchmark_labelling(dataset, args.samples, args.repeat)
+    print(
+        f"{len(samples)} samples with {len(samples[-1]['element_names'])}"
+        f" to {len(samples[0]['element_names'])} entities"
+    )
+    scan_time = results["scan"][0]
+    for name, (seconds, labels) in results.items():
+        print(f"  {name:<6} {seconds:8.3f}s  {scan_time / seconds:6.2f}x")
+    if args.pairs:
+        dataset.prep_data()
+        scan_time, index_time = benchmark_pairs(
+            dataset, dataset.sample_list, args.repeat
+        )
+        print(f"candidate pairs of {len(dataset)} samples")
+        print(f"  {'scan':<6} {scan_time:8.3f}s  {1.0:6.2f}x")
+        print(f"  {'schema':<6} {index_time:8.3f}s  {scan_time / index_time:6.2f}x")
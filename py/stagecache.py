@@ -0,0 +1,93 @@
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+
+
+def digest(*values):
+    """
+    sha1 hex digest of the repr of values, which should only hold builtin
+    types whose repr does not depend on the run (no sets)
+    """
+    return hashlib.sha1(repr(values).encode("utf-8")).hexdigest()
+
+
+def file_digest(file_name, block_size=1 << 20):
+    """
+    sha1 hex digest of the contents of file_name
+    """
+    sha1 = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class StageCache:
+    """
+    content-addressed cache of the stages of the prepared data. every entry
+    is a pickle file in cache_dir named after its stage and the digest of
+    everything the stage depends on (the input files, the config values and
+    the version of the code), so a stale entry is never found and only the
+    stages whose inputs changed are prepared again.
+
+    saving an entry keeps only the keep most recently used entries of its
+    stage, so switching back to a recent config costs nothing while the
+    entries of old configs are removed. removing cache_dir is always safe,
+    it only makes the next run prepare everything again
+    """
+
+    def __init__(self, cache_dir, keep=2):
+        self.cache_dir = cache_dir
+        self.keep = keep
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}-{key}.pickle")
+
+    def load(self, stage, key):
+        """
+        returns the entry of stage with key, or None if there is none
+        """
+        file_name = self.path(stage, key)
+        try:
+            with open(file_name, "rb") as f:
+                value = pickle.load(f)
+            # the modification time orders the entries for prune()
+            os.utime(file_name)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def save(self, stage, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # a unique temporary file, so concurrent runs do not write into each other's
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=f"{stage}-", suffix=".tmp", dir=self.cache_dir
+        )
+        try:
+            with os.fdopen(fd, "wb") as out:
+                pickle.dump(value, out, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.path(stage, key))
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        self.prune(stage)
+        return value
+
+    def prune(self, stage):
+        """
+        removes all but the keep most recently used entries of stage
+        """
+        entries = []
+        for file_name in glob.glob(os.path.join(self.cache_dir, f"{stage}-*.pickle")):
+            try:
+                entries.append((os.path.getmtime(file_name), file_name))
+            except FileNotFoundError:
+                pass
+        entries.sort(reverse=True)
+        for _, file_name in entries[self.keep :]:
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
@@ -1,10 +1,43 @@
+import io
+import os
+import pickle
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import dgl
+import numpy as np
 import pytest
 import torch
 
+sys.path.append("../lib/BioInfer_software_1.0.1_Python3/")
+from BIParallel import compileSnapshotParallel, parseParallel
+from BasicClasses import Link
+import BIIndex
+from BIColumns import exportColumns, loadColumns, saveColumns
+from BIParser import BIParser, FastBIParser
+import BISnapshot
+from BISnapshot import compileSnapshot, parseCached
+from CompactClasses import compactClasses
+from BIWriter import XMLWriter, writeXML
+
+import bioinferdataset
+from bioinferdataset import (
+    WORKER_STATE,
+    BioInferDataset,
+    GoldRelationIndex,
+    candidate_arrays,
+    gold_relations,
+    pair_schema,
+    schema_pairs,
+    sort_args,
+)
 from config import *
+from corpusstats import build_corpus_stats, load_corpus_stats, lookup_elements
 from daglstmcell import DAGLSTMCell
+from stagecache import StageCache
 from train import collate_func
-from INN import BERTEncoder
+from INN import BERTEncoder, collate_bert_tokens
+from transformers import BertTokenizerFast
 
 
 class TestINNModel:
@@ -254,6 +287,26 @@ class TestINNModel:
     def stored_forward_results(self):
         return torch.load('../data/unit_tests/bert_out.tensor')
 
+    @pytest.mark.parametrize(
+        "text, offsets, splits",
+        [
+            ("alpha beta", [(0, 5), (6, 8), (8, 10)], [1, 2]),
+            ("alpha beta ", [(0, 5), (6, 10)], [1, 1, 0]),
+            ("alpha  beta", [(0, 5), (7, 11)], [1, 0, 1]),
+        ],
+    )
+    def test_offset_splits(self, text, offsets, splits):
+        # the offsets of [CLS] and [SEP] are (0, 0)
+        offsets = torch.tensor([(0, 0)] + offsets + [(0, 0)])
+        assert BERTEncoder.offset_splits(text.split(" "), offsets) == splits
+
+    def test_bert_new_embedding_empty_word(self):
+        bert_encodings = torch.randn(1, 2, 768)
+        new_out = BERTEncoder.bert_new_embedding(bert_encodings, [1, 0, 1])
+        assert new_out.shape == (1, 3, 768)
+        assert torch.all(new_out[0, 1] == 0)
+        assert torch.all(new_out[0, 2] == bert_encodings[0, 1])
+
     def test_bert_parsing_integrated(self, seq_original, offset_mapping):
         bert_encodings = torch.randn(1, 28, 768)
         split = BERTEncoder.parse_bert(seq_original, offset_mapping)
@@ -264,9 +317,32 @@ class TestINNModel:
         )
 
     def test_bert_forward(self, bert_tokens, mask, text, stored_forward_results):
-        bert_enc = BERTEncoder(output_bert_hidden_states=False)
-        bert_outs, _ = bert_enc.forward(bert_tokens, mask, text)
-        assert (torch.all((bert_outs[0] - stored_forward_results) < 1e-5)) # not exact because results were saved to file
+        bert_enc = BERTEncoder(
+            output_bert_hidden_states=False, freeze_bert_epoch=FREEZE_BERT_EPOCH
+        )
+        # the unpadded tokens of the sample and their character offsets in the
+        # text, as BioInferDataset.bert_tokens() prepares them
+        tokenized = bert_enc.tokenizer(text, return_offsets_mapping=True)
+        tokens = torch.tensor(tokenized["input_ids"][0])
+        offsets = [torch.tensor(tokenized["offset_mapping"][0])]
+        # the batch of the fixtures, padded to 147 tokens
+        batch = collate_bert_tokens({}, [{"bert_tokens": tokens}])
+        length = batch["bert_tokens"].shape[1]
+        assert torch.equal(batch["bert_tokens"], bert_tokens[0, :, :length])
+        assert torch.equal(batch["mask"], mask[0, :, :length])
+        assert not torch.any(mask[0, :, length:])
+
+        bert_outs, token_splits = bert_enc.forward(
+            bert_tokens[0], mask[0], text, FREEZE_BERT_EPOCH, offsets
+        )
+        assert token_splits == [len(text[0].split(" "))]
+        # not exact because results were saved to file
+        assert torch.all(torch.abs(bert_outs[0] - stored_forward_results) < 1e-5)
+        # without offsets the words are split by tokenizing them again
+        bert_outs, _ = bert_enc.forward(
+            bert_tokens[0], mask[0], text, FREEZE_BERT_EPOCH
+        )
+        assert torch.all(torch.abs(bert_outs[0] - stored_forward_results) < 1e-5)
 
 
 
@@ -348,3 +424,817 @@ class TestINNModel:
 #                 len(sample_1["element_names"]) + len(sample_2["element_names"])
 #             )
 #         )
+
+
+BIOINFER_HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<bioinfer>
+<ontology type="Entity">
+<entitytype name="Entity">
+  <entitytype name="Protein"/>
+  <entitytype name="Gene"/>
+  <entitytype name="RELATIONSHIP_TEXTBINDING"/>
+</entitytype>
+</ontology>
+<ontology type="Relationship">
+<reltype name="Relationship">
+  <predicate name="BIND"/>
+  <predicate name="CONTAIN"/>
+</reltype>
+</ontology>
+<sentences>
+"""
+
+# "{a} binds {b}-{c} complex": the formulas BIND(a, b) and
+# CONTAIN(complex, BIND(b, c)), and a linkage which leaves "complex" unlinked
+BIOINFER_SENTENCE = """  <sentence id="{i}" origText="{a} binds {b}-{c} complex">
+    <token id="t.{i}.0" charOffset="0">
+      <subtoken id="st.{i}.0.0" text="{a}"/>
+    </token>
+    <token id="t.{i}.1" charOffset="{o1}">
+      <subtoken id="st.{i}.1.0" text="binds"/>
+    </token>
+    <token id="t.{i}.2" charOffset="{o2}">
+      <subtoken id="st.{i}.2.0" text="{b}"/>
+      <subtoken id="st.{i}.2.1" text="-"/>
+      <subtoken id="st.{i}.2.2" text="{c}"/>
+    </token>
+    <token id="t.{i}.3" charOffset="{o3}">
+      <subtoken id="st.{i}.3.0" text="complex"/>
+    </token>
+    <entity id="e.{i}.0" type="Protein" annotation="{a}">
+      <nestedsubtoken id="st.{i}.0.0"/>
+    </entity>
+    <entity id="e.{i}.1" type="RELATIONSHIP_TEXTBINDING">
+      <nestedsubtoken id="st.{i}.1.0"/>
+    </entity>
+    <entity id="e.{i}.2" type="Protein">
+      <nestedsubtoken id="st.{i}.2.0"/>
+    </entity>
+    <entity id="e.{i}.3" type="Protein">
+      <nestedsubtoken id="st.{i}.2.2"/>
+    </entity>
+    <entity id="e.{i}.4" type="Protein">
+      <nestedsubtoken id="st.{i}.2.0"/>
+      <nestedsubtoken id="st.{i}.2.1"/>
+      <nestedsubtoken id="st.{i}.2.2"/>
+      <nestedsubtoken id="st.{i}.3.0"/>
+    </entity>
+    <linkages>
+      <linkage type="raw">
+        <link token1="t.{i}.0" token2="t.{i}.1" category="" type="Ss"/>
+        <link token1="t.{i}.1" token2="t.{i}.2" category="" type="Os"/>
+      </linkage>
+    </linkages>
+    <formulas>
+      <formula>
+        <relnode predicate="BIND" entity="e.{i}.1">
+          <entitynode entity="e.{i}.0"/>
+          <entitynode entity="e.{i}.2"/>
+        </relnode>
+      </formula>
+      <formula>
+        <relnode predicate="CONTAIN">
+          <entitynode entity="e.{i}.4"/>
+          <relnode predicate="BIND" entity="e.{i}.1">
+            <entitynode entity="e.{i}.2"/>
+            <entitynode entity="e.{i}.3"/>
+          </relnode>
+        </relnode>
+      </formula>
+    </formulas>
+  </sentence>
+"""
+
+
+def corpus_sentence(i, a, b, c):
+    """
+    the BIOINFER_SENTENCE with the id i and the words a, b and c
+    """
+    o1 = len(a) + 1
+    o2 = o1 + len("binds ")
+    o3 = o2 + len(f"{b}-{c} ")
+    return BIOINFER_SENTENCE.format(i=i, a=a, b=b, c=c, o1=o1, o2=o2, o3=o3)
+
+
+def write_sentences(xml_file, sentences):
+    xml_file.write_text(
+        BIOINFER_HEADER + "".join(sentences) + "</sentences>\n</bioinfer>\n"
+    )
+    return str(xml_file)
+
+
+def write_corpus(xml_file, words):
+    """
+    writes a corpus of a BIOINFER_SENTENCE for each (a, b, c) triple of words
+    """
+    return write_sentences(
+        xml_file, [corpus_sentence(i, *abc) for i, abc in enumerate(words)]
+    )
+
+
+@pytest.fixture
+def corpus_file(tmp_path):
+    words = [
+        ("actin", "profilin", "myosin"),
+        ("myosin", "actin", "profilin"),
+        ("profilin", "myosin", "actin"),
+    ]
+    return write_corpus(tmp_path / "corpus.xml", words)
+
+
+@pytest.fixture
+def corpus(corpus_file):
+    parser = FastBIParser()
+    parser.parse(corpus_file)
+    return parser.bioinfer
+
+
+class TestBIParallel:
+    @pytest.fixture
+    def xml_file(self, tmp_path):
+        # "shard" is also the name of the element wrapping the shards of BIParallel
+        words = [("actin", "profilin", "shard"), ("shard", "actin", "myosin")] * 6
+        return write_corpus(tmp_path / "corpus.xml", words)
+
+    @staticmethod
+    def corpus_xml(parser):
+        out = io.StringIO()
+        writeXML(parser.bioinfer, out, includeOntologies=True)
+        return out.getvalue()
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_parse_parallel_equals_serial(self, xml_file, processes):
+        serial = BIParser()
+        serial.parse(xml_file)
+        parallel = parseParallel(xml_file, processes)
+        assert self.corpus_xml(parallel) == self.corpus_xml(serial)
+
+    def test_compile_snapshot_parallel_equals_serial(self, xml_file, tmp_path):
+        compileSnapshot(xml_file, str(tmp_path / "serial.snap"))
+        compileSnapshotParallel(xml_file, str(tmp_path / "parallel.snap"), 2)
+        serial = (tmp_path / "serial.snap").read_bytes()
+        assert (tmp_path / "parallel.snap").read_bytes() == serial
+
+
+class TestBISnapshot:
+    @pytest.fixture
+    def xml_file(self, tmp_path):
+        return write_corpus(tmp_path / "corpus.xml", [("actin", "profilin", "myosin")])
+
+    @pytest.fixture
+    def compiled(self, monkeypatch):
+        # the snapshots compiled by parseCached
+        compiled = []
+        compile_snapshot = BISnapshot.compileSnapshot
+
+        def compile_and_record(xml_file, snapshot_file):
+            compiled.append(snapshot_file)
+            compile_snapshot(xml_file, snapshot_file)
+
+        monkeypatch.setattr(BISnapshot, "compileSnapshot", compile_and_record)
+        return compiled
+
+    def test_parse_cached(self, xml_file, compiled):
+        parser = BIParser()
+        parser.parse(xml_file)
+        expected = TestBIParallel.corpus_xml(parser)
+        assert TestBIParallel.corpus_xml(parseCached(xml_file)) == expected
+        assert TestBIParallel.corpus_xml(parseCached(xml_file)) == expected
+        assert compiled == [xml_file + ".snap"]
+
+    def test_parse_cached_changed_size(self, xml_file, compiled):
+        parseCached(xml_file)
+        st = os.stat(xml_file)
+        with open(xml_file, "a") as f:
+            f.write("\n")
+        # the same modification time, e.g. restored by a copy
+        os.utime(xml_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+        parseCached(xml_file)
+        assert len(compiled) == 2
+
+    def test_parse_cached_format_version(self, xml_file, compiled, monkeypatch):
+        parseCached(xml_file)
+        monkeypatch.setattr(BISnapshot, "FORMAT_VERSION", BISnapshot.FORMAT_VERSION + 1)
+        parseCached(xml_file)
+        parseCached(xml_file)
+        assert len(compiled) == 2
+
+
+class TestLinkage:
+    @pytest.fixture
+    def linkage(self, corpus):
+        return corpus.sentences.sentences[0].linkages["raw"]
+
+    @staticmethod
+    def edges(adjacency):
+        offsets, neighbours, links = adjacency
+        return sorted(
+            (t, neighbours[k], links[k])
+            for t in range(len(offsets) - 1)
+            for k in range(offsets[t], offsets[t + 1])
+        )
+
+    def test_adjacency(self, linkage):
+        offsets, neighbours, links = linkage.getAdjacency()
+        assert len(offsets) == len(linkage.sentence.tokens) + 1
+        # every link in both directions
+        expected = []
+        for i, link in enumerate(linkage.links):
+            t1, t2 = link.token1.sequence, link.token2.sequence
+            expected += [(t1, t2, i), (t2, t1, i)]
+        assert self.edges((offsets, neighbours, links)) == sorted(expected)
+        assert linkage.getAdjacency() is linkage.getAdjacency()
+
+    def test_shortest_path(self, linkage):
+        assert linkage.shortestPath(0, 2) == [0, 1, 2]
+        assert linkage.shortestPath(2, 0) == [2, 1, 0]
+        assert linkage.shortestPath(1, 1) == [1]
+        # "complex" has no links
+        assert linkage.shortestPath(0, 3) is None
+
+    def test_add_link(self, linkage):
+        adjacency = linkage.getAdjacency()
+        attrs = {"token1": "t.0.2", "token2": "t.0.3", "category": "", "type": "Mp"}
+        link = Link([linkage], attrs)
+        assert linkage.links[-1] is link
+        assert list(linkage.token1s) == [0, 1, 2]
+        assert list(linkage.token2s) == [1, 2, 3]
+        assert linkage.getAdjacency() is not adjacency
+        assert (3, 2, 2) in self.edges(linkage.getAdjacency())
+        assert linkage.shortestPath(0, 3) == [0, 1, 2, 3]
+
+
+class TestSentences:
+    @staticmethod
+    def assert_id_maps(sentences):
+        # the id maps hold exactly the elements of the remaining sentences
+        tokens = [t for s in sentences.sentences for t in s.tokens]
+        subtokens = [st for t in tokens for st in t.subTokens]
+        entities = [e for s in sentences.sentences for e in s.entities]
+        for id_map, elements in [
+            (sentences.tokensById, tokens),
+            (sentences.subTokensById, subtokens),
+            (sentences.entitiesById, entities),
+        ]:
+            assert id_map == {e.id: e for e in elements}
+        assert sentences.sentenceIdxById == {
+            s.id: i for i, s in enumerate(sentences.sentences)
+        }
+        for s in sentences.sentences:
+            assert sentences.getSentence(s.id) is s
+
+    def test_remove_sentence(self, corpus):
+        sentences = corpus.sentences
+        self.assert_id_maps(sentences)
+        sentences.removeSentence(sentences.getSentence("1"))
+        assert [s.id for s in sentences.sentences] == ["0", "2"]
+        assert sentences.getSentence("1") is None
+        assert sentences.getSentenceIndex("2") == 1
+        self.assert_id_maps(sentences)
+        sentences.removeSentence(sentences.getSentence("2"))
+        self.assert_id_maps(sentences)
+
+    def test_iterparse_drop_sentences(self, corpus_file):
+        parser = FastBIParser()
+        ids = []
+        for sentence, _ in parser.iterparse(corpus_file, dropSentences=True):
+            sentences = parser.bioinfer.sentences
+            # the earlier sentences are gone, this one resolves
+            assert sentences.sentences[0] is sentence
+            assert all(sentences.getSentence(i) is None for i in ids)
+            self.assert_id_maps(sentences)
+            ids.append(sentence.id)
+        assert ids == ["0", "1", "2"]
+        assert parser.bioinfer.sentences.sentences == []
+        self.assert_id_maps(parser.bioinfer.sentences)
+
+    def test_reindex(self, corpus):
+        sentences = corpus.sentences
+        sentences.sentences[0].id = "renamed"
+        sentences.reindex()
+        assert sentences.getSentence("renamed") is sentences.sentences[0]
+        assert sentences.getSentence("0") is None
+        self.assert_id_maps(sentences)
+
+
+class TestOffsetTables:
+    @staticmethod
+    def expected_offsets(token):
+        # the offset of the token plus the lengths of the preceding subtokens
+        offset = int(token.charOffset)
+        offsets = []
+        for st in token.subTokens:
+            offsets.append(offset)
+            offset += len(st.text)
+        return offsets
+
+    @pytest.mark.parametrize("classes", [{}, compactClasses])
+    def test_offset_tables(self, corpus_file, classes):
+        parser = FastBIParser(**classes)
+        parser.parse(corpus_file)
+        for sentence in parser.bioinfer.sentences.sentences:
+            token_offsets, subtoken_offsets = sentence.getOffsetTables()
+            assert list(token_offsets) == [int(t.charOffset) for t in sentence.tokens]
+            for t in sentence.tokens:
+                offsets = [st.getCharOffset() for st in t.subTokens]
+                assert offsets == self.expected_offsets(t)
+                assert offsets == [subtoken_offsets[st.sequence] for st in t.subTokens]
+                for st, offset in zip(t.subTokens, offsets):
+                    assert sentence.origText[offset : offset + len(st.text)] == st.text
+
+    def test_invalidate_offsets(self, corpus):
+        sentence = corpus.sentences.sentences[0]
+        token = sentence.tokens[2]
+        tables = sentence.getOffsetTables()
+        assert sentence.getOffsetTables() is tables
+        token.subTokens[0].text += "s"
+        token.charOffset = str(int(token.charOffset) + 1)
+        sentence.invalidateOffsets()
+        assert sentence.getOffsetTables()[0][2] == int(token.charOffset)
+        offsets = [st.getCharOffset() for st in token.subTokens]
+        assert offsets == self.expected_offsets(token)
+
+
+class TestBIIndex:
+    @pytest.fixture
+    def xml_file(self, tmp_path):
+        # sentences with different predicates, entity types and formula depths
+        words = ("actin", "profilin", "myosin")
+        sentences = [corpus_sentence(i, *words) for i in range(5)]
+        # BIND(a, b) and BIND(complex, BIND(b, c))
+        sentences[1] = sentences[1].replace('"CONTAIN"', '"BIND"')
+        # BIND(a, b) and CONTAIN(complex, CONTAIN(b, c))
+        nested = sentences[2].index('"CONTAIN"')
+        sentences[2] = sentences[2][:nested] + sentences[2][nested:].replace(
+            '"BIND" entity', '"CONTAIN" entity'
+        )
+        # a is a gene
+        sentences[3] = sentences[3].replace('"Protein" annotation', '"Gene" annotation')
+        # only BIND(a, b)
+        start = sentences[4].index("      <formula>", sentences[4].index("</formula>"))
+        stop = sentences[4].index("    </formulas>")
+        sentences[4] = sentences[4][:start] + sentences[4][stop:]
+        return write_sentences(tmp_path / "corpus.xml", sentences)
+
+    @staticmethod
+    def brute_force(
+        sentences, predicate=None, arguments=(), entityTypes=(), depth=None
+    ):
+        def node_depth(node):
+            if node.isEntity():
+                return 0
+            return 1 + max(node_depth(a) for a in node.arguments)
+
+        def labels(node):
+            return [
+                a.entity.type.name if a.isEntity() else a.predicate.name
+                for a in node.arguments
+            ]
+
+        def matches(sentence):
+            nodes = [n for f in sentence.formulas for n in f.nodes if n.isPredicate()]
+            if predicate is not None and not any(
+                n.predicate.name == predicate
+                and all(labels(n).count(a) >= arguments.count(a) for a in arguments)
+                for n in nodes
+            ):
+                return False
+            types = set(e.type.name for e in sentence.entities)
+            if not set(entityTypes) <= types:
+                return False
+            depths = [node_depth(f.rootNode) for f in sentence.formulas]
+            return depth is None or depth in depths
+
+        return [i for i, s in enumerate(sentences) if matches(s)]
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            {},
+            {"predicate": "BIND"},
+            {"predicate": "CONTAIN"},
+            {"predicate": "BIND", "arguments": ("Protein", "Protein")},
+            {"predicate": "BIND", "arguments": ("Protein", "BIND")},
+            {"predicate": "BIND", "arguments": ("Gene",)},
+            {"predicate": "CONTAIN", "arguments": ("BIND",)},
+            {"predicate": "CONTAIN", "arguments": ("CONTAIN",)},
+            {"entityTypes": ("Gene",)},
+            {"entityTypes": ("Protein", "RELATIONSHIP_TEXTBINDING")},
+            {"depth": 1},
+            {"depth": 2},
+            {"predicate": "CONTAIN", "depth": 2},
+            {"predicate": "BIND", "entityTypes": ("Gene",), "depth": 2},
+        ],
+    )
+    def test_query(self, xml_file, query):
+        parser = FastBIParser()
+        parser.parse(xml_file)
+        expected = self.brute_force(parser.bioinfer.sentences.sentences, **query)
+        index = BIIndex.buildIndex(xml_file)
+        assert index.query(**query) == expected
+        found = [s.id for s, _ in index.iterSentences(xml_file, expected)]
+        assert found == [str(i) for i in expected]
+
+    def test_scan_index(self, xml_file):
+        scanned = BIIndex.scanIndex(xml_file)
+        built = BIIndex.buildIndex(xml_file)
+        assert scanned.sentenceIds == built.sentenceIds
+        assert scanned.sentenceRanges == built.sentenceRanges
+        assert scanned.headerEnd == built.headerEnd
+        xml = open(xml_file, "rb").read()
+        for i, (start, end) in zip(scanned.sentenceIds, scanned.sentenceRanges):
+            assert xml[start:end].startswith(f'<sentence id="{i}"'.encode())
+            assert xml[start:end].endswith(b"</sentence>")
+
+    def test_load_index(self, xml_file, tmp_path, monkeypatch):
+        built = []
+        build_index = BIIndex.buildIndex
+        monkeypatch.setattr(
+            BIIndex, "buildIndex", lambda f: built.append(f) or build_index(f)
+        )
+        index_file = str(tmp_path / "corpus.idx")
+        assert len(BIIndex.loadIndex(xml_file, index_file).sentenceIds) == 5
+        assert len(BIIndex.loadIndex(xml_file, index_file).sentenceIds) == 5
+        assert len(built) == 1
+        # the index is rebuilt when the corpus changes
+        write_corpus(tmp_path / "corpus.xml", [("actin", "profilin", "myosin")])
+        index = BIIndex.loadIndex(xml_file, index_file)
+        assert len(built) == 2
+        assert index.sentenceIds == ["0"]
+        assert index.query(depth=2) == [0]
+
+
+class TestBIColumns:
+    @pytest.fixture(params=[True, False], ids=["mmap", "read"])
+    def tables(self, request, corpus, tmp_path):
+        directory = str(tmp_path / "columns")
+        saveColumns(exportColumns(corpus), directory)
+        return loadColumns(directory, mmap=request.param)
+
+    def test_round_trip(self, corpus, tables):
+        exported = exportColumns(corpus)
+        assert sorted(tables) == sorted(exported)
+        for name, table in exported.items():
+            assert sorted(tables[name]) == sorted(table)
+            for column_name, column in table.items():
+                if isinstance(column, np.ndarray):
+                    assert np.array_equal(tables[name][column_name], column)
+                else:
+                    assert list(tables[name][column_name]) == list(column)
+
+    def test_subtokens(self, corpus, tables):
+        subtokens = tables["subtokens"]
+        sentences = corpus.sentences.sentences
+        objects = [st for s in sentences for t in s.tokens for st in t.subTokens]
+        assert list(subtokens["id"]) == [st.id for st in objects]
+        offsets = [st.getCharOffset() for st in objects]
+        assert subtokens["charOffset"].tolist() == offsets
+        for row, st in enumerate(objects):
+            offset = subtokens["charOffset"][row]
+            text = tables["sentences"]["origText"][subtokens["sentence"][row]]
+            assert text[offset : offset + len(st.text)] == subtokens["text"][row]
+
+    def test_entities(self, corpus, tables):
+        entities, members = tables["entities"], tables["entitySubtokens"]
+        objects = [e for s in corpus.sentences.sentences for e in s.entities]
+        assert list(entities["id"]) == [e.id for e in objects]
+        for row, e in enumerate(objects):
+            start, stop = entities["subtokenStart"][row], entities["subtokenStop"][row]
+            assert members["entity"][start:stop].tolist() == [row] * (stop - start)
+            rows = members["subtoken"][start:stop]
+            subtoken_ids = [tables["subtokens"]["id"][k] for k in rows]
+            assert subtoken_ids == [st.id for st in e.subTokens]
+            assert tables["entityTypes"]["name"][entities["type"][row]] == e.type.name
+
+    @staticmethod
+    def preorder(node, rows, parent=-1, position=-1, depth=0):
+        # appends the (node, parent row, position, depth) rows of the subtree of node
+        index = len(rows)
+        rows.append((node, parent, position, depth))
+        for i, a in enumerate(node.arguments if node.isPredicate() else []):
+            TestBIColumns.preorder(a, rows, index, i, depth + 1)
+        return rows
+
+    def test_formula_nodes(self, corpus, tables):
+        nodes, entity_ids = tables["formulaNodes"], tables["entities"]["id"]
+        formulas = [f for s in corpus.sentences.sentences for f in s.formulas]
+        roots = tables["formulas"]["rootNode"].tolist() + [len(nodes["formula"])]
+        assert len(roots) == len(formulas) + 1
+        for row, f in enumerate(formulas):
+            start, stop = roots[row], roots[row + 1]
+            expected = self.preorder(f.rootNode, [])
+            assert stop - start == len(expected)
+            assert nodes["formula"][start:stop].tolist() == [row] * len(expected)
+            for k, (node, parent, position, depth) in zip(range(start, stop), expected):
+                assert nodes["parent"][k] == (start + parent if parent >= 0 else -1)
+                assert nodes["position"][k] == position
+                assert nodes["depth"][k] == depth
+                if node.isPredicate():
+                    name = tables["predicates"]["name"][nodes["predicate"][k]]
+                    assert name == node.predicate.name
+                else:
+                    assert nodes["predicate"][k] == -1
+                if node.entity is None:
+                    assert nodes["entity"][k] == -1
+                else:
+                    assert entity_ids[nodes["entity"][k]] == node.entity.id
+
+
+class TestBIWriter:
+    @pytest.fixture(params=[{}, compactClasses], ids=["basic", "compact"])
+    def parser(self, request, corpus_file):
+        parser = FastBIParser(**request.param)
+        parser.parse(corpus_file)
+        return parser
+
+    def test_write_xml(self, parser):
+        expected = io.StringIO()
+        parser.bioinfer.writeXML(expected, 0, includeOntologies=True)
+        out = io.StringIO()
+        writeXML(parser.bioinfer, out, includeOntologies=True)
+        assert out.getvalue() == expected.getvalue()
+        # flushed after every piece of output, and kept in the buffer
+        out = io.StringIO()
+        writeXML(parser.bioinfer, out, chunkSize=1, includeOntologies=True)
+        assert out.getvalue() == expected.getvalue()
+        writer = XMLWriter()
+        writer.writeObject(parser.bioinfer, 0, includeOntologies=True)
+        assert writer.getvalue() == expected.getvalue()
+
+    def test_write_sentence(self, parser):
+        for sentence in parser.bioinfer.sentences.sentences:
+            expected = io.StringIO()
+            sentence.writeXML(expected, 2)
+            out = io.StringIO()
+            writeXML(sentence, out, 2)
+            assert out.getvalue() == expected.getvalue()
+
+    def test_round_trip(self, parser, tmp_path):
+        out = io.StringIO()
+        writeXML(parser.bioinfer, out, includeOntologies=True)
+        xml_file = tmp_path / "written.xml"
+        xml_file.write_text(out.getvalue())
+        reparsed = FastBIParser()
+        reparsed.parse(str(xml_file))
+        written = io.StringIO()
+        writeXML(reparsed.bioinfer, written, includeOntologies=True)
+        assert written.getvalue() == out.getvalue()
+
+
+class TestCandidates:
+    # entity types 0 and 1, predicate 2 over (0, 1) or (0, 0) and predicate 3
+    # over (1, 2); the single argument key is not a pair
+    @pytest.fixture
+    def inverse_schema(self):
+        return {(0, 1): {2: 1}, (0, 0): {2: 1}, (1, 2): {3: 1}, (3,): {2: 1}}
+
+    @pytest.fixture
+    def gold(self):
+        # 3(e1, 2(e0, e1)): node 0 is predicate 3, node 1 predicate 2, and
+        # nodes 2 and 3 the entities 0 and 1. the edges of node 0 list e1 first
+        g = dgl.graph(([1, 1, 0, 0], [2, 3, 3, 1]))
+        g.ndata["element_names"] = torch.tensor([3, 2, -1, -1])
+        return gold_relations([g], [{0: -2, 1: -2, 2: 0, 3: 1}])
+
+    def test_gold_relations(self, gold):
+        predicates, children, element_idxs = gold
+        assert predicates == [3, 2, -1, -1]
+        assert children == [[3, 1], [2, 3], [], []]
+        assert element_idxs == [-2, -2, 0, 1]
+
+    def test_gold_relation_index_match(self, gold):
+        index = GoldRelationIndex(*gold)
+        assert index.match(3, (1, 5), 5) == 0  # node 1 has no element yet
+        assert index.match(2, (1, 0), 5) == 0  # the children are in edge order
+        assert index.match(3, (0, 1), 5) == 0  # wrong predicate
+        assert index.match(2, (0, 1), 5) == 1
+        # node 0 is re-hashed with the element index of node 1
+        assert index.match(3, (1, 4), 6) == 0
+        assert index.match(3, (1, 5), 6) == 1
+        assert index.element_idxs == [6, 5, 0, 1]
+
+    @pytest.mark.parametrize(
+        "element_names",
+        [[], [0], [0, 1], [1, 0, 0, 2, 1], [2, 2, 1, 0, 3, 1, 0, 2], [3, 3, 3]],
+    )
+    @pytest.mark.parametrize("start", [0, 2, 4])
+    def test_schema_pairs_match_combinations(
+        self, inverse_schema, element_names, start
+    ):
+        expected = []
+        for i, j in torch.combinations(torch.arange(len(element_names))).tolist():
+            key = sort_args([element_names[i], element_names[j]])
+            if j >= start and key in inverse_schema:
+                expected.append((i, j, list(inverse_schema[key])))
+        partners = pair_schema(inverse_schema)
+        assert list(schema_pairs(element_names, partners, start)) == expected
+
+    def test_candidate_arrays(self, monkeypatch, inverse_schema, gold):
+        monkeypatch.setattr(bioinferdataset, "MAX_LAYERS", 2)
+        S, element_names, L, labels = candidate_arrays(
+            ([0, 1, 0], gold), pair_schema(inverse_schema)
+        )
+        # layer 2 only pairs elements with one of layer 1
+        assert S.tolist() == [
+            [0, -1],
+            [1, -1],
+            [2, -1],
+            [0, 1],
+            [0, 2],
+            [1, 2],
+            [1, 3],
+            [1, 4],
+            [1, 5],
+        ]
+        assert element_names.tolist() == [0, 1, 0, 2, 2, 2, 3, 3, 3]
+        assert L.tolist() == [0, 0, 0, 1, 1, 1, 2, 2, 2]
+        assert labels.tolist() == [1, 1, 1, 1, 0, 0, 1, 0, 0]
+        assert all(a.dtype == np.int64 for a in (S, element_names, L, labels))
+
+
+class TestCorpusStats:
+    def test_lookup_elements(self):
+        table = np.array([-1, 0, 1])
+        assert lookup_elements(table, 2) == 1
+        assert lookup_elements(table, [2, 1]).tolist() == [1, 0]
+        assert lookup_elements(table, [0, 2], allow_missing=True).tolist() == [-1, 1]
+        # -1 is not in the ontology and must not wrap around to the last element
+        for ids in (-1, [2, -1]):
+            with pytest.raises(KeyError):
+                lookup_elements(table, ids)
+        with pytest.raises(KeyError):
+            lookup_elements(table, [1, 0])
+
+    def test_build_tables(self, tmp_path):
+        xml_file = tmp_path / "corpus.xml"
+        write_corpus(xml_file, [("actin", "profilin", "myosin")])
+        stats = build_corpus_stats(str(xml_file), processes=1)
+        assert stats.element_names == [
+            f"{ENTITY_PREFIX}Protein",
+            f"{PREDICATE_PREFIX}BIND",
+            f"{PREDICATE_PREFIX}CONTAIN",
+        ]
+        # the arguments of BIND are both proteins
+        assert stats.schema == {1: {(0,): 1}, 2: {(0, 1): 1}}
+
+    def test_load_corpus_stats(self, tmp_path):
+        xml_file = tmp_path / "corpus.xml"
+        cache_dir = str(tmp_path / "cache")
+        write_corpus(xml_file, [("actin", "profilin", "myosin")])
+        stats = load_corpus_stats(str(xml_file), cache_dir)
+        assert load_corpus_stats(str(xml_file), cache_dir).vocab == stats.vocab
+        assert len(os.listdir(cache_dir)) == 1
+        # the stats are keyed by the contents of the file
+        write_corpus(xml_file, [("tropomyosin", "profilin", "myosin")])
+        assert "tropomyosin" in load_corpus_stats(str(xml_file), cache_dir).vocab
+        assert len(os.listdir(cache_dir)) == 2
+
+    def test_build_tables_unknown_predicate(self, tmp_path):
+        xml_file = tmp_path / "corpus.xml"
+        write_corpus(xml_file, [("actin", "profilin", "myosin")])
+        xml_file.write_text(
+            xml_file.read_text().replace('predicate="CONTAIN"', 'predicate="FOO"')
+        )
+        # FOO must not be counted as the last predicate
+        with pytest.raises(KeyError):
+            build_corpus_stats(str(xml_file), processes=1)
+
+
+class TestBioInferDataset:
+    @pytest.fixture
+    def xml_file(self, tmp_path):
+        words = [("actin", "profilin", "myosin")]
+        return write_corpus(tmp_path / "corpus.xml", words)
+
+    @pytest.fixture
+    def dataset(self, xml_file):
+        # the tables of the corpus, without the tokenizer of __init__
+        stats = build_corpus_stats(xml_file, processes=1)
+        state = {key: getattr(stats, key) for key in WORKER_STATE[1:]}
+        return BioInferDataset.from_worker_state(dict(state, xml_file=xml_file))
+
+    @staticmethod
+    def formulas(xml_file):
+        parser = FastBIParser()
+        parser.parse(xml_file)
+        return parser.bioinfer.sentences.sentences[0].formulas
+
+    def test_construct_graph_pairs(self, dataset, xml_file):
+        root = self.formulas(xml_file)[0].rootNode
+        assert dataset.construct_graph_pairs(root) == [
+            ["e.0.1", "e.0.0", 1],
+            ["e.0.1", "e.0.2", 1],
+        ]
+
+    def test_construct_graph_pairs_unknown_predicate(self, dataset, tmp_path):
+        xml_file = tmp_path / "unknown.xml"
+        write_corpus(xml_file, [("actin", "profilin", "myosin")])
+        xml_file.write_text(
+            xml_file.read_text().replace('"BIND" entity', '"FOO" entity')
+        )
+        root = self.formulas(str(xml_file))[0].rootNode
+        # FOO must not be taken for the last predicate
+        with pytest.raises(KeyError):
+            dataset.construct_graph_pairs(root)
+
+    @pytest.fixture
+    def tokenizer(self, tmp_path):
+        # a vocabulary of the corpus, as scibert cannot be downloaded in the tests
+        special = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+        words = ["actin", "profilin", "myosin", "binds", "-", "complex"]
+        vocab_file = tmp_path / "vocab.txt"
+        vocab_file.write_text("\n".join(special + words))
+        return BertTokenizerFast(str(vocab_file))
+
+    def test_load_prepared(self, monkeypatch, dataset, tokenizer, tmp_path):
+        cache_dir = str(tmp_path / "cache")
+        dataset.tokenizer = tokenizer
+        assert dataset.load_prepared(cache_dir) == ["corpus", "features", "candidates"]
+        prepared = dataset.sample_list
+        assert dataset.load_prepared(cache_dir) == []
+        assert len(dataset.sample_list) == len(prepared) == 1
+        for key in ("bert_tokens", "element_names", "S", "labels"):
+            assert np.array_equal(dataset.sample_list[0][key], prepared[0][key])
+        # the candidates depend on MAX_LAYERS, the corpus and features do not
+        monkeypatch.setattr(bioinferdataset, "MAX_LAYERS", 1)
+        assert dataset.load_prepared(cache_dir) == ["candidates"]
+        assert dataset.load_prepared(cache_dir) == []
+
+    def test_load_prepared_changed_sentence(
+        self, capsys, dataset, tokenizer, tmp_path
+    ):
+        cache_dir = str(tmp_path / "cache")
+        dataset.tokenizer = tokenizer
+        words = [("actin", "profilin", "myosin"), ("myosin", "actin", "profilin")]
+        write_corpus(tmp_path / "corpus.xml", words)
+        dataset.load_prepared(cache_dir)
+        write_corpus(tmp_path / "corpus.xml", [words[0], ("actin", "actin", "actin")])
+        capsys.readouterr()
+        assert dataset.load_prepared(cache_dir) == ["corpus", "features", "candidates"]
+        assert "reusing the features of 1 of 2" in capsys.readouterr().out
+        assert len(dataset.sample_list) == 2
+
+    def test_sentence_hashes(self, dataset, tmp_path):
+        words = [("actin", "profilin", "myosin")] * 3
+        write_corpus(tmp_path / "corpus.xml", words)
+        _, hashes = dataset.sentence_hashes()
+        assert len(set(hashes)) == 3
+        words[1] = ("actin", "myosin", "profilin")
+        write_corpus(tmp_path / "corpus.xml", words)
+        index, changed = dataset.sentence_hashes()
+        assert index.sentenceIds == ["0", "1", "2"]
+        assert [a == b for a, b in zip(hashes, changed)] == [True, False, True]
+
+    def test_load_prepared_keep(self, dataset, tokenizer, tmp_path):
+        cache_dir = tmp_path / "cache"
+        dataset.tokenizer = tokenizer
+        for c in ["myosin", "profilin", "actin"]:
+            write_corpus(tmp_path / "corpus.xml", [("actin", "profilin", c)])
+            dataset.load_prepared(str(cache_dir))
+        # an entry per corpus file, while the features and candidates of all
+        # of them share the entry of their config and only keep the current
+        # sentences
+        assert len(list(cache_dir.glob("corpus-*.pickle"))) == PREPPED_CACHE_KEEP
+        for stage in ("features", "candidates"):
+            (entry,) = cache_dir.glob(f"{stage}-*.pickle")
+            assert len(pickle.loads(entry.read_bytes())) == 1
+
+
+class TestStageCache:
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return StageCache(str(tmp_path / "cache"), PREPPED_CACHE_KEEP)
+
+    def test_load_save(self, cache):
+        assert cache.load("stage", "a") is None
+        assert cache.save("stage", "a", [1, 2]) == [1, 2]
+        assert cache.load("stage", "a") == [1, 2]
+        assert cache.load("stage", "b") is None
+        assert cache.load("other", "a") is None
+
+    def test_prune(self, cache):
+        # entries of increasing age, saved without pruning
+        unpruned = StageCache(cache.cache_dir, keep=10)
+        for i, key in enumerate("abcd"):
+            unpruned.save("stage", key, i)
+            os.utime(cache.path("stage", key), (i, i))
+        unpruned.save("other", "a", 0)
+        # a load makes a the most recently used entry
+        assert cache.load("stage", "a") == 0
+        cache.prune("stage")
+        kept = [key for key in "abcd" if os.path.exists(cache.path("stage", key))]
+        assert kept == sorted(["a"] + ["d", "c", "b"][: cache.keep - 1])
+        assert cache.load("other", "a") == 0
+
+    def test_concurrent_save(self, cache):
+        values = {key: list(range(10000)) for key in "ab"}
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda k: cache.save("stage", k, values[k]), "ab" * 8))
+        assert cache.load("stage", "a") == cache.load("stage", "b") == values["a"]
+        assert not [f for f in os.listdir(cache.cache_dir) if f.endswith(".tmp")]
+
+    def test_failed_save(self, cache):
+        with pytest.raises(Exception):
+            cache.save("stage", "a", lambda: None)
+        assert cache.load("stage", "a") is None
+        assert os.listdir(cache.cache_dir) == []
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import os
 import sys
 import argparse
 
@@ -36,11 +35,10 @@ def set_device():
 
 def load_dataset():
     dataset = BioInferDataset(XML_PATH)
-    if os.path.isfile(PREPPED_DATA_PATH):
-        dataset.load_samples_from_pickle(PREPPED_DATA_PATH)
-    else:
-        dataset.prep_data()
-        dataset.samples_to_pickle(PREPPED_DATA_PATH)
+    # only the stages whose inputs changed are prepared again
+    prepared = dataset.load_prepared(PREPPED_CACHE_DIR)
+    if prepared:
+        print(f"prepared stages: {', '.join(prepared)}")
     return dataset
 
 